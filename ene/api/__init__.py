@@ -16,5 +16,7 @@
 
 # pylint: skip-file
 from .anilist import API
+from .async_anilist import AsyncAPI
 from .auth import OAuth
+from .ratelimit import Priority
 from .enums import *
@@ -15,22 +15,101 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """This module contains anilist API class."""
-from typing import Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import Executor
+from functools import lru_cache
+from pathlib import Path
+from threading import Event
+from time import sleep
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 import attr
 from option import Err, Ok, Result
-from requests import HTTPError, Session
+from requests import HTTPError, Response, Session
 
+from ene.cache import DiskCache
 from ene.constants import CLIENT_ID, GRAPHQL_URL
 from ene.util import dict_filter
 from .auth import OAuth
+from .cache import DEFAULT_MAX_BYTES, ResponseCache, is_mutation
 from .enums import MediaFormat, MediaListStatus, MediaSeason, MediaSort, MediaStatus
+from .fields import ALL_FIELDS, media_selection
 from .media import Media
+from .ratelimit import RETRY_STATUSES, Priority, RateLimiter, backoff
+from .stream import MediaStream
 from .types_ import FuzzyDate
 
 HTTP_ERROR = Tuple[int, str]
 API_RES = Result[Dict, HTTP_ERROR]
 
+CANCELLED: HTTP_ERROR = (499, 'Request cancelled')
+
+SHOWS_BATCH_SIZE = 25
+SHOW_FIELDS = ('cover_image',)
+
+BROWSE_QUERY = """\
+query (
+$page: Int = 1,
+$isAdult: Boolean = false,
+$search: String,
+$format: MediaFormat
+$status: MediaStatus,
+$season: MediaSeason,
+$year: String,
+$onList: Boolean,
+$yearLesser: FuzzyDateInt,
+$yearGreater: FuzzyDateInt,
+$licensedBy: [String],
+$includedGenres: [String],
+$excludedGenres: [String],
+$includedTags: [String],
+$excludedTags: [String],
+$sort: [MediaSort] = [SCORE_DESC, POPULARITY_DESC],
+$perPage: Int,
+) {
+    Page (page: $page, perPage: $perPage) {
+        pageInfo {
+            total
+            perPage
+            currentPage
+            lastPage
+            hasNextPage
+        }
+        media (
+            type: ANIME,
+            season: $season,
+            format: $format,
+            status: $status,
+            search: $search,
+            onList: $onList,
+            startDate_like: $year,
+            startDate_lesser: $yearLesser,
+            startDate_greater: $yearGreater,
+            licensedBy_in: $licensedBy,
+            genre_in: $includedGenres,
+            genre_not_in: $excludedGenres,
+            tag_in: $includedTags,
+            tag_not_in: $excludedTags,
+            sort: $sort,
+            isAdult: $isAdult
+        ) {
+%s
+        }
+    }
+}"""
+
+MEDIA_LIST_ENTRY_TYPES = {
+    'mediaId': 'Int',
+    'status': 'MediaListStatus',
+    'score': 'Float',
+    'progress': 'Int',
+    'customLists': '[String]',
+    'private': 'Boolean',
+    'notes': 'String',
+    'startedAt': 'FuzzyDateInput',
+    'completedAt': 'FuzzyDateInput',
+    'repeat': 'Int',
+}
+
 
 @attr.s(slots=True)
 class API:
@@ -39,33 +118,79 @@ class API:
     """
     data_home = attr.ib()
     cache_home = attr.ib()
+    cache_ttls = attr.ib(factory=dict)
+    cache_size = attr.ib(default=DEFAULT_MAX_BYTES)
+    max_retries = attr.ib(default=3)
     session = attr.ib(factory=Session, init=False)
+    limiter = attr.ib(factory=RateLimiter, init=False)
     token = attr.ib(init=False)
+    cache = attr.ib(init=False)
 
     def __attrs_post_init__(self):
         self.token = OAuth.get_token(self.data_home, CLIENT_ID, '127.0.0.1', 50000)
+        self.cache = ResponseCache(
+            DiskCache(Path(self.cache_home, 'api'), self.cache_size),
+            self.cache_ttls,
+            user=self.token
+        )
         self.session.headers.update({
             'Authorization': f'Bearer {self.token}',
             'Content-Type': 'application/json',
             'Accept': 'application/json'
         })
 
-    def query(self, query: str, variables: Optional[dict] = None) -> API_RES:
+    def query(
+            self,
+            query: str,
+            variables: Optional[dict] = None,
+            kind: Optional[str] = None,
+            priority: Priority = Priority.INTERACTIVE,
+            cancel: Optional[Event] = None
+    ) -> API_RES:
         """
         Makes HTTP request to the Anilist API
 
+        Responses to queries with a cacheable kind are served from the
+        response cache while fresh. Stale entries are revalidated with the
+        server when it sent an entity tag for them. A successful mutation
+        drops the cached responses that depend on the user's data.
+
+        Requests are paced by the rate limiter, rate limited and server
+        error responses are retried with backoff.
+
         Args:
             query: The GraphQL query to POST to the API
             variables: variables for the query, can be None
+            kind: The query kind used to pick the cache time to live,
+                None to bypass the cache
+            priority: The rate limiter priority of the request
+            cancel: Event that abandons the request when set, a response
+                arriving after cancellation is dropped
 
         Returns:
-            The API response or error
+            The API response or error, `CANCELLED` if it was cancelled
         """
         post_json = {'query': query}
         if variables:
             post_json['variables'] = variables
 
-        res = self.session.post(GRAPHQL_URL, json=post_json)
+        cacheable = self.cache.ttl(kind) > 0 and not is_mutation(query)
+        key = entry = None
+        headers = {}
+        if cacheable:
+            key = self.cache.make_key(query, variables, kind)
+            entry = self.cache.get(key)
+            if entry and entry.fresh:
+                return Ok(entry.data)
+            if entry and entry.etag:
+                headers['If-None-Match'] = entry.etag
+
+        res = self._post(post_json, headers, priority, cancel)
+        if res is None or (cancel and cancel.is_set()):
+            return Err(CANCELLED)
+        if res.status_code == 304 and entry:
+            self.cache.put(key, kind, entry.data, entry.etag)
+            return Ok(entry.data)
         try:
             json_ = res.json()
         except ValueError:
@@ -76,13 +201,55 @@ class API:
             errors = (json_ or {}).get('errors', [])
             msg = f'{errors}\n{http_ex}' if errors else str(http_ex)
             return Err((res.status_code, msg))
+        if is_mutation(query):
+            # Even a partly failed mutation may have changed the user's data
+            self.cache.invalidate()
+        if cacheable and json_ and not json_.get('errors'):
+            self.cache.put(key, kind, json_, res.headers.get('ETag'))
         return Ok(json_)
 
+    def _post(
+            self,
+            post_json: dict,
+            headers: dict,
+            priority: Priority,
+            cancel: Optional[Event] = None
+    ) -> Optional[Response]:
+        """
+        POST to the API, retrying rate limited and server error responses
+
+        Args:
+            post_json: The request body
+            headers: Extra request headers
+            priority: The rate limiter priority of the request
+            cancel: Event that abandons the request when set
+
+        Returns:
+            The last response received, None if cancelled before one was received
+        """
+        attempt = 0
+        while True:
+            if not self.limiter.acquire(priority, cancel):
+                return None
+            res = self.session.post(GRAPHQL_URL, json=post_json, headers=headers)
+            self.limiter.update(res.headers)
+            if res.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return res
+            if 'Retry-After' not in res.headers:
+                # The limiter already waits out Retry-After
+                delay = backoff(attempt)
+                if cancel:
+                    cancel.wait(delay)
+                else:
+                    sleep(delay)
+            attempt += 1
+
     def query_pages(
             self,
             query: str,
             per_page: int,
-            variables: Optional[dict] = None
+            variables: Optional[dict] = None,
+            priority: Priority = Priority.BACKGROUND
     ) -> Iterable[API_RES]:
         """
         Make paged requests to the Anilist API
@@ -91,6 +258,7 @@ class API:
             query: The GraphQL query to POST to the API
             per_page: Number of items per page
             variables: variables for the query, can be None
+            priority: The rate limiter priority of the requests
 
         Yields:
             Each page of the API response
@@ -103,7 +271,7 @@ class API:
         variables['perPage'] = per_page
 
         while True:
-            res = self.query(query, variables)
+            res = self.query(query, variables, priority=priority)
             has_next = res.ok().map_or(
                 lambda val: val['data']['Page']['pageInfo']['hasNextPage'],
                 False
@@ -129,7 +297,9 @@ class API:
             excluded_genres: List[str] = None,
             included_tags: List[str] = None,
             excluded_tags: List[str] = None,
-            sort: List[MediaSort] = None
+            sort: List[MediaSort] = None,
+            fields: Optional[Iterable[str]] = None,
+            cancel: Optional[Event] = None
     ) -> Result[Tuple[Iterable[Media], bool], HTTP_ERROR]:
 
         """
@@ -150,120 +320,13 @@ class API:
             included_tags: Filter by the media's tags
             excluded_tags: Filter by the media's tags
             sort: The order the results will be returned in
+            fields: The `Media` properties to fetch, None for all of them
+            cancel: Event that abandons the request when set
 
         Returns:
             The page anime returned and if there's a next page
         """
-        query = """\
-query (
-$page: Int = 1,
-$isAdult: Boolean = false,
-$search: String,
-$format: MediaFormat
-$status: MediaStatus,
-$season: MediaSeason,
-$year: String,
-$onList: Boolean,
-$yearLesser: FuzzyDateInt,
-$yearGreater: FuzzyDateInt,
-$licensedBy: [String],
-$includedGenres: [String],
-$excludedGenres: [String],
-$includedTags: [String],
-$excludedTags: [String],
-$sort: [MediaSort] = [SCORE_DESC, POPULARITY_DESC],
-$perPage: Int,
-) {
-    Page (page: $page, perPage: $perPage) {
-        pageInfo {
-            total
-            perPage
-            currentPage
-            lastPage
-            hasNextPage
-        }
-        media (
-            type: ANIME,
-            season: $season,
-            format: $format,
-            status: $status,
-            search: $search,
-            onList: $onList,
-            startDate_like: $year,
-            startDate_lesser: $yearLesser,
-            startDate_greater: $yearGreater,
-            licensedBy_in: $licensedBy,
-            genre_in: $includedGenres,
-            genre_not_in: $excludedGenres,
-            tag_in: $includedTags,
-            tag_not_in: $excludedTags,
-            sort: $sort,
-            isAdult: $isAdult
-        ) {
-            id
-            title {
-                userPreferred
-            }
-            coverImage {
-                large
-            }
-            bannerImage
-            startDate {
-                year
-                month
-                day
-            }
-            endDate {
-                year
-                month
-                day
-            }
-            season
-            description
-            type
-            format
-            status
-            genres
-            isAdult
-            averageScore
-            popularity
-            mediaListEntry {
-                id
-                status
-                score
-                progress
-                repeat
-                private
-                notes
-                customLists
-                startedAt{
-                    year
-                    month
-                    day
-                }
-                completedAt {
-                    year
-                    month
-                    day
-                }
-            }
-            nextAiringEpisode {
-                id
-                airingAt
-                episode
-            }
-            studios (isMain: true) {
-                edges {
-                    isMain
-                    node {
-                        id
-                        name
-                    }
-                }
-            }
-        }
-    }
-}"""
+        query = _browse_query(ALL_FIELDS if fields is None else frozenset(fields))
         variables = dict_filter({
             'page': page,
             'isAdult': is_adult,
@@ -287,7 +350,7 @@ $perPage: Int,
             else:
                 variables['yearGreater'] = start * 10000
                 variables['yearLesser'] = fin * 10000
-        res = self.query(query, variables)
+        res = self.query(query, variables, 'browse', cancel=cancel)
 
         def _process_results(_res):
             _page = _res.get('data', {}).get('Page', {})
@@ -297,6 +360,19 @@ $perPage: Int,
 
         return res.map(_process_results)
 
+    def iter_anime(self, executor: Optional[Executor] = None, **filters) -> MediaStream:
+        """
+        Browse anime across all pages, see `browse_anime` for the filters.
+
+        Args:
+            executor: Executor to prefetch pages on, None to use a private thread
+            **filters: Keyword arguments for `browse_anime`
+
+        Returns:
+            Iterator over the anime, prefetching one page ahead
+        """
+        return MediaStream(self, filters, executor)
+
     def get_genres(self) -> Result[List[str], HTTP_ERROR]:
         """
         Get all genres
@@ -305,7 +381,7 @@ $perPage: Int,
             List of genres
         """
         query = '{GenreCollection}'
-        res = self.query(query)
+        res = self.query(query, kind='genres')
         return res.map(lambda v: v['data']['GenreCollection'])
 
     def get_tags(self) -> Result[List[dict], HTTP_ERROR]:
@@ -326,34 +402,138 @@ $perPage: Int,
         isMediaSpoiler
     }
 }"""
-        res = self.query(query)
+        res = self.query(query, kind='tags')
         return res.map(lambda v: v['data']['MediaTagCollection'])
 
-    def get_show(self, show: str) -> Result[Media, HTTP_ERROR]:
+    def get_show(
+            self,
+            show: str,
+            fields: Optional[Iterable[str]] = SHOW_FIELDS
+    ) -> Result[Media, HTTP_ERROR]:
         """
         Gets information about a single show by name
 
         Args:
             show:
                 The show to look up
+            fields: The `Media` properties to fetch, None for all of them
 
         Returns:
             Information about the show
         """
-        query = """\
-        query ($title: String) {
-            Media(search: $title, type: ANIME) {
-                id
-                coverImage {
-                    large
-                     medium
-                }
-            }
-        }"""
+        query = f"""\
+query ($title: String) {{
+    Media(search: $title, type: ANIME) {{
+{media_selection(fields, 8)}
+    }}
+}}"""
         variables = {
             'title': show
         }
-        return self.query(query, variables).map(lambda v: Media(v, self.cache_home))
+        return self.query(query, variables, 'media') \
+            .map(lambda v: Media(v['data']['Media'], self.cache_home))
+
+    def get_media(
+            self,
+            media_id: int,
+            fields: Optional[Iterable[str]] = None
+    ) -> Result[Media, HTTP_ERROR]:
+        """
+        Gets information about a single media by ID
+
+        Used to lazily fetch the details left out of a compact browse query.
+
+        Args:
+            media_id: The media ID
+            fields: The `Media` properties to fetch, None for all of them
+
+        Returns:
+            Information about the media
+        """
+        query = f"""\
+query ($id: Int) {{
+    Media(id: $id) {{
+{media_selection(fields, 8)}
+    }}
+}}"""
+        return self.query(query, {'id': media_id}, 'media') \
+            .map(lambda v: Media(v['data']['Media'], self.cache_home))
+
+    def get_shows(
+            self,
+            shows: Iterable[str],
+            batch_size: int = SHOWS_BATCH_SIZE,
+            priority: Priority = Priority.BACKGROUND,
+            fields: Optional[Iterable[str]] = SHOW_FIELDS
+    ) -> Dict[str, Result[Media, HTTP_ERROR]]:
+        """
+        Gets information about many shows by name
+
+        The lookups are packed into aliased queries of `batch_size` shows
+        each. A batch the API rejects, either for exceeding the query
+        complexity limit or because one of its shows was not found, is
+        split in half and retried until the failing shows are isolated.
+
+        Args:
+            shows: The shows to look up
+            batch_size: Maximum number of shows per request
+            priority: The rate limiter priority of the requests
+            fields: The `Media` properties to fetch, None for all of them
+
+        Returns:
+            Information about each show, keyed by the given name
+        """
+        titles = list(dict.fromkeys(shows))
+        results = {}
+        for i in range(0, len(titles), batch_size):
+            self._get_shows_batch(titles[i:i + batch_size], results, priority, fields)
+        return results
+
+    def _get_shows_batch(
+            self,
+            titles: List[str],
+            results: Dict[str, Result[Media, HTTP_ERROR]],
+            priority: Priority,
+            fields: Optional[Iterable[str]]
+    ):
+        """
+        Look up a batch of shows in a single request
+
+        Args:
+            titles: The shows to look up
+            results: Dict to put the results in
+            priority: The rate limiter priority of the request
+            fields: The `Media` properties to fetch, None for all of them
+        """
+        params = ', '.join(f'$t{i}: String' for i in range(len(titles)))
+        selection = media_selection(fields, 8)
+        aliases = ''.join(
+            f"""
+    m{i}: Media(search: $t{i}, type: ANIME) {{
+{selection}
+    }}""" for i in range(len(titles))
+        )
+        query = f'query ({params}) {{{aliases}\n}}'
+        variables = {f't{i}': title for i, title in enumerate(titles)}
+        res = self.query(query, variables, 'media', priority)
+        if res.is_err:
+            status, msg = res.unwrap_err()
+            # AniList fails the whole query with a 404 when any alias is not
+            # found, and with a 400 when it is over the complexity limit.
+            # Other client errors would fail the smaller batches the same way.
+            retry = status == 404 or (status == 400 and 'complexity' in msg.lower())
+            if len(titles) > 1 and retry:
+                half = len(titles) // 2
+                self._get_shows_batch(titles[:half], results, priority, fields)
+                self._get_shows_batch(titles[half:], results, priority, fields)
+            else:
+                results.update((title, res) for title in titles)
+            return
+        data = res.unwrap().get('data') or {}
+        for i, title in enumerate(titles):
+            media = data.get(f'm{i}')
+            results[title] = Ok(Media(media, self.cache_home)) if media \
+                else Err((404, f'{title} not found'))
 
     def update_media_list_entry(  # pylint: disable=R0913
             self,
@@ -392,11 +572,11 @@ mutation (
     $status: MediaListStatus,
     $score: Float,
     $progress: Int,
-    $customLists: Json,
+    $customLists: [String],
     $private: Boolean,
     $notes: String,
-    $startedAt: FuzzyDate,
-    $completedAt: FuzzyDate,
+    $startedAt: FuzzyDateInput,
+    $completedAt: FuzzyDateInput,
     $repeat: Int
 ) {
     SaveMediaListEntry (
@@ -423,24 +603,138 @@ mutation (
             completedAt
     }
 }"""
-        variables = dict_filter({
-            "mediaId": media_id,
-            "status": status.name if status else None,
-            "score": score,
-            "progress": progress,
-            "customLists": custom_lists,
-            "private": private,
-            "notes": notes,
-            "startedAt": {
-                "year": started_at.year,
-                "month": started_at.month,
-                "day": started_at.day
-            } if started_at else None,
-            "completedAt": {
-                "year": completed_at.year,
-                "month": completed_at.month,
-                "day": completed_at.day
-            } if completed_at else None,
-            "repeat": repeat,
-        })
-        return self.query(query, variables)
+        variables = media_list_entry_variables(
+            media_id,
+            status=status,
+            score=score,
+            progress=progress,
+            repeat=repeat,
+            private=private,
+            notes=notes,
+            custom_lists=custom_lists,
+            started_at=started_at,
+            completed_at=completed_at
+        )
+        return self.query(query, variables, priority=Priority.BACKGROUND)
+
+    def update_media_list_entries(
+            self,
+            entries: Dict[int, dict],
+            priority: Priority = Priority.BACKGROUND
+    ) -> Dict[int, API_RES]:
+        """
+        Update many media list entries for the user in a single request.
+
+        Args:
+            entries:
+                The changes for each entry keyed by media ID, the changes take
+                the keyword arguments of `update_media_list_entry`
+            priority: The rate limiter priority of the request
+
+        Returns:
+            The updated media entry values keyed by media ID
+        """
+        media_ids = list(entries)
+        if not media_ids:
+            return {}
+        params, fields = [], []
+        variables = {}
+        for i, media_id in enumerate(media_ids):
+            entry_vars = media_list_entry_variables(media_id, **entries[media_id])
+            args = []
+            for name, value in entry_vars.items():
+                params.append(f'${name}{i}: {MEDIA_LIST_ENTRY_TYPES[name]}')
+                args.append(f'{name}: ${name}{i}')
+                variables[f'{name}{i}'] = value
+            fields.append(f"""
+    e{i}: SaveMediaListEntry ({', '.join(args)}) {{
+        id
+        mediaId
+        status
+        score
+        progress
+        repeat
+        private
+        notes
+        customLists
+        startedAt {{
+            year
+            month
+            day
+        }}
+        completedAt {{
+            year
+            month
+            day
+        }}
+    }}""")
+        query = f'mutation ({", ".join(params)}) {{{"".join(fields)}\n}}'
+        res = self.query(query, variables, priority=priority)
+        if res.is_err:
+            return {media_id: res for media_id in media_ids}
+        data = res.unwrap().get('data') or {}
+        return {
+            media_id: Ok(data[f'e{i}']) if data.get(f'e{i}')
+            else Err((404, f'Failed to update media {media_id}'))
+            for i, media_id in enumerate(media_ids)
+        }
+
+
+def media_list_entry_variables(  # pylint: disable=R0913
+        media_id: int,
+        status: Optional[MediaListStatus] = None,
+        score: Optional[float] = None,
+        progress: Optional[int] = None,
+        repeat: Optional[int] = None,
+        private: Optional[bool] = None,
+        notes: Optional[str] = None,
+        custom_lists: Optional[Dict[str, bool]] = None,
+        started_at: Optional[FuzzyDate] = None,
+        completed_at: Optional[FuzzyDate] = None,
+) -> dict:
+    """
+    Make the `SaveMediaListEntry` variables for an entry update
+
+    Args:
+        See `API.update_media_list_entry`
+
+    Returns:
+        The mutation variables, without the unset values
+    """
+    return dict_filter({
+        "mediaId": media_id,
+        "status": status.name if status else None,
+        "score": score,
+        "progress": progress,
+        # The mutation takes the names of the lists the entry is in
+        "customLists": [
+            name for name, enabled in custom_lists.items() if enabled
+        ] if custom_lists is not None else None,
+        "private": private,
+        "notes": notes,
+        "startedAt": {
+            "year": started_at.year,
+            "month": started_at.month,
+            "day": started_at.day
+        } if started_at else None,
+        "completedAt": {
+            "year": completed_at.year,
+            "month": completed_at.month,
+            "day": completed_at.day
+        } if completed_at else None,
+        "repeat": repeat,
+    })
+
+
+@lru_cache(None)
+def _browse_query(fields: FrozenSet[str]) -> str:
+    """
+    Make the browse query selecting the given `Media` properties
+
+    Args:
+        fields: Names of the `Media` properties needed
+
+    Returns:
+        The browse query
+    """
+    return BROWSE_QUERY % media_selection(fields, 12)
@@ -0,0 +1,155 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the asyncio variant of the anilist API class."""
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from threading import Event
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import attr
+from option import Result
+
+from .anilist import API, API_RES, HTTP_ERROR
+from .media import Media
+from .ratelimit import Priority
+
+DEFAULT_CONCURRENCY = 4
+
+
+@attr.s(slots=True)
+class AsyncAPI:
+    """
+    Asyncio front end to the Anilist API
+
+    Requests are run on an executor through the wrapped blocking API, so they
+    share its session, response cache and rate limiter.
+    """
+    api: API = attr.ib()
+    concurrency: int = attr.ib(default=DEFAULT_CONCURRENCY)
+    executor: Executor = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.concurrency)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def query(
+            self,
+            query: str,
+            variables: Optional[dict] = None,
+            kind: Optional[str] = None,
+            priority: Priority = Priority.INTERACTIVE,
+            cancel: Optional[Event] = None
+    ) -> API_RES:
+        """See Also: `API.query`"""
+        return await self._run(self.api.query, query, variables, kind, priority, cancel)
+
+    async def query_pages(
+            self,
+            query: str,
+            per_page: int,
+            variables: Optional[dict] = None,
+            priority: Priority = Priority.BACKGROUND
+    ) -> AsyncIterator[API_RES]:
+        """
+        Make paged requests to the Anilist API
+
+        The first page is requested alone, once its `pageInfo.lastPage` is
+        known the remaining pages are requested concurrently, with at most
+        `concurrency` requests in flight. The query must select `pageInfo`.
+
+        Args:
+            query: The GraphQL query to POST to the API
+            per_page: Number of items per page
+            variables: variables for the query, can be None
+            priority: The rate limiter priority of the requests
+
+        Yields:
+            Each page of the API response, in page order
+        """
+        variables = variables.copy() if variables else {}
+        variables['perPage'] = per_page
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _fetch(page):
+            async with semaphore:
+                return await self.query(query, {**variables, 'page': page}, priority=priority)
+
+        res = await _fetch(1)
+        yield res
+        page_info = _page_info(res)
+        page = 1
+        last_page = page_info.get('lastPage') or 1
+        if page_info.get('hasNextPage') and last_page > page:
+            tasks = [asyncio.ensure_future(_fetch(i)) for i in range(page + 1, last_page + 1)]
+            try:
+                for task in tasks:
+                    res = await task
+                    yield res
+                    page += 1
+            finally:
+                for task in tasks:
+                    task.cancel()
+            page_info = _page_info(res)
+
+        # lastPage is an estimate, keep going if the server says there's more
+        while page_info.get('hasNextPage'):
+            page += 1
+            res = await _fetch(page)
+            yield res
+            page_info = _page_info(res)
+
+    async def browse_anime(self, page=1, **kwargs) -> Result[tuple, HTTP_ERROR]:
+        """See Also: `API.browse_anime`"""
+        return await self._run(self.api.browse_anime, page, **kwargs)
+
+    async def get_genres(self) -> Result[List[str], HTTP_ERROR]:
+        """See Also: `API.get_genres`"""
+        return await self._run(self.api.get_genres)
+
+    async def get_tags(self) -> Result[List[dict], HTTP_ERROR]:
+        """See Also: `API.get_tags`"""
+        return await self._run(self.api.get_tags)
+
+    async def get_show(self, show: str, **kwargs) -> Result[Media, HTTP_ERROR]:
+        """See Also: `API.get_show`"""
+        return await self._run(self.api.get_show, show, **kwargs)
+
+    async def get_media(self, media_id: int, **kwargs) -> Result[Media, HTTP_ERROR]:
+        """See Also: `API.get_media`"""
+        return await self._run(self.api.get_media, media_id, **kwargs)
+
+    async def get_shows(
+            self,
+            shows: Iterable[str],
+            **kwargs
+    ) -> Dict[str, Result[Media, HTTP_ERROR]]:
+        """See Also: `API.get_shows`"""
+        return await self._run(self.api.get_shows, list(shows), **kwargs)
+
+    async def update_media_list_entry(self, media_id: int, **kwargs) -> API_RES:
+        """See Also: `API.update_media_list_entry`"""
+        return await self._run(self.api.update_media_list_entry, media_id, **kwargs)
+
+
+def _page_info(res: API_RES) -> Dict:
+    return res.ok().map_or(lambda val: val['data']['Page']['pageInfo'], {})
@@ -0,0 +1,199 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the persistent cache for Anilist API responses."""
+import json
+import re
+from hashlib import sha256
+from time import time
+from typing import Dict, Iterable, Optional
+
+import attr
+
+from ene.cache import DiskCache
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+DEFAULT_TTLS = {
+    'genres': 7 * DAY,
+    'tags': 7 * DAY,
+    'media': DAY,
+    'browse': 5 * MINUTE,
+}
+# Query kinds whose responses depend on the authenticated user, through
+# fields like mediaListEntry or the onList filter
+USER_KINDS = frozenset({'media', 'browse'})
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_MUTATION = re.compile(r'^\s*mutation\b')
+
+
+def is_mutation(query: str) -> bool:
+    """
+    Check if a GraphQL document is a mutation
+
+    Args:
+        query: The GraphQL document
+
+    Returns:
+        True if the document is a mutation
+    """
+    return bool(_MUTATION.match(query))
+
+
+@attr.s(slots=True, auto_attribs=True)
+class CacheEntry:
+    """
+    A cached API response.
+
+    Args:
+        data: The response json
+        expires: Unix time after which the entry needs revalidation
+        etag: The entity tag sent by the server, if any
+    """
+    data: dict
+    expires: float
+    etag: Optional[str] = None
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the entry can be used without contacting the server."""
+        return time() < self.expires
+
+
+class ResponseCache:
+    """
+    Caches GraphQL responses on disk, keyed by the query and its variables.
+
+    Each query kind has its own time to live, kinds without a positive
+    time to live are never cached. Mutations are never cached, and the
+    responses of `USER_KINDS` are only shared by requests for the same user
+    and are dropped with `invalidate` when the user's data changes.
+    """
+
+    def __init__(
+            self,
+            store: DiskCache,
+            ttls: Optional[Dict[str, int]] = None,
+            user: Optional[str] = None
+    ):
+        """
+        Initialize instance
+
+        Args:
+            store: The disk cache to keep the responses in
+            ttls: Time to live in seconds per query kind, overrides the defaults
+            user: Identifies the authenticated user, e.g. its access token
+        """
+        self.store = store
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.user = user
+
+    def make_key(
+            self,
+            query: str,
+            variables: Optional[dict] = None,
+            kind: Optional[str] = None
+    ) -> str:
+        """
+        Make the cache key for a query
+
+        Whitespace in the query is normalized and the variables are
+        serialized with sorted keys, so equivalent requests share a key.
+        Keys are grouped by query kind, so a kind can be invalidated.
+
+        Args:
+            query: The GraphQL query
+            variables: variables for the query, can be None
+            kind: The query kind
+
+        Returns:
+            The cache key
+        """
+        payload = json.dumps(
+            {
+                'query': ' '.join(query.split()),
+                'variables': variables or {},
+                'user': self.user if kind in USER_KINDS else None,
+            },
+            sort_keys=True,
+            separators=(',', ':'),
+        )
+        digest = sha256(payload.encode()).hexdigest()
+        return f'{kind}/{digest}' if kind else digest
+
+    def invalidate(self, kinds: Iterable[str] = USER_KINDS):
+        """
+        Remove the cached responses of some query kinds
+
+        Args:
+            kinds: The query kinds, defaults to the user specific ones
+        """
+        kinds = set(kinds)
+        for key in self.store:
+            kind, separator, _ = key.partition('/')
+            if separator and kind in kinds:
+                self.store.discard(key)
+
+    def ttl(self, kind: Optional[str]) -> int:
+        """
+        Get the time to live for a query kind
+
+        Args:
+            kind: The query kind, None for uncached queries
+
+        Returns:
+            Time to live in seconds, 0 if the kind should not be cached
+        """
+        return self.ttls.get(kind, 0) if kind else 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Get a cached response, fresh or not
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cache entry, None if there is none
+        """
+        raw = self.store.get(key)
+        if raw is None:
+            return None
+        try:
+            return CacheEntry(**json.loads(raw.decode()))
+        except (ValueError, TypeError):
+            self.store.discard(key)
+            return None
+
+    def put(self, key: str, kind: str, data: dict, etag: Optional[str] = None):
+        """
+        Cache a response
+
+        Args:
+            key: The cache key
+            kind: The query kind
+            data: The response json
+            etag: The entity tag sent by the server, if any
+        """
+        ttl = self.ttl(kind)
+        if ttl <= 0:
+            return
+        entry = CacheEntry(data, time() + ttl, etag)
+        self.store.put(key, json.dumps(attr.asdict(entry)).encode())
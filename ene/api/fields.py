@@ -0,0 +1,107 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module builds GraphQL selections for the `Media` properties a caller needs."""
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Optional
+
+# The selections needed by each `Media` property, the media id is always selected.
+MEDIA_FIELDS = {
+    'title': ('title {\n    userPreferred\n}',),
+    'type': ('type',),
+    'format': ('format',),
+    'status': ('status',),
+    'description': ('description',),
+    'start_date': ('startDate {\n    year\n    month\n    day\n}',),
+    'end_date': ('endDate {\n    year\n    month\n    day\n}',),
+    'season': ('season',),
+    'cover_image': ('coverImage {\n    large\n}',),
+    'banner_image': ('bannerImage',),
+    'genres': ('genres',),
+    'is_adult': ('isAdult',),
+    'average_score': ('averageScore',),
+    'popularity': ('popularity',),
+    'media_list_entry': ("""\
+mediaListEntry {
+    id
+    status
+    score
+    progress
+    repeat
+    private
+    notes
+    customLists
+    startedAt {
+        year
+        month
+        day
+    }
+    completedAt {
+        year
+        month
+        day
+    }
+}""",),
+    'next_airing_episode': ('type', """\
+nextAiringEpisode {
+    id
+    airingAt
+    episode
+}"""),
+    'studio': ("""\
+studios (isMain: true) {
+    edges {
+        isMain
+        node {
+            id
+            name
+        }
+    }
+}""",),
+}
+
+ALL_FIELDS = frozenset(MEDIA_FIELDS)
+
+
+def media_selection(fields: Optional[Iterable[str]] = None, indent: int = 0) -> str:
+    """
+    Make the GraphQL selection for the given `Media` properties
+
+    Args:
+        fields: Names of the `Media` properties needed, None for all of them
+        indent: Number of spaces to indent each line by
+
+    Returns:
+        The selection, without the surrounding braces
+
+    Raises:
+        KeyError if a field is not a known `Media` property
+    """
+    return _media_selection(ALL_FIELDS if fields is None else frozenset(fields), indent)
+
+
+@lru_cache(None)
+def _media_selection(fields: FrozenSet[str], indent: int) -> str:
+    unknown = fields - ALL_FIELDS
+    if unknown:
+        raise KeyError(f'Unknown media fields: {", ".join(sorted(unknown))}')
+    selections = ['id']
+    for name, field_selections in MEDIA_FIELDS.items():
+        if name in fields:
+            selections.extend(s for s in field_selections if s not in selections)
+    pad = ' ' * indent
+    return '\n'.join(pad + line for s in selections for line in s.splitlines())
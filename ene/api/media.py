@@ -36,63 +36,71 @@ class Media:
 
     @property
     def title(self) -> Option[str]:
-        return maybe(self.data['title']).get('userPreferred')
+        return maybe(self.data.get('title')).get('userPreferred')
 
     @property
     def type(self) -> Option[MediaType]:
-        return maybe(MediaType.get(self.data['type']))
+        return maybe(MediaType.get(self.data.get('type')))
 
     @property
     def format(self) -> Option[MediaFormat]:
-        return maybe(MediaFormat.get(self.data['format']))
+        return maybe(MediaFormat.get(self.data.get('format')))
 
     @property
     def status(self) -> Option[MediaStatus]:
-        return maybe(MediaStatus.get(self.data['status']))
+        return maybe(MediaStatus.get(self.data.get('status')))
 
     @property
     def description(self) -> Option[str]:
-        return maybe(self.data['description'])
+        return maybe(self.data.get('description'))
 
     @property
     def start_date(self) -> Option[FuzzyDate]:
-        return maybe(self.data['startDate']).map(FuzzyDate.from_dict)
+        return maybe(self.data.get('startDate')).map(FuzzyDate.from_dict)
 
     @property
     def end_date(self) -> Option[FuzzyDate]:
-        return maybe(self.data['endDate']).map(FuzzyDate.from_dict)
+        return maybe(self.data.get('endDate')).map(FuzzyDate.from_dict)
 
     @property
     def season(self) -> Option[MediaSeason]:
-        return maybe(MediaSeason.get(self.data['season']))
+        return maybe(MediaSeason.get(self.data.get('season')))
+
+    @property
+    def cover_image_url(self) -> Option[str]:
+        return maybe(self.data.get('coverImage')).get('large')
 
     @property
     def cover_image(self) -> Option[Path]:
-        return maybe(self.data['coverImage']).get('large').map(self._get_resource)
+        return self.cover_image_url.map(self._get_resource)
+
+    @property
+    def banner_image_url(self) -> Option[str]:
+        return maybe(self.data.get('bannerImage'))
 
     @property
     def banner_image(self) -> Option[Path]:
-        return maybe(self.data['bannerImage']).map(self._get_resource)
+        return self.banner_image_url.map(self._get_resource)
 
     @property
     def genres(self) -> List[str]:
-        return self.data['genres'] or []
+        return self.data.get('genres') or []
 
     @property
     def is_adult(self) -> bool:
-        return self.data['isAdult'] or False
+        return self.data.get('isAdult') or False
 
     @property
     def average_score(self) -> Option[int]:
-        return maybe(self.data['averageScore'])
+        return maybe(self.data.get('averageScore'))
 
     @property
     def popularity(self) -> Option[int]:
-        return maybe(self.data['popularity'])
+        return maybe(self.data.get('popularity'))
 
     @property
     def media_list_entry(self) -> Option[MediaList]:
-        media_list_entry = self.data['mediaListEntry']
+        media_list_entry = self.data.get('mediaListEntry')
         return Some(MediaList(
             id=media_list_entry['id'],
             media_id=self.id,
@@ -111,7 +119,7 @@ class Media:
     def next_airing_episode(self) -> Option[AiringEpisode]:
         if self.type.unwrap_or(None) != MediaType.ANIME:
             raise NotImplementedError('Only available for anime.')
-        airing_episode = self.data['nextAiringEpisode']
+        airing_episode = self.data.get('nextAiringEpisode')
         return Some(AiringEpisode(
             id=airing_episode['id'],
             airing_at=airing_episode['airingAt'],
@@ -121,7 +129,7 @@ class Media:
 
     @property
     def studio(self) -> Option[Studio]:
-        studios = maybe(self.data['studios']).get('edges').unwrap_or([])
+        studios = maybe(self.data.get('studios')).get('edges').unwrap_or([])
         for studio in studios:
             if studio['isMain']:
                 node = studio['node']
@@ -0,0 +1,162 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the client side rate limiter for the Anilist API."""
+from enum import IntEnum
+from heapq import heappush, heapify
+from itertools import count
+from random import uniform
+from threading import Condition, Event
+from time import monotonic
+from typing import Mapping, Optional
+
+DEFAULT_LIMIT = 90
+DEFAULT_PERIOD = 60.0
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class Priority(IntEnum):
+    """Request priorities, lower values are served first."""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class RateLimiter:
+    """
+    Token bucket that paces requests to stay within the API rate limit.
+
+    Waiting requests are served in priority order, then in arrival order.
+    The bucket is kept in sync with the server through the rate limit
+    headers of each response.
+
+    See Also:
+        https://anilist.gitbook.io/anilist-apiv2-docs/overview/rate-limiting
+    """
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, period: float = DEFAULT_PERIOD):
+        """
+        Initialize instance
+
+        Args:
+            limit: Number of requests allowed per period
+            period: The period length in seconds
+        """
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self.blocked_until = 0.0
+        self._updated = monotonic()
+        self._cond = Condition()
+        self._waiting = []
+        self._seq = count()
+
+    @property
+    def fill_rate(self) -> float:
+        """Tokens added to the bucket per second."""
+        return self.limit / self.period
+
+    def acquire(
+            self,
+            priority: Priority = Priority.INTERACTIVE,
+            cancel: Optional[Event] = None
+    ) -> bool:
+        """
+        Block until a request of the given priority may be sent
+
+        Args:
+            priority: The request priority
+            cancel: Event that abandons the wait when set
+
+        Returns:
+            True if the request may be sent, False if it was cancelled
+        """
+        ticket = (priority, next(self._seq))
+        poll = CANCEL_POLL_INTERVAL if cancel else None
+        with self._cond:
+            heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if cancel and cancel.is_set():
+                        return False
+                    delay = self._delay()
+                    if self._waiting[0] != ticket:
+                        self._cond.wait(poll)
+                    elif delay > 0:
+                        self._cond.wait(min(delay, poll or delay))
+                    else:
+                        self.tokens -= 1
+                        return True
+            finally:
+                self._waiting.remove(ticket)
+                heapify(self._waiting)
+                self._cond.notify_all()
+
+    def update(self, headers: Mapping[str, str]):
+        """
+        Synchronize the bucket with the rate limit headers of a response
+
+        Args:
+            headers: The response headers
+        """
+        limit = _int_header(headers, 'X-RateLimit-Limit')
+        remaining = _int_header(headers, 'X-RateLimit-Remaining')
+        retry_after = _int_header(headers, 'Retry-After')
+        with self._cond:
+            self._refill()
+            if limit:
+                self.limit = limit
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+            if retry_after is not None:
+                self.tokens = 0.0
+                self.blocked_until = max(self.blocked_until, monotonic() + retry_after)
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(float(self.limit), self.tokens + (now - self._updated) * self.fill_rate)
+        self._updated = now
+
+    def _delay(self) -> float:
+        self._refill()
+        blocked = self.blocked_until - monotonic()
+        if self.tokens >= 1:
+            return blocked
+        return max(blocked, (1 - self.tokens) / self.fill_rate)
+
+
+def backoff(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """
+    Exponential backoff delay with full jitter
+
+    Args:
+        attempt: The number of attempts made so far, starting from 0
+        base: The delay ceiling of the first attempt in seconds
+        cap: The maximum delay ceiling in seconds
+
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    return uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,114 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the streaming iterator over browse results."""
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from threading import Event, RLock
+from typing import List, Optional
+
+from .media import Media
+
+
+class MediaStream:
+    """
+    Iterates over browse results across pages.
+
+    While a page is being consumed the next one is fetched in the
+    background, the stream ends after the page with no next page, on a
+    request error, or when it is closed. Closing the stream cancels the
+    request in flight.
+    """
+
+    def __init__(self, api, filters: dict, executor: Optional[Executor] = None):
+        """
+        Initialize instance and start fetching the first page
+
+        Args:
+            api: The API object
+            filters: Keyword arguments for `API.browse_anime`
+            executor: Executor to fetch pages on, None to use a private thread
+        """
+        self.api = api
+        self.filters = filters
+        self.error = None
+        self.cancelled = Event()
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(1)
+        self._lock = RLock()
+        self._buffer = deque()
+        self._page = 0
+        self._next: Optional[Future] = None
+        self._prefetch()
+
+    @property
+    def done(self) -> bool:
+        """Whether there are no more pages to fetch."""
+        return self._next is None or self.cancelled.is_set()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Media:
+        with self._lock:
+            while not self._buffer:
+                if self.done:
+                    raise StopIteration
+                self._buffer.extend(self.next_page())
+            return self._buffer.popleft()
+
+    def next_page(self) -> List[Media]:
+        """
+        Get the next page of results, waiting for it if it is still in flight
+
+        Returns:
+            The media on the page, empty if the stream is done
+        """
+        with self._lock:
+            if self._buffer:
+                page = list(self._buffer)
+                self._buffer.clear()
+                return page
+            if self.done:
+                return []
+            res = self._next.result()
+            self._next = None
+            if self.cancelled.is_set():
+                return []
+            if res.is_err:
+                self.error = res.unwrap_err()
+                return []
+            media, has_next = res.unwrap()
+            if has_next:
+                self._prefetch()
+            return list(media)
+
+    def close(self):
+        """Stop the stream, dropping any page in flight without waiting for it."""
+        self.cancelled.set()
+        future = self._next
+        if future is not None:
+            future.cancel()
+        self._buffer.clear()
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    def _prefetch(self):
+        self._page += 1
+        self._next = self._executor.submit(
+            self.api.browse_anime, self._page, cancel=self.cancelled, **self.filters
+        )
@@ -0,0 +1,164 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the write-behind queue for media list entry updates."""
+from collections import OrderedDict
+from concurrent.futures import Future
+from inspect import signature
+from threading import Condition, Thread
+from time import monotonic
+from typing import Dict, List
+
+from option import Err
+from requests import RequestException
+
+from .anilist import API, API_RES, media_list_entry_variables
+
+FLUSH_INTERVAL = 5.0
+MAX_PENDING = 20
+# The keyword arguments accepted by `MediaListUpdateQueue.update`
+UPDATE_FIELDS = frozenset(signature(media_list_entry_variables).parameters) - {'media_id'}
+
+
+class MediaListUpdateQueue:
+    """
+    Write-behind queue that batches media list entry updates.
+
+    Updates to the same media are coalesced, later values win field by
+    field. Pending updates are sent as a single multi-mutation request once
+    `flush_interval` seconds have passed since the oldest one was queued,
+    or as soon as `max_pending` different media have pending updates.
+    """
+
+    def __init__(
+            self,
+            api: API,
+            flush_interval: float = FLUSH_INTERVAL,
+            max_pending: int = MAX_PENDING
+    ):
+        """
+        Initialize instance and start the background flush thread
+
+        Args:
+            api: The API object
+            flush_interval: Maximum seconds an update waits before being sent
+            max_pending: Number of pending media that triggers a flush
+        """
+        self.api = api
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._cond = Condition()
+        self._pending = OrderedDict()
+        self._futures: Dict[int, List[Future]] = {}
+        self._oldest = 0.0
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def update(self, media_id: int, **changes) -> Future:
+        """
+        Queue an update for a media list entry
+
+        Args:
+            media_id: The media ID
+            **changes: The keyword arguments of `API.update_media_list_entry`
+
+        Returns:
+            Future of the updated media entry values
+
+        Raises:
+            TypeError: If a change is not a media list entry field
+        """
+        unknown = changes.keys() - UPDATE_FIELDS
+        if unknown:
+            raise TypeError(f'Unknown media list entry fields: {", ".join(sorted(unknown))}')
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Update queue is closed.')
+            if not self._pending:
+                self._oldest = monotonic()
+            self._pending.setdefault(media_id, {}).update(changes)
+            self._futures.setdefault(media_id, []).append(future)
+            self._cond.notify_all()
+        return future
+
+    def flush(self) -> Dict[int, API_RES]:
+        """
+        Send all pending updates now
+
+        Returns:
+            The updated media entry values keyed by media ID
+        """
+        with self._cond:
+            batch, futures = self._take()
+        return self._send(batch, futures)
+
+    def close(self):
+        """Send all pending updates and stop the background flush thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def _take(self):
+        batch, futures = self._pending, self._futures
+        self._pending, self._futures = OrderedDict(), {}
+        return batch, futures
+
+    def _send(self, batch: Dict[int, dict], futures: Dict[int, List[Future]]):
+        results = {}
+        errors = {}
+        ids = list(batch)
+        for i in range(0, len(ids), self.max_pending):
+            chunk = {media_id: batch[media_id] for media_id in ids[i:i + self.max_pending]}
+            try:
+                results.update(self.api.update_media_list_entries(chunk))
+            except RequestException as ex:
+                results.update((media_id, Err((0, str(ex)))) for media_id in chunk)
+            except Exception as ex:  # pylint: disable=broad-except
+                # Keeps the flush thread alive, the error goes to the callers
+                errors.update((media_id, ex) for media_id in chunk)
+        for media_id, res in results.items():
+            for future in futures.get(media_id, ()):
+                if not future.cancelled():
+                    future.set_result(res)
+        for media_id, ex in errors.items():
+            for future in futures.get(media_id, ()):
+                if not future.cancelled():
+                    future.set_exception(ex)
+        return results
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                while not self._closed and len(self._pending) < self.max_pending:
+                    remaining = self._oldest + self.flush_interval - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                batch, futures = self._take()
+            self._send(batch, futures)
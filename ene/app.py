@@ -23,9 +23,12 @@ from PySide2.QtCore import QTimer, Qt
 from PySide2.QtWidgets import QApplication
 
 from .api import API
+from .cache import resource_cache
 from .config import Config
+from .downloader import ImageDownloader
 from .constants import APP_NAME, CACHE_HOME, CONFIG_HOME, DATA_HOME
 from .ui import MainWindow, SettingsWindow
+from .ui.thumbnails import ThumbnailCache
 
 QApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
 
@@ -47,11 +50,17 @@ class EneApp:
             path.mkdir(parents=True, exist_ok=True)
         self.config = Config(config_home)
         self.pool = ThreadPoolExecutor()
-        self.api = API(data_home, cache_home)
+        self.api = API(data_home, cache_home, self.config.get('API Cache TTLs', {}))
+        self.resources = resource_cache(cache_home, self.config.get('Image Cache Size'))
+        self.pool.submit(self.resources.maintain)
+        self.images = ImageDownloader(cache_home)
+        self.thumbnails = ThumbnailCache(self.images, cache_home)
         self.player = None
 
     def __del__(self):
         print('Called EneApp destructor')
+        self.images.close()
+        self.resources.save()
         if self.player:
             self.player.terminate()
 
@@ -0,0 +1,483 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the on-disk cache used for API responses and resources."""
+import json
+import os
+from collections import OrderedDict
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock, RLock
+from time import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from uuid import uuid4
+
+TMP_SUFFIX = '.part'
+MANIFEST = 'manifest.json'
+DEFAULT_RESOURCE_BYTES = 512 * 1024 * 1024
+# Temporary files older than this are left over from interrupted writes
+STALE_TMP_AGE = 60 * 60
+# Minimum number of seconds between manifest writes caused by downloads
+SAVE_INTERVAL = 30
+# Minimum number of seconds between full verifications during maintenance
+VERIFY_INTERVAL = 7 * 24 * 60 * 60
+VERIFY_STAMP = 'manifest.verified'
+
+
+class DiskCache:
+    """
+    A size bounded file cache with least recently used eviction.
+
+    Every entry is stored as a single file under the cache root, keyed by its
+    path relative to the root. Writes go to a temporary file first and are
+    then renamed into place, so an entry is either complete or absent.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        """
+        Initialize instance, indexing any entries already on disk
+
+        Args:
+            root: The directory to store the entries in
+            max_bytes: The maximum total size of all entries, in bytes
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = RLock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._load()
+
+    @property
+    def size(self) -> int:
+        """Total size of all entries in bytes."""
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def path(self, key: str) -> Path:
+        """
+        Get the path an entry is stored at
+
+        Args:
+            key: The entry key
+
+        Returns:
+            Path of the entry, which may not exist
+        """
+        return self.root / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Read an entry and mark it as recently used
+
+        Args:
+            key: The entry key
+
+        Returns:
+            The entry content, None if it is not cached
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            try:
+                data = self.path(key).read_bytes()
+            except OSError:
+                self._forget(key)
+                return None
+            self.touch(key)
+            return data
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """
+        Get the path of an entry and mark it as recently used
+
+        A file already at the entry path is adopted into the cache.
+
+        Args:
+            key: The entry key
+
+        Returns:
+            Path of the entry, None if it is not cached
+        """
+        path = self.path(key)
+        with self._lock:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                self._forget(key)
+                return None
+            if key not in self._entries and not self._adopt(key, size):
+                return None
+            self.touch(key)
+            return path
+
+    def put(self, key: str, data: bytes):
+        """
+        Write an entry, evicting least recently used entries if needed
+
+        Args:
+            key: The entry key
+            data: The entry content
+        """
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{path.name}.{uuid4().hex}{TMP_SUFFIX}')
+        try:
+            tmp.write_bytes(data)
+            os.replace(str(tmp), str(path))
+        except OSError:
+            _unlink(tmp)
+            raise
+        with self._lock:
+            self._forget(key)
+            self._add(key, len(data))
+            self._evict()
+
+    def touch(self, key: str):
+        """
+        Mark an entry as recently used
+
+        Args:
+            key: The entry key
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                try:
+                    os.utime(str(self.path(key)))
+                except OSError:
+                    pass
+
+    def discard(self, key: str):
+        """
+        Remove an entry if it exists
+
+        Args:
+            key: The entry key
+        """
+        with self._lock:
+            if key in self._entries:
+                _unlink(self.path(key))
+                self._forget(key)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            for key in list(self._entries):
+                self.discard(key)
+
+    def _add(self, key: str, size: int):
+        self._entries[key] = size
+        self._size += size
+
+    def _adopt(self, key: str, size: int) -> bool:
+        self._add(key, size)
+        self._evict()
+        return True
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            self.discard(key)
+
+    def _scan(self) -> Iterator[Tuple[str, os.stat_result]]:
+        for path in self.root.rglob('*'):
+            if not path.is_file():
+                continue
+            if path.name.endswith(TMP_SUFFIX):
+                # Left over from an interrupted write
+                _unlink(path)
+                continue
+            yield path.relative_to(self.root).as_posix(), path.stat()
+
+    def _load(self):
+        with self._lock:
+            for key, stat in sorted(self._scan(), key=lambda item: item[1].st_mtime):
+                self._add(key, stat.st_size)
+            self._evict()
+
+
+class ResourceCache(DiskCache):
+    """
+    Disk cache for downloaded resources such as cover and banner images.
+
+    The cache shares its root with other caches, so only entries recorded in
+    its manifest are managed. The manifest keeps the size, last access time
+    and SHA-256 digest of each entry, which `verify` checks the files against.
+    Downloads only write the manifest every `SAVE_INTERVAL` seconds, call
+    `save` before exiting to persist the rest.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_RESOURCE_BYTES):
+        """
+        Initialize instance, loading the manifest
+
+        Args:
+            root: The directory to store the entries in
+            max_bytes: The maximum total size of all entries, in bytes
+        """
+        self._manifest: Dict[str, dict] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        super().__init__(root, max_bytes)
+
+    @property
+    def manifest_path(self) -> Path:
+        """Path of the manifest file."""
+        return self.root / MANIFEST
+
+    @property
+    def verify_due(self) -> bool:
+        """Whether the last full verification is older than `VERIFY_INTERVAL`."""
+        try:
+            verified_at = (self.root / VERIFY_STAMP).stat().st_mtime
+        except OSError:
+            return True
+        return time() - verified_at >= VERIFY_INTERVAL
+
+    def put(self, key: str, data: bytes):
+        meta = {'size': len(data), 'atime': time(), 'sha256': sha256(data).hexdigest()}
+        with self._lock:
+            self._manifest[key] = meta
+            self._dirty = True
+            super().put(key, data)
+            if time() - self._saved_at >= SAVE_INTERVAL:
+                self.save()
+
+    def touch(self, key: str):
+        with self._lock:
+            if key in self._manifest:
+                self._manifest[key]['atime'] = time()
+                self._dirty = True
+            super().touch(key)
+
+    def discard(self, key: str):
+        with self._lock:
+            if self._manifest.pop(key, None) is not None:
+                self._dirty = True
+            super().discard(key)
+
+    def save(self):
+        """Write the manifest to disk if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.root / f'{MANIFEST}.{uuid4().hex}{TMP_SUFFIX}'
+            try:
+                tmp.write_text(json.dumps(self._manifest))
+                os.replace(str(tmp), str(self.manifest_path))
+            except OSError:
+                _unlink(tmp)
+                raise
+            self._dirty = False
+            self._saved_at = time()
+
+    def verify(self) -> List[str]:
+        """
+        Remove entries whose file is missing or does not match the manifest
+
+        Files are hashed without holding the lock, so lookups are not blocked
+        while the cache is verified.
+
+        Returns:
+            Keys of the removed entries
+        """
+        with self._lock:
+            entries = [
+                (key, self._manifest.get(key), size) for key, size in self._entries.items()
+            ]
+        invalid = []
+        for key, meta, size in entries:
+            path = self.path(key)
+            try:
+                valid = path.stat().st_size == (meta or {}).get('size', size)
+                if valid and meta and meta.get('sha256'):
+                    valid = sha256(path.read_bytes()).hexdigest() == meta['sha256']
+            except OSError:
+                valid = False
+            if not valid:
+                invalid.append((key, meta))
+        removed = []
+        with self._lock:
+            for key, meta in invalid:
+                # Skip entries that were written again while hashing
+                if key in self._entries and self._manifest.get(key) is meta:
+                    self.discard(key)
+                    removed.append(key)
+            self.save()
+        (self.root / VERIFY_STAMP).touch()
+        return removed
+
+    def prune(self) -> int:
+        """
+        Evict entries over the byte budget and delete stale temporary files
+
+        Returns:
+            Number of bytes freed
+        """
+        freed = 0
+        cutoff = time() - STALE_TMP_AGE
+        for path in self.root.rglob(f'*{TMP_SUFFIX}'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if stat.st_mtime < cutoff:
+                _unlink(path)
+                freed += stat.st_size
+        with self._lock:
+            size = self._size
+            self._evict()
+            freed += size - self._size
+            self.save()
+        return freed
+
+    def maintain(self, verify: Optional[bool] = None) -> Tuple[List[str], int]:
+        """
+        Run all maintenance tasks, see `verify` and `prune`
+
+        Args:
+            verify: Whether to verify the entries, None to only verify them
+                when `verify_due`
+
+        Returns:
+            Keys of the entries that failed verification and number of bytes freed
+        """
+        if verify is None:
+            verify = self.verify_due
+        return self.verify() if verify else [], self.prune()
+
+    def _adopt(self, key: str, size: int) -> bool:
+        # Files written before the manifest existed may be truncated, so only
+        # complete images are adopted and anything else is fetched again.
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return False
+        if len(data) != size or not _is_complete_image(data):
+            _unlink(path)
+            return False
+        self._manifest[key] = {
+            'size': size,
+            'atime': time(),
+            'sha256': sha256(data).hexdigest()
+        }
+        self._dirty = True
+        return super()._adopt(key, size)
+
+    def _load(self):
+        try:
+            manifest = json.loads(self.manifest_path.read_text())
+            entries = sorted(manifest.items(), key=lambda item: item[1]['atime'])
+        except (OSError, ValueError):
+            entries = []
+        except (AttributeError, KeyError, TypeError):
+            # Malformed manifest, rebuilt from the files adopted on lookup
+            entries = []
+            self._dirty = True
+        with self._lock:
+            for key, meta in entries:
+                try:
+                    size = self.path(key).stat().st_size
+                except OSError:
+                    self._dirty = True
+                    continue
+                self._manifest[key] = meta
+                self._add(key, size)
+            self._evict()
+
+
+_RESOURCE_CACHES: Dict[Path, ResourceCache] = {}
+_RESOURCE_CACHES_LOCK = Lock()
+
+
+def resource_cache(
+        cache_home: Union[str, Path],
+        max_bytes: Optional[int] = None
+) -> ResourceCache:
+    """
+    Get the shared resource cache for a cache directory
+
+    Args:
+        cache_home: Cache directory path
+        max_bytes: The byte budget of the cache, None to keep the current one
+
+    Returns:
+        The resource cache
+    """
+    root = Path(cache_home)
+    with _RESOURCE_CACHES_LOCK:
+        cache = _RESOURCE_CACHES.get(root)
+        if cache is None:
+            cache = _RESOURCE_CACHES[root] = ResourceCache(
+                root, max_bytes or DEFAULT_RESOURCE_BYTES
+            )
+        elif max_bytes:
+            cache.max_bytes = max_bytes
+    return cache
+
+
+def _is_complete_image(data: bytes) -> bool:
+    """
+    Check if some data is an image which was written completely
+
+    Args:
+        data: The file content
+
+    Returns:
+        True if the data has a known image header and a matching end marker
+    """
+    if data.startswith(b'\xff\xd8\xff'):
+        return data.rstrip(b'\x00').endswith(b'\xff\xd9')
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return data.endswith(b'IEND\xaeB`\x82')
+    if data.startswith((b'GIF87a', b'GIF89a')):
+        return data.endswith(b';')
+    if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+        return int.from_bytes(data[4:8], 'little') + 8 == len(data)
+    return False
+
+
+def _unlink(path: Path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+if __name__ == '__main__':
+    from ene.constants import CACHE_HOME
+
+    REMOVED, FREED = resource_cache(CACHE_HOME).maintain(verify=True)
+    print(f'Removed {len(REMOVED)} corrupt entries, freed {FREED} bytes.')
@@ -0,0 +1,111 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the pooled downloader for images."""
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from threading import BoundedSemaphore, RLock
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from ene.cache import resource_cache
+from ene.util import get_resource
+
+MAX_WORKERS = 8
+PER_HOST = 6
+
+
+class ImageDownloader:
+    """
+    Downloads images into the resource cache over a shared keep-alive session.
+
+    At most `per_host` downloads run against the same host at once, and
+    concurrent requests for the same url share a single download.
+    """
+
+    def __init__(
+            self,
+            cache_home: Path,
+            max_workers: int = MAX_WORKERS,
+            per_host: int = PER_HOST,
+            session: Optional[Session] = None
+    ):
+        """
+        Initialize instance
+
+        Args:
+            cache_home: Cache directory path
+            max_workers: Maximum number of concurrent downloads
+            per_host: Maximum number of concurrent downloads per host
+            session: The session to download with
+        """
+        self.cache_home = cache_home
+        self.per_host = per_host
+        self.session = session or Session()
+        adapter = HTTPAdapter(pool_maxsize=per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='ImageDownloader')
+        self._lock = RLock()
+        self._in_flight: Dict[str, Future] = {}
+        self._hosts: Dict[str, BoundedSemaphore] = {}
+
+    def fetch(self, url: str) -> Future:
+        """
+        Get the cached path of an image, downloading it if needed
+
+        Args:
+            url: The image url
+
+        Returns:
+            A future with the image path
+        """
+        path = resource_cache(self.cache_home).lookup(url.partition('anilist.co/')[-1])
+        if path is not None:
+            future = Future()
+            future.set_result(path)
+            return future
+        with self._lock:
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self._in_flight[url] = self._executor.submit(self._download, url)
+                future.add_done_callback(lambda _: self._done(url))
+            return future
+
+    def close(self):
+        """Cancel pending downloads and close the session."""
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            for future in self._in_flight.values():
+                future.cancel()
+        self.session.close()
+
+    def _download(self, url: str) -> Path:
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._hosts.get(host)
+            if semaphore is None:
+                semaphore = self._hosts[host] = BoundedSemaphore(self.per_host)
+        with semaphore:
+            return get_resource(url, self.cache_home, self.session)
+
+    def _done(self, url: str):
+        with self._lock:
+            self._in_flight.pop(url, None)
@@ -4,6 +4,9 @@ from collections import UserDict
 from enum import Enum
 from pathlib import Path
 
+# Searches for a number that is not preceded by x or succeeded by x or p
+EPISODE_NUMBER = re.compile(r'(?<![\(x0-9])[0-9]+(?![0-9xp])')
+
 
 class Show:
     """
@@ -74,8 +77,7 @@ class Episode:
         """
 
         temp = self.name.replace(title, '')
-        # Searches for a number that is not preceded by x or succeeded by x or p
-        num = re.search(r'(?<![\(x0-9])[0-9]+(?![0-9xp])', temp)
+        num = EPISODE_NUMBER.search(temp)
         try:
             if num is not None:
                 num = num[0]
@@ -40,3 +40,7 @@ class APIHTTPError(APIError):
 class AuthError(EneError):
     """Class for auth errors."""
     pass
+
+
+class DatabaseError(EneError):
+    """Class for errors opening the library database."""
@@ -16,10 +16,20 @@
 
 """This module handles local video files."""
 
+import os
 import re
-from os import walk
+from collections import OrderedDict
+from concurrent.futures import (
+    FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
+from enum import Enum
+from itertools import chain
 from pathlib import Path
-from ene.entities import Episode, ShowList
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from ene.entities import EPISODE_NUMBER, Episode, ShowList
 
 
 EXTENSIONS = ['.mkv',
@@ -27,6 +37,41 @@ EXTENSIONS = ['.mkv',
               '.avi',
               '.m4v']
 
+_OP_OR_ED = re.compile(r'(NCOP)|(NCED)|(\sOP[0-9]+)|(\sED[0-9]+)')
+
+# Applied in order by clean_title to pull out a few common things that should
+# not be part of a title.
+# Adding detailed comments because coming back to regex after a break is confusing
+_TITLE_PIPELINE = [(re.compile(pattern), replacement) for pattern, replacement in (
+    (r'\[[^]]*\]', ''),  # Removes things between square brackets
+    (r'\([^O)]*\)', ''),  # Parenthesis
+    (r'[sS]0?1', ''),  # Remove season if its season one
+    (r'^[0-9]+\.', ''),  # Episode number at the beginning
+    (r'[eE][pP]?[0-9]+.*', ''),  # Anything after an episode number
+    (r'-?\s+[0-9v]*\s*$', ''),  # Removes trailing episode numbers
+    (r'-\s(Episode)?\s?([0-9v])+.*', ''),  # '- 08 - episode name
+    (r'[sS]0?([2-9])', r'Season \1'),  # Replace S02 with Season 2
+)]
+# The first match of each named group is taken by parse_filename, the lookahead
+# lets the regex skip most characters without trying every alternative
+_DETAILS = re.compile(r"""
+    (?=[\[0-9sSvV])(?:
+      ^\[(?P<group>[^]]+)\]                                  # [Group] at the start
+    | \b(?:(?P<resolution>[0-9]{3,4})[pP]                  # 1080p
+        | [0-9]{3,4}x(?P<height>[0-9]{3,4}))\b             # 1920x1080
+    | (?<=[0-9])[vV](?P<version>[0-9]+)\b                  # 03v2
+    | \b(?:[sS]|[sS]eason\s?)0?(?P<season>[0-9]{1,2})(?=[eE\s.-]|$)  # S02, Season 2
+    )
+""", re.VERBOSE)
+PARSE_CACHE_SIZE = 1 << 16
+
+SCAN_THREADS = 8
+PARSE_CHUNK_SIZE = 256
+# Minimum seconds between progress reports
+PROGRESS_INTERVAL = 0.1
+
+Progress = Callable[[int, int], None]
+
 
 class FileManager:
     """
@@ -88,7 +133,7 @@ class FileManager:
 
         return sorted(episodes)
 
-    def traverse_directories(self, directory=None):
+    def traverse_directories(self, directory=None, progress=None):
         """
         Traverse one or more directories to locate all episodes.
         Can specify a specific directory to search, otherwise searches
@@ -97,30 +142,60 @@ class FileManager:
         Args:
             directory:
                 The directory to traverse
+            progress:
+                Called with the number of directories scanned and episodes
+                found so far, see `LibraryScanner`
         """
         if directory is None:
             folders = [Path(x) for x in self.config.get('Local Paths', [])]
         else:
             folders = [Path(directory)]
-        for folder in folders:
-            for path, dirs, files in walk(folder):  # pylint: disable=W0612
-                self.discover_episodes(path, files)
+        for show in self._scanner(folders, progress).scan().values():
+            self.series.add(show)
+
+    def rescan(self, snapshot, progress=None, directories=None):
+        """
+        Finds the video files that changed in the configured directories since
+        a snapshot was taken, see `rescan_directories`
+
+        Args:
+            snapshot:
+                The directory states of the previous scan, by path
+            progress:
+                Called with the number of directories checked and video
+                files found in changed directories so far
+            directories:
+                Only rescan these directories instead of the configured ones
+
+        Returns:
+            A RescanResult
+        """
+        return self._scanner(directories or self.dirs, progress).rescan(snapshot, self.dirs)
+
+    def parse_paths(self, paths):
+        """
+        Parses video files into episodes, see `LibraryScanner.parse`
+
+        Args:
+            paths:
+                The video file paths
+
+        Returns:
+            A list of (show title, episode) pairs
+        """
+        return self._scanner([]).parse(paths)
+
+    def _scanner(self, roots, progress=None):
+        return LibraryScanner(
+            roots, processes=self.config.get('Scanner Processes'), progress=progress
+        )
 
     def discover_episodes(self, base_path, files):
         """
         Search through a directory to find all files which have a close enough
         name to be considered a part of the same series
         """
-        op_or_ed = re.compile(r'(NCOP)|(NCED)|(\sOP[0-9]+)|(\sED[0-9]+)')
-        for file in files:
-            episode = Path(file)
-            if episode.suffix not in EXTENSIONS:
-                continue
-            if op_or_ed.search(episode.name):
-                continue
-            title = clean_title(episode.stem)
-            episode = Episode(base_path / episode)
-            episode.parse_episode_number(title)
+        for title, episode in parse_files(base_path, files):
             self.series[title].add_or_update_episode(episode)
 
     def organize_show(self, show):
@@ -152,6 +227,580 @@ class FileManager:
         
 
 
+class LibraryScanner:
+    """
+    Scans directory trees for episodes.
+
+    Directories are listed concurrently on a thread pool with `os.scandir`,
+    and file names that are not in the `parse_filename` cache are parsed in
+    batches on a process pool. `DirEntry` type
+    information is used as is, so listing a directory does not stat its
+    entries on most platforms.
+    """
+
+    def __init__(
+            self,
+            roots: Iterable[Union[str, Path]],
+            threads: int = SCAN_THREADS,
+            processes: Optional[int] = None,
+            progress: Optional[Progress] = None
+    ):
+        """
+        Initialize instance
+
+        Args:
+            roots: The directories to scan
+            threads: Number of directories listed concurrently
+            processes: Number of parser processes, None for one per CPU,
+                0 to parse on the calling thread
+            progress: Called with the number of directories scanned and
+                episodes found so far, at most every `PROGRESS_INTERVAL`
+                seconds and once when the scan finishes
+        """
+        self.roots = [Path(root) for root in roots]
+        self.threads = threads
+        self.processes = processes
+        self.progress = progress
+        self.directories = 0
+        self.episodes = 0
+        self._reported = 0.0
+        self._parser: Optional[Executor] = None
+
+    def scan(self) -> ShowList:
+        """
+        Scan the directories
+
+        Returns:
+            The shows found
+        """
+        self.directories = 0
+        self.episodes = 0
+        series = ShowList()
+        parsing = {}
+        try:
+            with ThreadPoolExecutor(self.threads, thread_name_prefix='LibraryScanner') as pool:
+                pending = {pool.submit(_list_directory, root) for root in self.roots}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in parsing:
+                            self._merge(_remember(parsing.pop(future), future.result()), series)
+                            continue
+                        path, files, subdirs = future.result()
+                        self.directories += 1
+                        pending.update(
+                            pool.submit(_list_directory, subdir) for subdir in subdirs
+                        )
+                        jobs = self._parse(path, files, series)
+                        parsing.update(jobs)
+                        pending.update(jobs)
+                    self._report()
+        finally:
+            if self._parser is not None:
+                self._parser.shutdown()
+                self._parser = None
+        self._report(force=True)
+        return series
+
+    def rescan(
+            self,
+            snapshot: Dict[Path, 'DirectoryState'],
+            mounts: Optional[Iterable[Path]] = None
+    ) -> 'RescanResult':
+        """
+        Find the video files added, removed or moved since a snapshot was taken
+
+        Directories are checked concurrently on the thread pool. Only the
+        ones whose mtime changed are listed, the subdirectories of unchanged
+        ones are taken from the snapshot. Files removed from one directory and
+        added to another with the same inode and size are moved. Snapshot
+        directories outside of the roots are left alone, so the roots can be
+        any directories known to have changed.
+
+        Roots that do not exist and mounts that are suddenly empty, e.g. a
+        network share that is not mounted, are taken to be unavailable
+        rather than removed, so the snapshot directories under them are
+        left alone as well.
+
+        Progress is reported with the number of directories checked and video
+        files found in changed directories.
+
+        Args:
+            snapshot: The directory states of the previous scan, by path
+            mounts: The library directories that are unavailable when they
+                are empty, defaults to the roots
+
+        Returns:
+            The changes, the new states of changed directories and the paths
+            of directories that no longer exist
+        """
+        self.directories = 0
+        self.episodes = 0
+        mounts = set(self.roots if mounts is None else mounts)
+        updated = {}
+        visited = set()
+        unavailable = set()
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='LibraryScanner') as pool:
+            pending = {}
+
+            def check(path):
+                if path not in visited:
+                    visited.add(path)
+                    pending[pool.submit(_check_directory, path, snapshot.get(path))] = path
+
+            for root in self.roots:
+                check(root)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    result = future.result()
+                    if result is None:
+                        visited.discard(path)
+                        if path in self.roots:
+                            unavailable.add(path)
+                        continue
+                    state, subdirs = result
+                    if path in mounts and _emptied(state, snapshot.get(path)):
+                        unavailable.add(path)
+                        continue
+                    self.directories += 1
+                    if state is not None:
+                        updated[path] = state
+                        self.episodes += len(state.files)
+                    for subdir in subdirs:
+                        check(subdir)
+                self._report()
+        self._report(force=True)
+        return _diff_snapshot(self.roots, snapshot, visited, updated, unavailable)
+
+    def parse(self, paths: Iterable[Path]) -> List[Tuple[str, Episode]]:
+        """
+        Parse video files into episodes
+
+        File names parsed before are taken from the `parse_filename` cache of
+        this process. The rest are parsed on the process pool when there are
+        more than `PARSE_CHUNK_SIZE` of them, so it is worth starting, and
+        their results are added to the cache.
+
+        Args:
+            paths: The video file paths
+
+        Returns:
+            A list of (show title, episode) pairs
+        """
+        directories = {}
+        for path in paths:
+            directories.setdefault(path.parent, []).append(path.name)
+        episodes = []
+        misses = []
+        for path, files in directories.items():
+            cached, names = _split_cached(path, files)
+            episodes.extend(cached)
+            misses.extend(names)
+        if self.processes == 0 or len(misses) <= PARSE_CHUNK_SIZE:
+            episodes.extend(_episode(path, name, parse_filename(name)) for path, name in misses)
+            return episodes
+        with ProcessPoolExecutor(self.processes) as parser:
+            jobs = _submit_names(parser, misses)
+            for future, chunk in jobs.items():
+                episodes.extend(_remember(chunk, future.result()))
+        return episodes
+
+    def _parse(
+            self,
+            path: Path,
+            files: List[str],
+            series: ShowList
+    ) -> Dict[Future, List[Tuple[Path, str]]]:
+        if self.processes == 0:
+            self._merge(parse_files(path, files), series)
+            return {}
+        cached, misses = _split_cached(path, files)
+        self._merge(cached, series)
+        if not misses:
+            return {}
+        if self._parser is None:
+            # Only started once a file name is not cached
+            self._parser = ProcessPoolExecutor(self.processes)
+        return _submit_names(self._parser, misses)
+
+    def _merge(self, episodes: List[Tuple[str, Episode]], series: ShowList):
+        for title, episode in episodes:
+            series[title].add_or_update_episode(episode)
+        self.episodes += len(episodes)
+
+    def _report(self, force=False):
+        now = monotonic()
+        if self.progress is not None and (force or now - self._reported >= PROGRESS_INTERVAL):
+            self._reported = now
+            self.progress(self.directories, self.episodes)
+
+
+def _list_directory(path: Path) -> Tuple[Path, List[str], List[Path]]:
+    """
+    List the video files and subdirectories of a directory
+
+    Like `os.walk`, symbolic links to directories are not followed and
+    unreadable directories are skipped.
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if not entry.is_symlink():
+                        subdirs.append(Path(entry.path))
+                elif os.path.splitext(entry.name)[1] in EXTENSIONS:
+                    files.append(entry.name)
+    except OSError:
+        pass
+    return path, files, subdirs
+
+
+class FileEntry(NamedTuple):
+    """A video file in a directory snapshot."""
+    name: str
+    size: int
+    mtime: int
+    inode: int
+
+
+class DirectoryState(NamedTuple):
+    """The state of a directory in a library snapshot."""
+    mtime: int
+    files: Dict[str, FileEntry]
+    subdirs: List[Path]
+
+
+class FileChange(NamedTuple):
+    """A change to a video file found by `rescan_directories`."""
+
+    class Kind(Enum):
+        """The kind of change"""
+        ADDED = 1
+        REMOVED = 2
+        MOVED = 3
+
+    kind: Kind
+    path: Path
+    old_path: Optional[Path] = None
+
+
+class RescanResult(NamedTuple):
+    """The result of `rescan_directories`."""
+    changes: List[FileChange]
+    updated: Dict[Path, DirectoryState]
+    removed: List[Path]
+
+
+def rescan_directories(roots, snapshot, progress=None, threads=SCAN_THREADS):
+    """
+    Find the video files added, removed or moved since a snapshot was taken,
+    see `LibraryScanner.rescan`
+
+    Args:
+        roots:
+            The directories to scan
+        snapshot:
+            The directory states of the previous scan, by path
+        progress:
+            Called with the number of directories checked and video files
+            found in changed directories so far, see `LibraryScanner`
+        threads:
+            Number of directories checked concurrently
+
+    Returns:
+        A RescanResult
+    """
+    return LibraryScanner(roots, threads, processes=0, progress=progress).rescan(snapshot)
+
+
+def _diff_snapshot(roots, snapshot, visited, updated, unavailable=()):
+    """
+    Compare the new states of the changed directories against a snapshot
+
+    Args:
+        roots: The directories that were scanned
+        snapshot: The directory states of the previous scan, by path
+        visited: The directories that still exist
+        updated: The new states of the changed directories, by path
+        unavailable: The directories whose snapshot directories are kept
+
+    Returns:
+        A RescanResult
+    """
+    roots = set(roots)
+    unavailable = set(unavailable)
+    removed = []
+    for path in snapshot:
+        ancestors = {path, *path.parents}
+        if path not in visited and roots & ancestors and not unavailable & ancestors:
+            removed.append(path)
+    old_files = {
+        path / entry.name: entry
+        for path in chain(updated, removed) if path in snapshot
+        for entry in snapshot[path].files.values()
+    }
+    new_files = {
+        path / entry.name: entry
+        for path, state in updated.items()
+        for entry in state.files.values()
+    }
+    added = {path: entry for path, entry in new_files.items() if path not in old_files}
+    gone = {path: entry for path, entry in old_files.items() if path not in new_files}
+
+    changes = []
+    moved_from = {(entry.inode, entry.size): path for path, entry in gone.items()}
+    for path, entry in added.items():
+        old_path = moved_from.pop((entry.inode, entry.size), None)
+        if old_path is None:
+            changes.append(FileChange(FileChange.Kind.ADDED, path))
+        else:
+            del gone[old_path]
+            changes.append(FileChange(FileChange.Kind.MOVED, path, old_path))
+    changes.extend(FileChange(FileChange.Kind.REMOVED, path) for path in gone)
+    return RescanResult(changes, updated, removed)
+
+
+def _emptied(state, known):
+    """
+    Check if a directory that had entries in the snapshot is now empty
+
+    Args:
+        state: The new state of the directory, None if it did not change
+        known: The snapshot state of the directory, None if it is new
+
+    Returns:
+        True if all entries of the directory are gone
+    """
+    if state is None or known is None or state.files or state.subdirs:
+        return False
+    return bool(known.files or known.subdirs)
+
+
+def _check_directory(path, known):
+    """
+    Check a directory against its snapshot state
+
+    Returns:
+        None if the directory does not exist, otherwise the new state of the
+        directory, None if it did not change, and its subdirectories
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if known is not None and known.mtime == mtime:
+        return None, known.subdirs
+    state = _snapshot_directory(path, mtime)
+    return state, state.subdirs
+
+
+def _snapshot_directory(path, mtime):
+    files = {}
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(Path(entry.path))
+                    elif os.path.splitext(entry.name)[1] in EXTENSIONS:
+                        stat = entry.stat()
+                        files[entry.name] = FileEntry(
+                            entry.name, stat.st_size, stat.st_mtime_ns, stat.st_ino
+                        )
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return DirectoryState(mtime, files, subdirs)
+
+
+def parse_files(base_path, files):
+    """
+    Parse the video files in a directory into episodes
+
+    Args:
+        base_path:
+            The directory containing the files
+        files:
+            The file names
+
+    Returns:
+        A list of (show title, episode) pairs
+    """
+    base_path = Path(base_path)
+    return [_episode(base_path, name, parse_filename(name)) for name in _episode_files(files)]
+
+
+def _episode_files(files):
+    """The names of the video files that are episodes, not openings or endings."""
+    return [
+        name for name in files
+        if os.path.splitext(name)[1] in EXTENSIONS and not _OP_OR_ED.search(name)
+    ]
+
+
+def _episode(base_path, name, parsed):
+    return parsed.title, Episode(base_path / name, number=parsed.episode)
+
+
+def _split_cached(base_path, files):
+    """
+    Parse the video files in a directory whose names are in the parse cache
+
+    Returns:
+        The (show title, episode) pairs of the cached names and the
+        (directory, name) pairs of the names still to parse
+    """
+    episodes = []
+    misses = []
+    for name in _episode_files(files):
+        parsed = _cached_filename(name)
+        if parsed is None:
+            misses.append((base_path, name))
+        else:
+            episodes.append(_episode(base_path, name, parsed))
+    return episodes, misses
+
+
+def _submit_names(parser, names):
+    """
+    Parse (directory, file name) pairs on a process pool in chunks
+
+    Returns:
+        The chunks by the future of their `parse_filenames` call
+    """
+    jobs = {}
+    for start in range(0, len(names), PARSE_CHUNK_SIZE):
+        chunk = names[start:start + PARSE_CHUNK_SIZE]
+        jobs[parser.submit(parse_filenames, [name for _, name in chunk])] = chunk
+    return jobs
+
+
+def _remember(names, parsed):
+    """
+    Add file names parsed in another process to the parse cache
+
+    Args:
+        names: The (directory, file name) pairs
+        parsed: The ParsedFilename of each name
+
+    Returns:
+        A list of (show title, episode) pairs
+    """
+    episodes = []
+    for (base_path, name), details in zip(names, parsed):
+        _cache_filename(name, details)
+        episodes.append(_episode(base_path, name, details))
+    return episodes
+
+
+def parse_filenames(names):
+    """
+    Parse video file names, see `parse_filename`
+
+    Args:
+        names:
+            The file names
+
+    Returns:
+        A list of ParsedFilename, in the same order as the names
+    """
+    return [parse_filename(name) for name in names]
+
+
+class ParsedFilename(NamedTuple):
+    """The parts of a video file name found by `parse_filename`."""
+    title: str
+    season: Optional[int] = None
+    episode: Optional[int] = None
+    group: Optional[str] = None
+    resolution: Optional[int] = None
+    version: Optional[int] = None
+
+
+_PARSE_CACHE: 'OrderedDict[str, ParsedFilename]' = OrderedDict()
+_PARSE_CACHE_LOCK = Lock()
+
+
+def parse_filename(name):
+    """
+    Parse a video file name into the show title and the episode details
+
+    The episode number is found the same way as `Episode.parse_episode_number`
+    and the rest of the details are found in a single pass over the name.
+    Results are kept for the last `PARSE_CACHE_SIZE` names, file names parsed
+    on a `LibraryScanner` process pool are added to the cache of the process
+    that started it.
+
+    Args:
+        name:
+            The file name, including the extension
+
+    Returns:
+        A ParsedFilename, the details that are not in the name are None
+    """
+    parsed = _cached_filename(name)
+    if parsed is None:
+        parsed = _parse_filename(name)
+        _cache_filename(name, parsed)
+    return parsed
+
+
+def clear_parse_cache():
+    """Forget the file names parsed so far."""
+    with _PARSE_CACHE_LOCK:
+        _PARSE_CACHE.clear()
+
+
+def _cached_filename(name):
+    # Single OrderedDict calls are atomic, so hits skip the lock, which is
+    # most of the time of a rescan where every name is cached
+    parsed = _PARSE_CACHE.get(name)
+    if parsed is not None:
+        try:
+            _PARSE_CACHE.move_to_end(name)
+        except KeyError:
+            pass
+    return parsed
+
+
+def _cache_filename(name, parsed):
+    with _PARSE_CACHE_LOCK:
+        _PARSE_CACHE[name] = parsed
+        _PARSE_CACHE.move_to_end(name)
+        if len(_PARSE_CACHE) > PARSE_CACHE_SIZE:
+            _PARSE_CACHE.popitem(last=False)
+
+
+def _parse_filename(name):
+    stem = _separate(os.path.splitext(name)[0])
+    title = _clean_separated(stem)
+    number = EPISODE_NUMBER.search(name.replace(title, ''))
+    details = {}
+    for match in _DETAILS.finditer(stem):
+        kind = match.lastgroup
+        if kind not in details:
+            details[kind] = match[kind]
+    return ParsedFilename(
+        title,
+        season=_int(details.get('season')),
+        episode=_int(number and number[0]),
+        group=details.get('group'),
+        resolution=_int(details.get('resolution') or details.get('height')),
+        version=_int(details.get('version')),
+    )
+
+
 def clean_title(title):
     """
     Removes things from a file name that are not part of the title
@@ -163,19 +812,21 @@ def clean_title(title):
     Returns:
         The title of the series without extra things
     """
-    # pull out a few common things that should not be part of a title
-    # Adding detailed comments because coming back to regex after a break is confusing
-    title = re.sub(r'[_,]', ' ', title)
-    title = re.sub(r'\[[^]]*\]', '', title)  # Removes things between square brackets
-    title = re.sub(r'\([^O)]*\)', '', title)  # Parenthesis
-    title = re.sub(r'[sS]0?1', '', title)  # Remove season if its season one
-    title = re.sub(r'^[0-9]+\.', '', title)  # Episode number at the beginning
-    title = re.sub(r'[eE][pP]?[0-9]+.*', '', title)  # Anything after an episode number
-    title = re.sub(r'-?\s+[0-9v]*\s*$', '', title)  # Removes trailing episode numbers
-    title = re.sub(r'-\s(Episode)?\s?([0-9v])+.*', '', title)  # '- 08 - episode name
-    title = re.sub(r'[sS]0?([2-9])', r'Season \1', title)  # Replace S02 with Season 2
-    title = title.strip()
-    return title
+    return _clean_separated(_separate(title))
+
+
+def _clean_separated(title):
+    for pattern, replacement in _TITLE_PIPELINE:
+        title = pattern.sub(replacement, title)
+    return title.strip()
+
+
+def _separate(title):
+    return title.replace('_', ' ').replace(',', ' ')
+
+
+def _int(value):
+    return None if value is None else int(value)
 
 
 def _build_regex(name):
@@ -1,5 +1,16 @@
 """ This module handles persistence of data to the database """
-from .models import ShowModel, EpisodeModel, EneDatabase
+import operator
+import os
+from functools import reduce
+from pathlib import Path
+
+from peewee import chunked
+
+from ene.entities import Episode, Show
+from .models import DirectoryModel, EneDatabase, EpisodeModel, FileEntryModel, ShowModel
+
+# Rows per statement, keeps the number of SQL variables under SQLite's limit
+BATCH_SIZE = 100
 
 
 class ShowDataAccess:
@@ -9,26 +20,62 @@ class ShowDataAccess:
     def __init__(self):
         self.database = None
 
-    def init_db(self, db_path):
+    def init_db(self, db_path, pragmas=None):
         """
         Creates a connection to the SQLite database
         Args:
             db_path:
                 The path that contains the database file
+            pragmas:
+                Pragmas to set on every connection, see EneDatabase
+        """
+        self.database = EneDatabase(str(db_path / 'ene.db'), pragmas)
+
+    def connection(self):
+        """
+        Context manager giving the calling thread its own connection, see
+        EneDatabase.connection
+        """
+        return self.database.connection()
+
+    def optimize(self):
+        """
+        Runs PRAGMA optimize on the database
         """
-        self.database = EneDatabase(str(db_path / 'ene.db'))
+        self.database.optimize()
+
+    def close(self):
+        """
+        Optimizes and closes the database connection of the calling thread
+        """
+        self.database.close()
 
     @staticmethod
     def get_all_shows():
         """
-        Fetches all shows from the database
+        Fetches all shows and their episodes from the database, with one query
+        for the shows and one for all of the episodes
 
         Yields:
             Show objects from the database
         """
-        shows = ShowModel.select()
-        for show_model in shows:
-            yield show_model.to_show()
+        shows = {
+            show_id: Show(title, anilist_show_id, list_id)
+            for show_id, title, anilist_show_id, list_id in ShowModel.select(
+                ShowModel.id, ShowModel.title, ShowModel.anilist_show_id, ShowModel.list_id
+            ).tuples()
+        }
+        episodes = EpisodeModel.select(
+            EpisodeModel.id, EpisodeModel.path, EpisodeModel.number, EpisodeModel.state,
+            EpisodeModel.show
+        ).tuples()
+        for episode_id, path, number, state, show_id in episodes:
+            # Foreign keys are not enforced, so episodes can outlive their show
+            show = shows.get(show_id)
+            if show is not None:
+                episode = Episode(Path(path), Episode.State(state), number, episode_id)
+                show.episodes[episode] = episode
+        yield from shows.values()
 
     def save_show_list(self, shows):
         """
@@ -37,9 +84,97 @@ class ShowDataAccess:
             shows:
                 List of shows to save
         """
+        shows = list(shows)
+        self.save_changes(
+            ((episode, show) for show in shows for episode in show.episodes), shows
+        )
+
+    def save_changes(self, episodes, shows=()):
+        """
+        Saves episodes and shows in a single transaction, the shows of the
+        episodes are saved as well
+        Args:
+            episodes:
+                (Episode, Show it belongs to) pairs to save
+            shows:
+                Shows to save without their episodes
+        """
+        episodes = list(episodes)
+        shows = {show.title: show for show in shows}
+        for _, show in episodes:
+            shows.setdefault(show.title, show)
         with self.database.database.atomic():
-            for show in shows:
-                self.save_show(show)
+            show_ids = self._upsert_shows(list(shows.values()))
+            self._upsert_episodes([(episode, show_ids[show.title]) for episode, show in episodes])
+
+    @staticmethod
+    def _upsert_shows(shows):
+        """
+        Inserts or updates shows by title
+
+        Returns:
+            The database ids of the shows, by title
+        """
+        show_ids = {}
+        for batch in chunked(shows, BATCH_SIZE):
+            rows = [
+                {'title': show.title, 'anilist_show_id': show.show_id, 'list_id': show.list_id}
+                for show in batch
+            ]
+            ShowModel.insert_many(rows).on_conflict(
+                conflict_target=[ShowModel.title],
+                preserve=[ShowModel.anilist_show_id, ShowModel.list_id],
+            ).execute()
+            titles = [show.title for show in batch]
+            show_ids.update(
+                ShowModel.select(ShowModel.title, ShowModel.id)
+                .where(ShowModel.title.in_(titles)).tuples()
+            )
+        return show_ids
+
+    @staticmethod
+    def _upsert_episodes(episodes):
+        """
+        Updates saved episodes by id and inserts or updates new ones by path,
+        setting the ids of the new episodes
+
+        Args:
+            episodes:
+                (Episode, show database id) pairs
+        """
+        saved = []
+        new = []
+        for episode, show_id in episodes:
+            row = {
+                'path': str(episode.path),
+                'number': episode.number,
+                'show': show_id,
+                'state': episode.state.value,
+            }
+            if episode.episode_id is None:
+                new.append((episode, row))
+            else:
+                row['id'] = episode.episode_id
+                saved.append(row)
+        for batch in chunked(saved, BATCH_SIZE):
+            EpisodeModel.insert_many(batch).on_conflict(
+                conflict_target=[EpisodeModel.id],
+                preserve=[EpisodeModel.path, EpisodeModel.number, EpisodeModel.show,
+                          EpisodeModel.state],
+            ).execute()
+        for batch in chunked(new, BATCH_SIZE):
+            rows = [row for _, row in batch]
+            # A file that is already saved keeps its watch state
+            EpisodeModel.insert_many(rows).on_conflict(
+                conflict_target=[EpisodeModel.path],
+                preserve=[EpisodeModel.number, EpisodeModel.show],
+            ).execute()
+            episode_ids = dict(
+                EpisodeModel.select(EpisodeModel.path, EpisodeModel.id)
+                .where(EpisodeModel.path.in_([row['path'] for row in rows])).tuples()
+            )
+            for episode, row in batch:
+                episode.episode_id = episode_ids[row['path']]
 
     def delete_show(self, show):
         """
@@ -73,10 +208,7 @@ class ShowDataAccess:
             show:
                 The Show object to save
         """
-        show_model = ShowModel.from_show(show)
-        show_model.save()
-        for episode in show.episodes:
-            self.save_episode(episode, show_model)
+        self.save_show_list([show])
 
     @staticmethod
     def get_show_from_episode(episode):
@@ -96,3 +228,89 @@ class ShowDataAccess:
         episode_model = EpisodeModel.from_episode(episode, parent_show)
         episode_model.save()
         episode.episode_id = episode_model.id
+
+    @staticmethod
+    def delete_episodes(episodes):
+        """
+        Deletes the given episodes from the database
+        Args:
+            episodes:
+                The Episode objects to delete
+        """
+        ids = [episode.episode_id for episode in episodes if episode.episode_id is not None]
+        for batch in chunked(ids, BATCH_SIZE):
+            EpisodeModel.delete().where(EpisodeModel.id.in_(batch)).execute()
+
+    @staticmethod
+    def load_snapshot(directories=None):
+        """
+        Loads the library snapshot of the last scan
+
+        Args:
+            directories:
+                Only load these directories and their subdirectories
+
+        Returns:
+            The DirectoryState of each scanned directory, by path
+        """
+        query = DirectoryModel.select()
+        if directories:
+            query = query.where(reduce(operator.or_, map(_directory_tree, directories)))
+        files = {}
+        entries = FileEntryModel.select().where(
+            FileEntryModel.directory.in_(query.select(DirectoryModel.id))
+        )
+        for entry in entries:
+            files.setdefault(entry.directory_id, {})[entry.name] = entry.to_entry()
+        return {
+            Path(directory.path): directory.to_state(files.get(directory.id, {}))
+            for directory in query
+        }
+
+    @staticmethod
+    def load_directories():
+        """
+        Loads the paths of the directories in the library snapshot
+
+        Returns:
+            A list of directory paths
+        """
+        return [Path(directory.path) for directory in DirectoryModel.select(DirectoryModel.path)]
+
+    def save_snapshot(self, updated, removed):
+        """
+        Updates the library snapshot with the result of a scan
+        Args:
+            updated:
+                The new DirectoryState of changed directories, by path
+            removed:
+                The paths of directories that no longer exist
+        """
+        paths = [str(path) for path in updated] + [str(path) for path in removed]
+        with self.database.database.atomic():
+            for batch in chunked(paths, BATCH_SIZE):
+                directories = DirectoryModel.select(DirectoryModel.id) \
+                    .where(DirectoryModel.path.in_(batch))
+                FileEntryModel.delete().where(FileEntryModel.directory.in_(directories)).execute()
+                DirectoryModel.delete().where(DirectoryModel.path.in_(batch)).execute()
+            for path, state in updated.items():
+                directory = DirectoryModel.from_state(path, state)
+                directory.save()
+                rows = [
+                    {
+                        'directory': directory.id,
+                        'name': entry.name,
+                        'size': entry.size,
+                        'mtime': entry.mtime,
+                        'inode': entry.inode,
+                    }
+                    for entry in state.files.values()
+                ]
+                for batch in chunked(rows, BATCH_SIZE):
+                    FileEntryModel.insert_many(batch).execute()
+
+
+def _directory_tree(path):
+    """Condition matching a directory and all of its subdirectories"""
+    subdirs = DirectoryModel.path.startswith(os.path.join(str(path), ''))
+    return (DirectoryModel.path == str(path)) | subdirs
@@ -0,0 +1,115 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module handles schema migrations of the Ene database."""
+import sqlite3
+from typing import Callable, Iterable, List, Type
+
+from peewee import Model, SqliteDatabase
+
+from ene.errors import DatabaseError
+
+Migration = Callable[[SqliteDatabase], None]
+
+# Saving shows and episodes uses upserts (INSERT ... ON CONFLICT), which
+# SQLite supports since 3.24
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+
+def _index_episodes(database: SqliteDatabase):
+    """Makes episode paths unique and indexes the commonly queried columns"""
+    # Keep the most watched copy of each episode, the oldest one on a tie
+    database.execute_sql('''
+        DELETE FROM "Episode" WHERE EXISTS (
+            SELECT 1 FROM "Episode" AS "kept"
+            WHERE "kept"."path" = "Episode"."path" AND (
+                "kept"."state" > "Episode"."state"
+                OR ("kept"."state" = "Episode"."state" AND "kept"."id" < "Episode"."id")
+            )
+        )
+    ''')
+    for statement in (
+            'CREATE UNIQUE INDEX IF NOT EXISTS "episodemodel_path" ON "Episode" ("path")',
+            'CREATE INDEX IF NOT EXISTS "episodemodel_show_id" ON "Episode" ("show_id")',
+            'CREATE INDEX IF NOT EXISTS "episodemodel_state" ON "Episode" ("state")',
+            'CREATE INDEX IF NOT EXISTS "showmodel_anilist_show_id" ON "Show" ("anilist_show_id")',
+    ):
+        database.execute_sql(statement)
+
+
+# The migration to version n of the schema is MIGRATIONS[n - 1], append new
+# migrations to the end and update the models to match
+MIGRATIONS: List[Migration] = [
+    _index_episodes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def check_sqlite_version(version=sqlite3.sqlite_version_info):
+    """
+    Checks that the SQLite library Python was built with is new enough
+
+    Args:
+        version: The SQLite version, defaults to the one in use
+
+    Raises:
+        DatabaseError if it is older than MIN_SQLITE_VERSION
+    """
+    if tuple(version) < MIN_SQLITE_VERSION:
+        raise DatabaseError(
+            f'SQLite {".".join(map(str, MIN_SQLITE_VERSION))} or newer is required, '
+            f'found {".".join(map(str, version))}'
+        )
+
+
+def schema_version(database: SqliteDatabase) -> int:
+    """
+    Gets the schema version of a database
+
+    Args:
+        database: The database
+
+    Returns:
+        The version stored in the database's user_version pragma
+    """
+    return database.pragma('user_version')
+
+
+def migrate(database: SqliteDatabase, models: Iterable[Type[Model]]):
+    """
+    Brings the schema of a database up to date
+
+    A new database gets the tables of the models and the latest version.
+    Otherwise each migration after the database's version is applied in its
+    own transaction, together with storing the new version, and tables that
+    are still missing are created.
+
+    Args:
+        database: The connected database
+        models: All of the models stored in the database
+    """
+    models = list(models)
+    if not any(database.table_exists(model._meta.table_name) for model in models):
+        with database.atomic():
+            database.create_tables(models)
+            database.pragma('user_version', SCHEMA_VERSION)
+        return
+    current = schema_version(database)
+    for version, migration in enumerate(MIGRATIONS[current:], current + 1):
+        with database.atomic():
+            migration(database)
+            database.pragma('user_version', version)
+    database.create_tables(models)
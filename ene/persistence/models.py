@@ -15,30 +15,85 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """This module handles data persistence models."""
+import json
+from contextlib import contextmanager
 from pathlib import Path
 from peewee import Model, SqliteDatabase, TextField, IntegerField, ForeignKeyField
 
 from ene.entities import Show, Episode
+from ene.files import DirectoryState, FileEntry
+from .migrations import check_sqlite_version, migrate
 
-db = SqliteDatabase(None)
+# Connections are per thread, each one gets the pragmas passed to init
+db = SqliteDatabase(None, thread_safe=True)
+
+# Applied to every connection, can be overridden with the 'Database Pragmas'
+# config option. WAL lets the UI read while a worker thread writes, and with
+# WAL a NORMAL sync is still safe from corruption.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -16 * 1024,  # In KiB when negative
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+# Seconds to wait for another connection's write lock
+BUSY_TIMEOUT = 10
 
 
 class EneDatabase:
     """
     Contains information about the Ene SQLite database
     """
-    def __init__(self, path):
+    def __init__(self, path, pragmas=None):
         """
-        Initializes the Ene database, creating any tables as needed
+        Initializes the Ene database, creating or migrating the tables as needed
 
         Args:
             path:
                 The path where the Sqlite database file resides
+            pragmas:
+                Pragmas to set on every connection in addition to, or
+                instead of, DEFAULT_PRAGMAS
+
+        Raises:
+            DatabaseError if the SQLite library is too old, see MIN_SQLITE_VERSION
         """
+        check_sqlite_version()
         self.database = db
-        db.init(path)
+        db.init(path, pragmas={**DEFAULT_PRAGMAS, **(pragmas or {})}, timeout=BUSY_TIMEOUT)
         db.connect()
-        db.create_tables([ShowModel, EpisodeModel])
+        migrate(db, [ShowModel, EpisodeModel, DirectoryModel, FileEntryModel])
+
+    @staticmethod
+    @contextmanager
+    def connection():
+        """
+        Context manager giving the calling thread its own connection, which is
+        closed at the end unless the thread already had one open
+        """
+        opened = db.connect(reuse_if_open=True)
+        try:
+            yield
+        finally:
+            if opened:
+                db.close()
+
+    @staticmethod
+    def optimize():
+        """
+        Lets SQLite refresh the statistics the query planner uses, cheap when
+        there is nothing to do so it can be called periodically
+        """
+        db.execute_sql('PRAGMA optimize')
+
+    def close(self):
+        """
+        Optimizes and closes the connection of the calling thread
+        """
+        if not db.is_closed():
+            self.optimize()
+            db.close()
 
 
 def table_name(table):
@@ -71,7 +126,7 @@ class ShowModel(BaseModel):
     Model representing a Show in the database
     """
     title = TextField(unique=True)
-    anilist_show_id = IntegerField(null=True)
+    anilist_show_id = IntegerField(null=True, index=True)
     list_id = IntegerField(null=True)
 
     @classmethod
@@ -112,10 +167,10 @@ class ShowModel(BaseModel):
 
 class EpisodeModel(BaseModel):
     """ Model representing an Episode in the database"""
-    path = TextField()
+    path = TextField(unique=True)
     number = IntegerField(null=True)
     show = ForeignKeyField(ShowModel, backref='show_id')
-    state = IntegerField()
+    state = IntegerField(index=True)
 
     @classmethod
     def from_episode(cls, episode: Episode, show: ShowModel):
@@ -142,3 +197,63 @@ class EpisodeModel(BaseModel):
             The new Episode object represented by this model
         """
         return Episode(Path(self.path), Episode.State(self.state), self.number, self.get_id())
+
+
+class DirectoryModel(BaseModel):
+    """
+    Model representing a library directory as of the last scan
+    """
+    path = TextField(unique=True)
+    mtime = IntegerField()
+    # JSON list of the names of the subdirectories
+    subdirs = TextField()
+
+    @classmethod
+    def from_state(cls, path: Path, state: DirectoryState):
+        """
+        Create a new DirectoryModel from the given directory state
+
+        Args:
+            path:
+                The directory path
+            state:
+                The state of the directory
+
+        Returns:
+            The newly created DirectoryModel object
+        """
+        subdirs = json.dumps([subdir.name for subdir in state.subdirs])
+        return cls(path=str(path), mtime=state.mtime, subdirs=subdirs)
+
+    def to_state(self, files):
+        """
+        Convert this model to a DirectoryState
+
+        Args:
+            files:
+                The FileEntry objects of the directory, by name
+
+        Returns:
+            The DirectoryState represented by this model
+        """
+        path = Path(self.path)
+        subdirs = [path / name for name in json.loads(self.subdirs)]
+        return DirectoryState(self.mtime, files, subdirs)
+
+
+class FileEntryModel(BaseModel):
+    """ Model representing a video file in a library directory as of the last scan"""
+    directory = ForeignKeyField(DirectoryModel, backref='files')
+    name = TextField()
+    size = IntegerField()
+    mtime = IntegerField()
+    inode = IntegerField()
+
+    def to_entry(self):
+        """
+        Convert this model into a FileEntry
+
+        Returns:
+            The FileEntry represented by this model
+        """
+        return FileEntry(self.name, self.size, self.mtime, self.inode)
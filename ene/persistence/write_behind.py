@@ -0,0 +1,208 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module contains the write-behind queue for show and episode changes."""
+import logging
+from threading import Condition, Thread
+from typing import Dict, Optional, Tuple
+
+from ene.entities import Episode, Show
+from .data_access import ShowDataAccess
+
+# Seconds changes are collected before they are written
+FLUSH_INTERVAL = 1.0
+# Number of pending rows that triggers a write without waiting
+MAX_PENDING = 500
+# Failed attempts at a batch before it is saved row by row, dropping bad rows
+MAX_RETRIES = 3
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Writes show and episode changes to the database on a background thread.
+
+    Changes are collected for `interval` seconds, repeated changes to the same
+    row are coalesced into one write of its latest state, and each batch is
+    saved in a single transaction with the worker thread's own connection.
+    A batch that fails is kept and retried after `interval` seconds, after
+    `MAX_RETRIES` failures its rows are saved one at a time and the ones that
+    still fail are logged and dropped.
+    """
+
+    def __init__(
+            self,
+            access: ShowDataAccess,
+            interval: float = FLUSH_INTERVAL,
+            max_pending: int = MAX_PENDING
+    ):
+        """
+        Initialize instance and start the worker thread
+
+        Args:
+            access: The data access of an initialized database
+            interval: Seconds to collect changes before writing them
+            max_pending: Number of pending rows that triggers a write right away
+        """
+        self.access = access
+        self.interval = interval
+        self.max_pending = max_pending
+        self._condition = Condition()
+        self._episodes: Dict[object, Tuple[Episode, Show]] = {}
+        self._shows: Dict[str, Show] = {}
+        self._queued = 0
+        self._written = 0
+        self._flushing = False
+        self._closed = False
+        self._failures = 0
+        self._thread = Thread(target=self._run, name='WriteBehind', daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of rows waiting to be written."""
+        with self._condition:
+            return len(self._episodes) + len(self._shows)
+
+    def save_episode(self, episode: Episode, show: Show):
+        """
+        Queue an episode to be saved
+
+        Args:
+            episode: The episode
+            show: The show the episode belongs to
+        """
+        key = episode.episode_id if episode.episode_id is not None else episode.path
+        with self._condition:
+            self._episodes[key] = episode, show
+            self._changed()
+
+    def save_show(self, show: Show):
+        """
+        Queue a show and all of its episodes to be saved
+
+        Args:
+            show: The show
+        """
+        with self._condition:
+            self._shows[show.title] = show
+            for episode in show.episodes:
+                key = episode.episode_id if episode.episode_id is not None else episode.path
+                self._episodes[key] = episode, show
+            self._changed()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Write the queued changes now and wait until they are saved
+
+        Args:
+            timeout: Seconds to wait at most, None to wait until saved
+
+        Returns:
+            True if the changes were saved before the timeout
+        """
+        with self._condition:
+            target = self._queued
+            if self._episodes or self._shows:
+                self._flushing = True
+                self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Write the queued changes and stop the worker thread
+
+        Args:
+            timeout: Seconds to wait at most, None to wait until saved
+
+        Returns:
+            True if all changes were saved before the timeout
+        """
+        saved = self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        return saved
+
+    def _changed(self):
+        self._queued += 1
+        if len(self._episodes) + len(self._shows) >= self.max_pending:
+            self._flushing = True
+        self._condition.notify_all()
+
+    def _take(self):
+        """Waits for a batch of changes, None when closed"""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._episodes or self._shows or self._closed
+            )
+            if self._closed:
+                return None
+            self._condition.wait_for(lambda: self._flushing or self._closed, self.interval)
+            batch = self._episodes, self._shows, self._queued
+            self._episodes, self._shows = {}, {}
+            self._flushing = False
+            return batch
+
+    def _run(self):
+        with self.access.connection():
+            while True:
+                batch = self._take()
+                if batch is None:
+                    break
+                episodes, shows, queued = batch
+                if self._failures >= MAX_RETRIES:
+                    self._save_rows(episodes, shows)
+                else:
+                    try:
+                        self.access.save_changes(episodes.values(), shows.values())
+                    except Exception:  # pylint: disable=broad-except
+                        self._failures += 1
+                        log.warning(
+                            'Saving %d changes failed, attempt %d of %d',
+                            len(episodes) + len(shows), self._failures, MAX_RETRIES,
+                            exc_info=True
+                        )
+                        self._retry(episodes, shows)
+                        continue
+                self._failures = 0
+                with self._condition:
+                    self._written = queued
+                    self._condition.notify_all()
+        if self._episodes or self._shows:
+            log.warning(
+                'Closed with %d unsaved changes', len(self._episodes) + len(self._shows)
+            )
+
+    def _save_rows(self, episodes, shows):
+        """Saves the rows of a failing batch one at a time, dropping the ones that fail"""
+        rows = [((episode,), ()) for episode in episodes.values()]
+        rows.extend(((), (show,)) for show in shows.values())
+        for row_episodes, row_shows in rows:
+            try:
+                self.access.save_changes(row_episodes, row_shows)
+            except Exception:  # pylint: disable=broad-except
+                row = row_episodes[0][0].path if row_episodes else row_shows[0].title
+                log.error('Dropped unsaveable change to %s', row, exc_info=True)
+
+    def _retry(self, episodes, shows):
+        with self._condition:
+            # Changes queued since the batch was taken are newer
+            self._episodes = {**episodes, **self._episodes}
+            self._shows = {**shows, **self._shows}
+            self._condition.wait_for(lambda: self._closed, self.interval)
@@ -0,0 +1,141 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the search index for show titles."""
+import re
+from collections import defaultdict
+from typing import Dict, Hashable, Optional, Set
+
+GRAM_SIZE = 3
+
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize text for searching
+
+    Args:
+        text: The text
+
+    Returns:
+        The text case folded, with runs of punctuation and whitespace as single spaces
+    """
+    return ' '.join(_SEPARATORS.sub(' ', text.casefold()).split())
+
+
+def grams(text: str, size: int = GRAM_SIZE) -> Set[str]:
+    """
+    Get the n-grams of a text, or the text itself if it is shorter
+
+    Args:
+        text: Normalized text
+        size: Length of the n-grams
+
+    Returns:
+        The n-grams
+    """
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SearchIndex:
+    """
+    Substring search over titles using an n-gram index.
+
+    Every n-gram of up to `GRAM_SIZE` characters of the normalized titles is
+    indexed, so a query only checks the titles sharing all of its n-grams.
+    A query that extends the previous one only checks the previous results.
+    """
+
+    def __init__(self):
+        self._titles: Dict[Hashable, str] = {}
+        self._grams: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._last_query = None
+        self._last_result: Set[Hashable] = set()
+
+    def __len__(self):
+        return len(self._titles)
+
+    def __contains__(self, key):
+        return key in self._titles
+
+    def add(self, key: Hashable, title: str):
+        """
+        Add a title to the index, replacing the title of the key if any
+
+        Args:
+            key: The key returned by `search` for the title
+            title: The title
+        """
+        self.remove(key)
+        text = normalize(title)
+        self._titles[key] = text
+        for size in range(1, GRAM_SIZE + 1):
+            for gram in grams(text, size):
+                self._grams[gram].add(key)
+        self._last_query = None
+
+    def remove(self, key: Hashable):
+        """
+        Remove a title from the index
+
+        Args:
+            key: The key of the title
+        """
+        text = self._titles.pop(key, None)
+        if text is None:
+            return
+        for size in range(1, GRAM_SIZE + 1):
+            for gram in grams(text, size):
+                keys = self._grams[gram]
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+        self._last_result.discard(key)
+
+    def search(self, query: str) -> Optional[Set[Hashable]]:
+        """
+        Find the titles containing a query, ignoring case and punctuation
+
+        Args:
+            query: The search query
+
+        Returns:
+            Keys of the matching titles, None if the query is empty
+        """
+        query = normalize(query)
+        if not query:
+            self._last_query = None
+            return None
+        if self._last_query is not None and self._last_query in query:
+            candidates = self._last_result
+        elif len(query) <= GRAM_SIZE:
+            # The query is indexed as is, no need to check the candidates
+            candidates = None
+            result = set(self._grams.get(query, ()))
+        else:
+            postings = sorted(
+                (self._grams.get(gram, set()) for gram in grams(query)), key=len
+            )
+            candidates = set.intersection(*postings) if postings[0] else set()
+        if candidates is not None:
+            result = {key for key in candidates if query in self._titles[key]}
+        self._last_query = query
+        self._last_result = result
+        return set(result)
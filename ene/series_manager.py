@@ -1,7 +1,19 @@
 """ This module handles interactions with Show and Episode objects """
+from typing import List, NamedTuple, Tuple
+
 from ene.persistence.data_access import ShowDataAccess
-from ene.entities import ShowList
-from ene.files import FileManager
+from ene.persistence.write_behind import WriteBehindQueue
+from ene.entities import Episode, ShowList
+from ene.files import FileChange, FileManager, RescanResult
+
+# Seconds to wait at most for queued changes to be saved
+WRITE_TIMEOUT = 10
+
+
+class LibraryUpdate(NamedTuple):
+    """Video file changes found by `SeriesManager.scan_files`."""
+    result: RescanResult
+    parsed: List[Tuple[str, Episode]]
 
 
 class SeriesManager:
@@ -11,6 +23,7 @@ class SeriesManager:
     def __init__(self, config):
         self._series = ShowList()
         self._db = None
+        self._writer = None
         self._config = config
 
     def init_db(self, data_home):
@@ -22,7 +35,35 @@ class SeriesManager:
                 Path to the SQLite database
         """
         self._db = ShowDataAccess()
-        self._db.init_db(data_home)
+        self._db.init_db(data_home, self._config.get('Database Pragmas'))
+        self._writer = WriteBehindQueue(self._db)
+
+    def db_connection(self):
+        """
+        Context manager giving the calling thread its own database connection
+        for the duration, wrap any use of the series manager from the thread pool
+
+        Returns:
+            The connection context manager
+        """
+        return self._db.connection()
+
+    def optimize_db(self):
+        """
+        Lets the database refresh its query planner statistics
+        """
+        with self.db_connection():
+            self._db.optimize()
+
+    def close_db(self):
+        """
+        Writes the queued changes, then optimizes and closes the database
+        connection of the calling thread
+        """
+        if self._writer is not None:
+            self._writer.close(WRITE_TIMEOUT)
+        if self._db is not None:
+            self._db.close()
 
     def get_shows_overview(self):
         """
@@ -66,16 +107,133 @@ class SeriesManager:
         for res in self._db.get_all_shows():
             self._series.add(res)
 
-    def fetch_shows_from_files(self):
+    def fetch_shows_from_files(self, progress=None):
         """
         Fetches all shows from the configured file paths and adds them to
         the series list
+
+        Args:
+            progress:
+                Called with the number of directories scanned and episodes found so far
         """
         file_manager = FileManager(self._config)
-        file_manager.traverse_directories()
+        file_manager.traverse_directories(progress=progress)
         for show in file_manager.series.values():
             self._series.add(show)
 
+    def refresh_from_files(self, progress=None, directories=None):
+        """
+        Updates the series list and the database with the video files added,
+        removed or moved since the last refresh, see `scan_files`, `apply_files`
+        and `save_files` for doing this across threads
+
+        Args:
+            progress:
+                Called with the number of directories checked and video files
+                found in changed directories so far
+            directories:
+                Only look for changes in these directories instead of all
+                configured paths
+
+        Returns:
+            The list of FileChange objects that were applied
+        """
+        update = self.scan_files(progress, directories)
+        self.save_files(update, self.apply_files(update))
+        return update.result.changes
+
+    def scan_files(self, progress=None, directories=None):
+        """
+        Finds the video files added, removed or moved since the last refresh
+        and parses the new ones, without touching the series list, so it can
+        run on the thread pool
+
+        Args:
+            progress:
+                Called with the number of directories checked and video files
+                found in changed directories so far
+            directories:
+                Only look for changes in these directories instead of all
+                configured paths
+
+        Returns:
+            A LibraryUpdate to pass to `apply_files`
+        """
+        file_manager = FileManager(self._config)
+        snapshot = self._db.load_snapshot(directories)
+        result = file_manager.rescan(snapshot, progress, directories)
+        # Moved files are parsed too, in case the file they were moved from is not known
+        paths = [change.path for change in result.changes
+                 if change.kind is not FileChange.Kind.REMOVED]
+        return LibraryUpdate(result, file_manager.parse_paths(paths))
+
+    def apply_files(self, update):
+        """
+        Applies the changes found by `scan_files` to the series list and
+        queues the changed episodes to be saved. Must run on the thread that
+        owns the series list
+
+        Args:
+            update:
+                The LibraryUpdate to apply
+
+        Returns:
+            The list of removed episodes to pass to `save_files`
+        """
+        episodes = {
+            episode.path: (show, episode)
+            for show in self._series.values() for episode in show.episodes
+        }
+        parsed = {episode.path: (title, episode) for title, episode in update.parsed}
+        removed = []
+        for change in update.result.changes:
+            if change.kind is FileChange.Kind.REMOVED:
+                if change.path in episodes:
+                    show, episode = episodes.pop(change.path)
+                    del show.episodes[episode]
+                    removed.append(episode)
+                continue
+            if change.kind is FileChange.Kind.MOVED and change.old_path in episodes:
+                show, episode = episodes.pop(change.old_path)
+                del show.episodes[episode]
+                episode.path = change.path
+                episode.name = change.path.name
+                show.episodes[episode] = episode
+            elif change.path in parsed:
+                title, episode = parsed[change.path]
+                show = self._series[title]
+                show.add_or_update_episode(episode)
+                episode = show.episodes[episode]
+            else:
+                continue
+            self._writer.save_episode(episode, show)
+        return removed
+
+    def save_files(self, update, removed):
+        """
+        Saves the queued episodes, then deletes the removed episodes and saves
+        the new directory snapshot, so it can run on the thread pool
+
+        Args:
+            update:
+                The LibraryUpdate that was applied
+            removed:
+                The episodes removed by `apply_files`
+        """
+        # Queued episode saves must not bring back the deleted episodes
+        self._writer.flush(WRITE_TIMEOUT)
+        self._db.delete_episodes(removed)
+        self._db.save_snapshot(update.result.updated, update.result.removed)
+
+    def library_directories(self):
+        """
+        Gets the directories found in the configured paths by the last refresh
+
+        Returns:
+            A list of directory paths
+        """
+        return self._db.load_directories()
+
     def fetch_show_from_files(self, show_name):
         """
         Searches the configured files paths for a given show name and adds all
@@ -109,6 +267,7 @@ class SeriesManager:
             show_name:
                 The show name to remove
         """
+        self._writer.flush(WRITE_TIMEOUT)
         self._db.delete_show(self._series.pop(show_name))
 
     def rename_show(self, old, new):
@@ -127,7 +286,7 @@ class SeriesManager:
         self._series[old].title = new
         self._series[new] = self._series[old]
         self._series.pop(old)
-        self._db.save_show(self._series[new])
+        self._writer.save_show(self._series[new])
 
     def save_shows(self):
         """
@@ -135,5 +294,14 @@ class SeriesManager:
         """
         self._db.save_show_list(self._series.values())
 
-    def save_episode(self, episode):
-        self._db.save_episode(episode)
+    def save_episode(self, episode, show):
+        """
+        Queues an episode to be saved in the background
+
+        Args:
+            episode:
+                The Episode to save
+            show:
+                The Show the episode belongs to
+        """
+        self._writer.save_episode(episode, show)
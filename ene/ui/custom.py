@@ -22,8 +22,8 @@ from typing import Any, Iterable, List, Optional, Tuple, Union
 from PySide2.QtCore import QModelIndex, QObject, QPoint, QRect, QSize, Qt
 from PySide2.QtGui import QIcon, QStandardItem, QStandardItemModel
 from PySide2.QtWidgets import (
-    QAction, QComboBox, QLabel, QLayout, QPushButton, QSizePolicy, QStyle, QStyleOptionViewItem,
-    QStyledItemDelegate, QToolButton, QVBoxLayout,
+    QComboBox, QLayout, QPushButton, QSizePolicy, QStyle, QStyleOptionViewItem,
+    QStyledItemDelegate, QToolButton,
 )
 
 from ene.constants import STREAMERS
@@ -270,6 +270,10 @@ class FlowLayout(QLayout):
     """
     A grid like layout that goes from top left to bottom right.
 
+    Item size hints, positions and row breaks are cached for the current
+    width, so appending items only lays out the last row, and only items
+    whose position changed are moved.
+
     Adapted from `PySide2.examples.widgets.layouts.flowlayout`
     """
 
@@ -278,6 +282,17 @@ class FlowLayout(QLayout):
         self._hspacing = hspacing
         self._vspacing = vspacing
         self._items = []
+        self._hints = []
+        self._hints_dirty = False
+        # Item positions relative to the contents rect, and [first item, y, height] per row
+        self._positions = []
+        self._rows = []
+        # The (width, hspacing, vspacing) the positions were computed for
+        self._flow_key = None
+        self._heights = {}
+        # Top left of the contents rect and number of items whose geometry is up to date
+        self._origin = None
+        self._applied = 0
         self.setContentsMargins(margin, margin, margin, margin)
 
     def __del__(self):
@@ -285,6 +300,8 @@ class FlowLayout(QLayout):
 
     def addItem(self, item):  # pylint: disable=all
         self._items.append(item)
+        self._hints.append(item.sizeHint())
+        self._heights.clear()
 
     @property
     def horizontal_spacing(self):  # pylint: disable=all
@@ -319,9 +336,16 @@ class FlowLayout(QLayout):
 
     def takeAt(self, index):  # pylint: disable=all
         if 0 <= index < len(self._items):
+            self._forget(index)
+            self._hints.pop(index)
             return self._items.pop(index)
         return None
 
+    def invalidate(self):  # pylint: disable=all
+        self._hints_dirty = True
+        self._heights.clear()
+        super(FlowLayout, self).invalidate()
+
     def expandingDirections(self):  # pylint: disable=all
         return Qt.Orientations(0)
 
@@ -329,7 +353,10 @@ class FlowLayout(QLayout):
         return True
 
     def heightForWidth(self, width):  # pylint: disable=all
-        return self.do_layout(QRect(0, 0, width, 0), True)
+        height = self._heights.get(width)
+        if height is None:
+            height = self._heights[width] = self.do_layout(QRect(0, 0, width, 0), True)
+        return height
 
     def setGeometry(self, rect):  # pylint: disable=all
         super(FlowLayout, self).setGeometry(rect)
@@ -349,35 +376,30 @@ class FlowLayout(QLayout):
     def do_layout(self, rect, test_only):  # pylint: disable=all
         left, top, right, bottom = self.getContentsMargins()
         effective = rect.adjusted(+left, +top, -right, -bottom)
-        x = effective.x()
-        y = effective.y()
-        line_height = 0
-        for item in self:
-            widget = item.widget()
-            hspace = self.horizontal_spacing
-            if hspace == -1:
-                hspace = widget.style().layoutSpacing(
-                    QSizePolicy.PushButton,
-                    QSizePolicy.PushButton, Qt.Horizontal
-                )
-            vspace = self.vertical_spacing
-            if vspace == -1:
-                vspace = widget.style().layoutSpacing(
-                    QSizePolicy.PushButton,
-                    QSizePolicy.PushButton, Qt.Vertical
+        self._refresh_hints()
+        key = (effective.width(), *self._spacings())
+        if test_only and self._flow_key is not None and key != self._flow_key:
+            # Measuring another width, keep the cached layout for the current one
+            rows = []
+            _flow(self._hints, key, [], rows)
+        else:
+            if key != self._flow_key:
+                self._flow_key = key
+                self._forget(0)
+            rows = self._rows
+            _flow(self._hints, key, self._positions, rows)
+        if not test_only:
+            origin = effective.topLeft()
+            if origin != self._origin:
+                self._origin = origin
+                self._applied = 0
+            for index in range(self._applied, len(self._items)):
+                self._items[index].setGeometry(
+                    QRect(origin + self._positions[index], self._hints[index])
                 )
-            next_x = x + item.sizeHint().width() + hspace
-            if next_x - hspace > effective.right() and line_height > 0:
-                x = effective.x()
-                y = y + line_height + vspace
-                next_x = x + item.sizeHint().width() + hspace
-                line_height = 0
-            if not test_only:
-                item.setGeometry(
-                    QRect(QPoint(x, y), item.sizeHint()))
-            x = next_x
-            line_height = max(line_height, item.sizeHint().height())
-        return y + line_height - rect.y() + bottom
+            self._applied = len(self._items)
+        height = rows[-1][1] + rows[-1][2] if rows else 0
+        return top + height + bottom
 
     def smart_spacing(self, pm):  # pylint: disable=all
         parent = self.parent()
@@ -388,37 +410,72 @@ class FlowLayout(QLayout):
         else:
             return parent.spacing()
 
+    def _spacings(self):
+        hspace = self.horizontal_spacing
+        vspace = self.vertical_spacing
+        widget = self._items[0].widget() if self._items else None
+        if widget is not None:
+            if hspace == -1:
+                hspace = widget.style().layoutSpacing(
+                    QSizePolicy.PushButton,
+                    QSizePolicy.PushButton, Qt.Horizontal
+                )
+            if vspace == -1:
+                vspace = widget.style().layoutSpacing(
+                    QSizePolicy.PushButton,
+                    QSizePolicy.PushButton, Qt.Vertical
+                )
+        return hspace, vspace
+
+    def _refresh_hints(self):
+        if not self._hints_dirty:
+            return
+        self._hints_dirty = False
+        for index, item in enumerate(self._items):
+            hint = item.sizeHint()
+            if hint != self._hints[index]:
+                self._hints[index] = hint
+                self._forget(index)
+
+    def _forget(self, index):
+        """Drop the cached layout from the row before the one containing an item on."""
+        while self._rows and self._rows[-1][0] >= index:
+            self._rows.pop()
+        index = self._rows.pop()[0] if self._rows else 0
+        del self._positions[index:]
+        self._applied = min(self._applied, index)
+        self._heights.clear()
+
+
+def _flow(hints, key, positions, rows):
+    """
+    Flow the items without a position into rows, see `FlowLayout`
+
+    The last row is laid out again since new items may fit in it.
 
-class SeriesButton(QPushButton):
-    def __init__(self, series, episodes):
-        super().__init__()
-        self.title = series
-        self.setObjectName(series)
-        self.setContextMenuPolicy(Qt.ActionsContextMenu)
-        self.image_frame = QLabel()
-        layout = QVBoxLayout()
-        self.image_frame.setLayout(layout)
-        layout.setAlignment(Qt.AlignBottom)
-        title_label = QLabel(series)
-        title_label.setWordWrap(True)
-        layout.addWidget(title_label)
-        self.episodes_label = QLabel('Episodes: ' + str(episodes))
-        layout.addWidget(self.episodes_label)
-        self.setMinimumWidth(200)
-        self.setMinimumHeight(200)
-        base_layout = QVBoxLayout()
-        base_layout.setContentsMargins(1, 1, 1, 1)
-        base_layout.addWidget(self.image_frame)
-        super().setLayout(base_layout)
-
-    def add_action(self, label, callback):
-        action = QAction(self)
-        action.setText(label)
-        action.triggered.connect(callback)
-        self.addAction(action)
-
-    def set_image(self, image):
-        self.image_frame.setPixmap(image)
-
-    def update_episode_count(self, count):
-        self.episodes_label.setText('Episodes: ' + str(count))
+    Args:
+        hints: Item size hints
+        key: Width of the contents rect, horizontal and vertical spacing
+        positions: Item positions, extended in place
+        rows: [first item, y, height] of each row, updated in place
+    """
+    if len(positions) == len(hints):
+        return
+    width, hspace, vspace = key
+    first, y = rows.pop()[:2] if rows else (0, 0)
+    del positions[first:]
+    x = 0
+    line_height = 0
+    for index in range(first, len(hints)):
+        hint = hints[index]
+        if x + hint.width() >= width and line_height > 0:
+            rows.append([first, y, line_height])
+            first = index
+            x = 0
+            y += line_height + vspace
+            line_height = 0
+        positions.append(QPoint(x, y))
+        x += hint.width() + hspace
+        line_height = max(line_height, hint.height())
+    if first < len(hints):
+        rows.append([first, y, line_height])
@@ -15,17 +15,17 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """This module contains the main window."""
+import logging
 from enum import Enum
 from pathlib import Path
 
-from PySide2.QtCore import Qt, Slot
+from PySide2.QtCore import QTimer, Qt, Signal, Slot
 from PySide2.QtWidgets import (
     QFileDialog,
     QHBoxLayout,
     QInputDialog,
     QLineEdit,
     QMainWindow,
-    QScrollArea,
     QVBoxLayout,
     QWidget,
 )
@@ -36,12 +36,22 @@ from ene.series_manager import SeriesManager
 from ene.util import open_source_code
 from ene.ui.widgets.media_browser import MediaBrowser
 from ene.ui.widgets.series_browser import SeriesBrowser
-from .custom import EpisodeButton, SeriesButton
+from ene.ui.watcher import DEFAULT_POLL_INTERVAL, LibraryWatcher
+from .custom import EpisodeButton
+
+# Milliseconds between runs of PRAGMA optimize on the library database
+DB_OPTIMIZE_INTERVAL = 60 * 60 * 1000
+
+log = logging.getLogger(__name__)
 
 
 class MainWindow(QMainWindow, Ui_window_main):
     """Main window of the application."""
 
+    library_progress_signal = Signal(int, int)
+    library_scanned_signal = Signal(object)
+    library_refreshed_signal = Signal(object)
+
     class Tabs(Enum):
         Files = 0
         Streams = 1
@@ -61,7 +71,32 @@ class MainWindow(QMainWindow, Ui_window_main):
 
         self.player = None
         self.current_show = None
+        self.refreshing_library = False
+        self.pending_directories = None
+        self.watcher = LibraryWatcher(
+            self.app.config.get('Local Paths', []),
+            poll_interval=self.app.config.get('Library Poll Interval', DEFAULT_POLL_INTERVAL),
+            parent=self,
+        )
+        self.watcher.changed.connect(self.refresh_directories)
+        self.optimize_timer = QTimer(self)
+        self.optimize_timer.setInterval(DB_OPTIMIZE_INTERVAL)
+        self.optimize_timer.timeout.connect(
+            lambda: self.app.pool.submit(self.series.optimize_db)
+        )
+        self.optimize_timer.start()
         self.setupUi(self)
+        self.library_progress_signal.connect(self._library_progress)
+        self.library_scanned_signal.connect(self._library_scanned)
+        self.library_refreshed_signal.connect(self._library_refreshed)
+        self.refresh_directories(None)
+
+    def closeEvent(self, event):  # pylint: disable=all
+        """Stops the background work on the library and closes the database"""
+        self.watcher.stop()
+        self.optimize_timer.stop()
+        self.series.close_db()
+        super().closeEvent(event)
 
     def setupUi(self, window_main):
         """Setup all the child widgets of the main window"""
@@ -149,11 +184,8 @@ class MainWindow(QMainWindow, Ui_window_main):
 
         self.page_widget = SeriesBrowser(self.app, self.series, self.stack_local_files)
         self.page_widget.init_layout()
-        series_page = QScrollArea()
-        series_page.setWidget(self.page_widget)
-        series_page.setWidgetResizable(True)
-        self.page_widget.setup_search(series_page)
-        self.stack_local_files.addWidget(series_page)
+        self.page_widget.setup_search(self.page_widget)
+        self.stack_local_files.addWidget(self.page_widget)
         self.page_widget.refresh_shows_view()
 
     def refresh_show(self):
@@ -184,12 +216,85 @@ class MainWindow(QMainWindow, Ui_window_main):
 
     def refresh_library(self):
         """
-        Triggers a full refresh of the users library, updating episode counts
-        and adding new shows to the UI as needed
+        Triggers a full refresh of the users library in the background, updating
+        episode counts and adding new shows to the UI as needed
         """
-        self.series.fetch_shows_from_files()
-        self.series.save_shows()
+        if self.refreshing_library:
+            self.pending_directories = []
+            return
+        self.statusbar.showMessage('Scanning library...')
+        self.refresh_directories(None)
+
+    @Slot(list)
+    def refresh_directories(self, directories):
+        """
+        Looks for changed video files in the given directories in the background,
+        queueing the refresh if one is already running
+
+        Args:
+            directories:
+                The directories to check, None or an empty list for all of them
+        """
+        if self.refreshing_library:
+            if self.pending_directories is None:
+                self.pending_directories = list(directories or [])
+            elif self.pending_directories and directories:
+                self.pending_directories.extend(directories)
+            else:
+                self.pending_directories = []
+            return
+        self.refreshing_library = True
+        self.app.pool.submit(self._scan_library, directories or None).add_done_callback(
+            _log_exception
+        )
+
+    def _scan_library(self, directories):
+        # The series list belongs to the UI thread, the changes found here
+        # are applied to it in _library_scanned
+        update = None
+        try:
+            with self.series.db_connection():
+                update = self.series.scan_files(
+                    progress=self.library_progress_signal.emit, directories=directories
+                )
+        finally:
+            self.library_scanned_signal.emit(update)
+
+    def _save_library(self, update, removed):
+        library = None
+        try:
+            with self.series.db_connection():
+                self.series.save_files(update, removed)
+                library = self.series.library_directories()
+        finally:
+            self.library_refreshed_signal.emit(library)
+
+    @Slot(int, int)
+    def _library_progress(self, directories, episodes):
+        self.statusbar.showMessage(
+            f'Scanning library: {directories} folders checked, {episodes} episodes found'
+        )
+
+    @Slot(object)
+    def _library_scanned(self, update):
+        if update is None:
+            self._library_refreshed(None)
+            return
+        removed = self.series.apply_files(update)
         self.page_widget.refresh_shows_view()
+        self.app.pool.submit(self._save_library, update, removed).add_done_callback(
+            _log_exception
+        )
+
+    @Slot(object)
+    def _library_refreshed(self, library):
+        self.refreshing_library = False
+        self.statusbar.clearMessage()
+        if library is not None:
+            self.watcher.set_directories(library)
+        if self.pending_directories is not None:
+            directories, self.pending_directories = self.pending_directories, None
+            self.refresh_directories(directories)
 
     def rename_show(self):
         """
@@ -213,11 +318,11 @@ class MainWindow(QMainWindow, Ui_window_main):
         """
         Hides all shows that do not match the search criteria
         """
-        search_text = self.search.findChild(QLineEdit).text().lower()
-        # TODO: Make this not break the FlowLayout
-        for show in self.page_widget.findChildren(SeriesButton):
-            if search_text not in show.title.lower():
-                show.hide()
-            else:
-                show.show()
-        self.page_widget.layout().do_layout(self.page_widget.rect(), False)
+        search_text = self.page_widget.search.findChild(QLineEdit).text()
+        self.page_widget.filter_shows(search_text)
+
+
+def _log_exception(future):
+    """Logs the exception a background task failed with, if any"""
+    if not future.cancelled() and future.exception() is not None:
+        log.error('Library refresh failed', exc_info=future.exception())
@@ -0,0 +1,183 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""This module contains the cache of scaled cover image thumbnails."""
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PySide2.QtCore import QBuffer, QByteArray, QIODevice, Qt
+from PySide2.QtGui import QImage, QPixmap
+
+from ene.cache import DiskCache
+from ene.downloader import ImageDownloader
+
+THUMBNAIL_DIR = 'thumbs'
+THUMBNAIL_FORMAT = 'JPG'
+THUMBNAIL_QUALITY = 90
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_BYTES = 128 * 1024 * 1024
+
+Size = Tuple[int, int]
+
+
+class ThumbnailCache:
+    """
+    Two tier cache of cover images scaled to their display size.
+
+    Scaled images are kept on disk, so a cover is only decoded at full size
+    once, and as pixmaps in a memory LRU bounded by bytes. Decoding and
+    scaling happen on worker threads with `QImage`, pixmaps are only created
+    and accessed on the UI thread.
+    """
+
+    def __init__(
+            self,
+            downloader: ImageDownloader,
+            cache_home: Path,
+            max_bytes: int = DEFAULT_MEMORY_BYTES,
+            disk_bytes: int = DEFAULT_DISK_BYTES,
+            executor: Optional[ThreadPoolExecutor] = None
+    ):
+        """
+        Initialize instance
+
+        Args:
+            downloader: The downloader for full size images
+            cache_home: Cache directory path
+            max_bytes: The maximum total size of the pixmaps kept in memory
+            disk_bytes: The maximum total size of the thumbnails kept on disk
+            executor: The executor to decode and scale images in
+        """
+        self.downloader = downloader
+        self.disk = DiskCache(Path(cache_home, THUMBNAIL_DIR), disk_bytes)
+        self.max_bytes = max_bytes
+        self.executor = executor or ThreadPoolExecutor(thread_name_prefix='Thumbnails')
+        self._pixmaps: 'OrderedDict[str, QPixmap]' = OrderedDict()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Total size of the pixmaps kept in memory, in bytes."""
+        return self._size
+
+    @staticmethod
+    def key(media_id: int, size: Size) -> str:
+        """
+        Get the cache key of a thumbnail
+
+        Args:
+            media_id: The media id
+            size: Width and height of the thumbnail
+
+        Returns:
+            The cache key
+        """
+        width, height = size
+        return f'{media_id}_{width}x{height}.{THUMBNAIL_FORMAT.lower()}'
+
+    def get(self, media_id: int, size: Size) -> Optional[QPixmap]:
+        """
+        Get a thumbnail from memory, must be called on the UI thread
+
+        Args:
+            media_id: The media id
+            size: Width and height of the thumbnail
+
+        Returns:
+            The thumbnail, None if it is not in memory
+        """
+        key = self.key(media_id, size)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
+
+    def insert(self, media_id: int, size: Size, image: QImage) -> QPixmap:
+        """
+        Add a thumbnail to memory, must be called on the UI thread
+
+        Args:
+            media_id: The media id
+            size: Width and height of the thumbnail
+            image: The thumbnail image from `load`
+
+        Returns:
+            The thumbnail pixmap
+        """
+        key = self.key(media_id, size)
+        pixmap = QPixmap.fromImage(image)
+        old = self._pixmaps.pop(key, None)
+        if old is not None:
+            self._size -= _pixmap_bytes(old)
+        self._pixmaps[key] = pixmap
+        self._size += _pixmap_bytes(pixmap)
+        while self._size > self.max_bytes and len(self._pixmaps) > 1:
+            _, evicted = self._pixmaps.popitem(last=False)
+            self._size -= _pixmap_bytes(evicted)
+        return pixmap
+
+    def load(self, media_id: int, url: str, size: Size) -> Future:
+        """
+        Load a thumbnail from disk, or download and scale the full size image
+
+        Args:
+            media_id: The media id
+            url: The full size image url
+            size: Width and height of the thumbnail
+
+        Returns:
+            A future with the thumbnail `QImage`
+        """
+        return self.executor.submit(self._load, media_id, url, size)
+
+    def clear(self):
+        """Remove all thumbnails from memory and disk."""
+        self._pixmaps.clear()
+        self._size = 0
+        self.disk.clear()
+
+    def _load(self, media_id: int, url: str, size: Size) -> QImage:
+        key = self.key(media_id, size)
+        data = self.disk.get(key)
+        if data is not None:
+            image = QImage.fromData(data)
+            if not image.isNull():
+                return image
+            self.disk.discard(key)
+        path = self.downloader.fetch(url).result()
+        image = QImage(str(path))
+        if image.isNull():
+            raise IOError(f'Unable to decode image {path}')
+        width, height = size
+        image = image.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        self.disk.put(key, _encode(image))
+        return image
+
+
+def _encode(image: QImage) -> bytes:
+    array = QByteArray()
+    buffer = QBuffer(array)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY)
+    buffer.close()
+    return bytes(array.data())
+
+
+def _pixmap_bytes(pixmap: QPixmap) -> int:
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
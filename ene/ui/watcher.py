@@ -0,0 +1,135 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module contains the watcher that keeps the local library up to date."""
+from pathlib import Path
+from typing import Iterable, List, Set
+
+from PySide2.QtCore import QFileSystemWatcher, QObject, QTimer, Signal, Slot
+
+DEBOUNCE_MS = 1000
+DEFAULT_POLL_INTERVAL = 300
+
+
+class LibraryWatcher(QObject):
+    """
+    Watches the library directories and reports the ones that changed.
+
+    Directory events come from `QFileSystemWatcher`, which uses inotify on
+    Linux and the native change notifications on other platforms. They are
+    collected until nothing changed for `debounce` milliseconds, so copying a
+    season in only triggers a single refresh. Directories that cannot be
+    watched, e.g. because the inotify watch limit was reached, are covered by
+    polling the library roots every `poll_interval` seconds instead.
+    """
+
+    #: Emitted with the list of changed directories
+    changed = Signal(list)
+
+    def __init__(
+            self,
+            roots: Iterable[Path],
+            debounce: int = DEBOUNCE_MS,
+            poll_interval: int = DEFAULT_POLL_INTERVAL,
+            parent: QObject = None
+    ):
+        """
+        Initialize instance
+
+        Args:
+            roots: The library root directories
+            debounce: Milliseconds to wait for more events before reporting
+            poll_interval: Seconds between polls of the roots, 0 to disable
+            parent: The parent object
+        """
+        super().__init__(parent)
+        self.roots = [Path(root) for root in roots]
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._directory_changed)
+        self._dirty: Set[Path] = set()
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(debounce)
+        self._debounce.timeout.connect(self._emit_changed)
+        self._poll = QTimer(self)
+        self._poll.setInterval(poll_interval * 1000)
+        self._poll.timeout.connect(self.poll)
+        self._poll_interval = poll_interval
+        self._failed: Set[Path] = set()
+
+    @property
+    def directories(self) -> List[Path]:
+        """The directories currently watched."""
+        return [Path(path) for path in self._watcher.directories()]
+
+    @property
+    def polling(self) -> bool:
+        """Whether the roots are being polled for unwatched directories."""
+        return self._poll.isActive()
+
+    def set_directories(self, directories: Iterable[Path]):
+        """
+        Watch exactly the given directories
+
+        Args:
+            directories: The directories of the library
+        """
+        wanted = {str(path) for path in directories}
+        wanted.update(str(root) for root in self.roots if root.is_dir())
+        watched = set(self._watcher.directories())
+        if watched - wanted:
+            self._watcher.removePaths(list(watched - wanted))
+        self._failed.intersection_update(Path(path) for path in wanted)
+        if wanted - watched:
+            failed = self._watcher.addPaths(list(wanted - watched))
+            self._failed.update(Path(path) for path in failed)
+        self._update_polling()
+
+    def stop(self):
+        """Stop watching and polling."""
+        self._debounce.stop()
+        self._poll.stop()
+        self._dirty.clear()
+        if self._watcher.directories():
+            self._watcher.removePaths(self._watcher.directories())
+
+    @Slot()
+    def poll(self):
+        """Report the roots as changed, so they are checked for changes."""
+        self._dirty.update(self.roots)
+        self._debounce.start()
+
+    def _update_polling(self):
+        missing = any(not root.is_dir() for root in self.roots)
+        if (self._failed or missing) and self._poll_interval > 0:
+            if not self._poll.isActive():
+                self._poll.start()
+        else:
+            self._poll.stop()
+
+    @Slot(str)
+    def _directory_changed(self, path):
+        self._dirty.add(Path(path))
+        self._debounce.start()
+
+    @Slot()
+    def _emit_changed(self):
+        dirty = self._dirty
+        self._dirty = set()
+        # Rescanning a directory also checks all of its subdirectories
+        self.changed.emit(sorted(
+            path for path in dirty if dirty.isdisjoint(path.parents)
+        ))
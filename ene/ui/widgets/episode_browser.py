@@ -86,5 +86,5 @@ class EpisodeBrowser(QWidget):
             self.app.player = get_player(self.app.config)
         episode = self.sender().episode
         self.sender().mark_watched()
-        self.save(episode)
+        self.save(episode, self.current_show)
         self.app.player.play(episode)
@@ -15,18 +15,19 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """This module contains the media browser."""
+from concurrent.futures import Future
+from functools import partial
 from threading import RLock
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from PySide2.QtCore import Qt, Signal, Slot
-from PySide2.QtGui import QPixmap, QTextOption
+from PySide2.QtCore import QTimer, Qt, Signal, Slot
+from PySide2.QtGui import QImage, QPixmap, QTextOption
 from PySide2.QtWidgets import (
     QCheckBox,
     QComboBox,
     QFrame,
     QHBoxLayout,
     QLabel,
-    QLayout,
     QScrollArea,
     QSizePolicy,
     QSpinBox,
@@ -39,7 +40,8 @@ from PySide2.QtWidgets import (
 from ene.api import MediaFormat, MediaSeason, MediaSort, MediaStatus
 from ene.api.media import Media
 from ene.ui.common import mk_padding, mk_stylesheet
-from ene.ui.custom import FlowLayout, GenreTagSelector, StreamerSelector, ToggleToolButton
+from ene.ui.custom import GenreTagSelector, StreamerSelector, ToggleToolButton
+from ene.ui.thumbnails import ThumbnailCache
 
 
 class MediaDisplay(QWidget):
@@ -47,6 +49,20 @@ class MediaDisplay(QWidget):
     image_w = 230
     image_h = 315
 
+    # The media properties the display needs, see `ene.api.fields`
+    fields = (
+        'title',
+        'studio',
+        'cover_image',
+        'next_airing_episode',
+        'season',
+        'start_date',
+        'format',
+        'average_score',
+        'description',
+        'genres',
+    )
+
     transparent_grey = 'rgba(43,48,52,0.75)'
     aqua = '#3DB4F2'
     dark_grey = '#13171D'
@@ -56,11 +72,15 @@ class MediaDisplay(QWidget):
     light_white = '#9FADBD'
     lighter_white = '#EDF1F5'
 
+    image_ready_signal = Signal(int, QImage)
+
     def __init__(self, media: Media, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.setFixedWidth(self.image_w * 2)
         self.setFixedHeight(self.image_h)
-        self.media = media
+        self.media = None
+        self.thumbnails = None
+        self.image_ready_signal.connect(self._image_ready)
 
         self._setup_layouts()
         self._setup_left()
@@ -68,16 +88,67 @@ class MediaDisplay(QWidget):
         self._setup_format()
         qss = self._setup_des()
         self._setup_bottom_bar(qss)
+        self.bind(media)
+
+    def bind(self, media: Media):
+        """
+        Show a media in the display, replacing the current one
+
+        Args:
+            media: The media to show
+        """
+        self.media = media
+        self.image_label.clear()
+        self._bind_left()
+        self._bind_airing()
+        self._bind_format()
+        self._bind_des()
+        self._bind_bottom_bar()
+
+    def load_image(self, thumbnails: ThumbnailCache):
+        """
+        Set the cover image of the display, loading it in the background if needed
+
+        Args:
+            thumbnails: The thumbnail cache
+        """
+        self.thumbnails = thumbnails
+        media_id = self.media.id
+        size = (self.image_w, self.image_h)
+        pixmap = thumbnails.get(media_id, size)
+        if pixmap is not None:
+            self.set_image(pixmap)
+            return
+        self.media.cover_image_url \
+            .map(lambda url: thumbnails.load(media_id, url, size)) \
+            .map(lambda future: future.add_done_callback(partial(self._image_loaded, media_id)))
 
-    def set_image(self):
+    def _image_loaded(self, media_id: int, future: Future):
+        if future.cancelled() or future.exception():
+            return
+        try:
+            self.image_ready_signal.emit(media_id, future.result())
+        except RuntimeError:
+            # The display was deleted before the image finished loading
+            pass
+
+    @Slot(int, QImage)
+    def _image_ready(self, media_id: int, image: QImage):
+        pixmap = self.thumbnails.insert(media_id, (self.image_w, self.image_h), image)
+        # The display may have been rebound while the image was loading
+        if self.media is not None and self.media.id == media_id:
+            self.set_image(pixmap)
+
+    def set_image(self, pixmap: QPixmap):
         """
         Set the cover image of the display
+
+        Args:
+            pixmap: The cover image, scaled to the display size
         """
         if not self.parent():
             return
-        self.media.cover_image \
-            .map(lambda p: QPixmap(str(p)).scaled(self.image_w, self.image_h)) \
-            .map(lambda img: self.image_label.setPixmap(img))
+        self.image_label.setPixmap(pixmap)
 
     def _setup_layouts(self):
         self.master_layout = QHBoxLayout()
@@ -116,23 +187,38 @@ class MediaDisplay(QWidget):
         spacer.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Expanding)
         self.left_layout.addWidget(spacer)
 
-        title_label = self.media.title.map_or(lambda s: QLabel(s), None)
-        studio_label = self.media.studio.map_or(lambda s: QLabel(s.name), None)
-        if title_label:
-            title_label.setStyleSheet(mk_stylesheet(stylesheet, 'QLabel'))
-            self.left_layout.addWidget(title_label)
-        if studio_label:
-            stylesheet['color'] = self.aqua
-            stylesheet['padding'] = mk_padding(0, 10, 10, 10)
-            stylesheet['font-size'] = '12pt'
-            studio_label.setStyleSheet(mk_stylesheet(stylesheet, 'QLabel'))
-            self.left_layout.addWidget(studio_label)
+        self.title_label = QLabel()
+        self.title_label.setStyleSheet(mk_stylesheet(stylesheet, 'QLabel'))
+        self.left_layout.addWidget(self.title_label)
+
+        stylesheet['color'] = self.aqua
+        stylesheet['padding'] = mk_padding(0, 10, 10, 10)
+        stylesheet['font-size'] = '12pt'
+        self.studio_label = QLabel()
+        self.studio_label.setStyleSheet(mk_stylesheet(stylesheet, 'QLabel'))
+        self.left_layout.addWidget(self.studio_label)
 
         self.master_layout.addWidget(self.image_label)
         self.master_layout.addLayout(self.right_layout)
 
+    def _bind_left(self):
+        _set_text(self.title_label, self.media.title.unwrap_or(None))
+        _set_text(self.studio_label, self.media.studio.map_or(lambda s: s.name, None))
+
     def _setup_airing(self):
-        def get_airing_lbl(next_airing):
+        self.next_airing_label = QLabel()
+        self.next_airing_label.setStyleSheet(mk_stylesheet({
+            'color': self.aqua,
+            'background-color': self.dark_grey,
+            'padding': '5px',
+            'font-size': '11pt',
+            'qproperty-alignment': '"AlignCenter"'
+        }, 'QLabel'))
+        self.right_layout.addWidget(self.next_airing_label)
+        self.right_layout.addLayout(self.right_mid_layout)
+
+    def _bind_airing(self):
+        def get_airing_text(next_airing):
             next_episode = next_airing.episode
             time_until = next_airing.time_until_airing
             if next_episode and time_until:
@@ -146,35 +232,21 @@ class MediaDisplay(QWidget):
                     time_parts.append(f'{hours}h')
                 time_parts.append(f'{minutes}m')
                 time_str = ' '.join(time_parts)
-                return QLabel(f'Ep {next_episode} - {time_str}')
+                return f'Ep {next_episode} - {time_str}'
 
-        def get_season_lbl():
+        def get_season_text():
             year = self.media.start_date.map_or(lambda d: d.year, None)
             if self.media.season and year:
-                return QLabel(f'{self.media.season.value.name.title()} {year}')
+                return f'{self.media.season.value.name.title()} {year}'
             elif year:
-                return QLabel(str(year))
-
-        next_airing_label = self.media.next_airing_episode \
-            .map_or_else(get_airing_lbl, get_season_lbl)
-        if next_airing_label:
-            next_airing_label.setStyleSheet(mk_stylesheet({
-                'color': self.aqua,
-                'background-color': self.dark_grey,
-                'padding': '5px',
-                'font-size': '11pt',
-                'qproperty-alignment': '"AlignCenter"'
-            }, 'QLabel'))
-            self.right_layout.addWidget(next_airing_label)
-        self.right_layout.addLayout(self.right_mid_layout)
+                return str(year)
 
-    def _setup_format(self):
-        format_label = self.media.format.map(lambda f: QLabel(f.name))
-        score_label = self.media.average_score.map(lambda s: QLabel(f'{s}%'))
-
-        if not format_label and not score_label:
-            return
+        _set_text(
+            self.next_airing_label,
+            self.media.next_airing_episode.map_or_else(get_airing_text, get_season_text)
+        )
 
+    def _setup_format(self):
         stylesheet = mk_stylesheet({
             'color': self.dark_white,
             'background-color': self.grey,
@@ -184,20 +256,22 @@ class MediaDisplay(QWidget):
             'qproperty-wordWrap': 'true'
         }, 'QLabel')
 
-        def _add(l):
-            l.setStyleSheet(stylesheet)
-            self.right_mid_layout.addWidget(l)
+        self.format_label = QLabel()
+        self.score_label = QLabel()
+        for label in (self.format_label, self.score_label):
+            label.setStyleSheet(stylesheet)
+            self.right_mid_layout.addWidget(label)
 
-        format_label.map(_add)
-        score_label.map(_add)
+    def _bind_format(self):
+        _set_text(self.format_label, self.media.format.map_or(lambda f: f.name, None))
+        _set_text(self.score_label, self.media.average_score.map_or(lambda s: f'{s}%', None))
 
     def _setup_des(self):
-        desc_text_edit = QTextEdit()
-        self.media.description.map(lambda d: desc_text_edit.setHtml(d))
-        desc_text_edit.setReadOnly(True)
-        desc_text_edit.setFrameStyle(QFrame.NoFrame)
-        desc_text_edit.setLineWrapMode(QTextEdit.WidgetWidth)
-        desc_text_edit.setWordWrapMode(QTextOption.WordWrap)
+        self.desc_text_edit = QTextEdit()
+        self.desc_text_edit.setReadOnly(True)
+        self.desc_text_edit.setFrameStyle(QFrame.NoFrame)
+        self.desc_text_edit.setLineWrapMode(QTextEdit.WidgetWidth)
+        self.desc_text_edit.setWordWrapMode(QTextOption.WordWrap)
         stylesheet = {
             'color': self.dark_white,
             'background-color': self.light_grey,
@@ -205,26 +279,181 @@ class MediaDisplay(QWidget):
             'font-size': '10pt',
             'border': 'none'
         }
-        desc_text_edit.setStyleSheet(mk_stylesheet(stylesheet, 'QTextEdit'))
+        self.desc_text_edit.setStyleSheet(mk_stylesheet(stylesheet, 'QTextEdit'))
 
-        self.right_layout.addWidget(desc_text_edit)
+        self.right_layout.addWidget(self.desc_text_edit)
         return stylesheet
 
+    def _bind_des(self):
+        self.desc_text_edit.setHtml(self.media.description.unwrap_or(''))
+
     def _setup_bottom_bar(self, stylesheet):
         # TODO Need to show buttons on hover
-        genre_label = QLabel(', '.join(self.media.genres))
+        self.genre_label = QLabel()
         stylesheet['qproperty-alignment'] = '"AlignCenter"'
         stylesheet['background-color'] = self.dark_grey
-        genre_label.setStyleSheet(mk_stylesheet(stylesheet, 'QLabel'))
-        self.bottom_right_layout.addWidget(genre_label)
-        self.right_layout.addWidget(genre_label)
+        self.genre_label.setStyleSheet(mk_stylesheet(stylesheet, 'QLabel'))
+        self.bottom_right_layout.addWidget(self.genre_label)
+        self.right_layout.addWidget(self.genre_label)
+
+    def _bind_bottom_bar(self):
+        self.genre_label.setText(', '.join(self.media.genres))
+
+
+def _set_text(label: QLabel, text: Optional[str]):
+    """
+    Set the text of a label, hiding it if there is no text
+
+    Args:
+        label: The label
+        text: The text
+    """
+    label.setText(text or '')
+    label.setVisible(bool(text))
+
+
+class MediaGrid(QWidget):
+    """
+    A grid of media displays that only keeps widgets for the visible rows.
+
+    Displays scrolled out of view are returned to a pool and rebound to the
+    media that scroll into view, so the number of widgets depends on the
+    viewport size rather than the number of media.
+    """
+
+    # Rows kept bound above and below the visible rows
+    overscan = 1
+
+    def __init__(self, thumbnails: ThumbnailCache, margin: int = 10, spacing: int = 10):
+        """
+        Initialize instance
+
+        Args:
+            thumbnails: The thumbnail cache for cover images
+            margin: Margin around the grid
+            spacing: Spacing between displays
+        """
+        super().__init__()
+        self.thumbnails = thumbnails
+        self.margin = margin
+        self.spacing = spacing
+        self.cell_w = MediaDisplay.image_w * 2
+        self.cell_h = MediaDisplay.image_h
+        self.media: List[Media] = []
+        self._bound: Dict[int, MediaDisplay] = {}
+        self._pool: List[MediaDisplay] = []
+        self._visible_top = 0
+        self._visible_height = 0
+        self.setMinimumWidth(self.cell_w + 2 * margin)
+
+    def __len__(self):
+        return len(self.media)
+
+    @property
+    def columns(self) -> int:
+        """Number of displays per row at the current width."""
+        available = self.width() - 2 * self.margin + self.spacing
+        return max(1, available // (self.cell_w + self.spacing))
+
+    @property
+    def widget_count(self) -> int:
+        """Number of display widgets created."""
+        return len(self._bound) + len(self._pool)
+
+    def content_height(self) -> int:
+        """
+        Get the height needed to show all media at the current width
+
+        Returns:
+            The height in pixels
+        """
+        rows = -(-len(self.media) // self.columns)
+        if not rows:
+            return 0
+        return 2 * self.margin + rows * (self.cell_h + self.spacing) - self.spacing
+
+    def append(self, media_list: List[Media]):
+        """
+        Add media to the end of the grid
+
+        Args:
+            media_list: The media to add
+        """
+        self.media.extend(media_list)
+        self.setMinimumHeight(self.content_height())
+        self.update_visible()
+
+    def clear(self):
+        """Remove all media from the grid."""
+        for index in list(self._bound):
+            self._release(index)
+        self.media.clear()
+        self.setMinimumHeight(0)
+
+    def set_visible_area(self, top: int, height: int):
+        """
+        Set the part of the grid that is visible in the viewport
+
+        Args:
+            top: Vertical offset of the viewport in the grid
+            height: Height of the viewport
+        """
+        self._visible_top = top
+        self._visible_height = height
+        self.update_visible()
+
+    def update_visible(self):
+        """Bind displays to the visible media and release the rest."""
+        columns = self.columns
+        row_h = self.cell_h + self.spacing
+        top = self._visible_top - self.margin
+        first_row = max(0, top // row_h - self.overscan)
+        last_row = (top + self._visible_height) // row_h + self.overscan
+        first = first_row * columns
+        last = min(len(self.media), (last_row + 1) * columns)
+        for index in [i for i in self._bound if not first <= i < last]:
+            self._release(index)
+        for index in range(first, last):
+            display = self._bound.get(index)
+            if display is None:
+                display = self._bind(index)
+            row, column = divmod(index, columns)
+            display.move(
+                self.margin + column * (self.cell_w + self.spacing),
+                self.margin + row * row_h
+            )
+
+    def resizeEvent(self, event):  # pylint: disable=all
+        super().resizeEvent(event)
+        self.setMinimumHeight(self.content_height())
+        self.update_visible()
+
+    def _bind(self, index: int) -> MediaDisplay:
+        media = self.media[index]
+        if self._pool:
+            display = self._pool.pop()
+            display.bind(media)
+        else:
+            display = MediaDisplay(media, self)
+        self._bound[index] = display
+        display.show()
+        display.load_image(self.thumbnails)
+        return display
+
+    def _release(self, index: int):
+        display = self._bound.pop(index)
+        display.hide()
+        self._pool.append(display)
 
 
 class MediaBrowser(QScrollArea):
     """This class controls the media browsing tab."""
 
     ctrl_ready_signal = Signal(list, list, QWidget, QWidget)
-    media_ready_signal = Signal(list)
+    media_ready_signal = Signal(list, int)
+
+    # Quiet period in milliseconds before filter changes are applied
+    filter_delay = 300
 
     def __init__(  # pylint: disable=R0913
             self,
@@ -257,19 +486,27 @@ class MediaBrowser(QScrollArea):
         self.combobox_status = combobox_status
         self.checkbox_on_list = checkbox_on_list
         self.checkbox_adult = checkbox_adult
-        self._setup_ui(button_sort_order)
-
         self.app = app
         self.api = self.app.api
+        self._setup_ui(button_sort_order)
 
-        self.current_page = 0
+        self.media_stream = None
+        self.current_filters = None
         self.has_next_page = True
+        # Bumped on every reset, work from older generations is dropped
+        self.generation = 0
+        self._futures = []
 
         self.is_setup = False
 
         self.genre_tag_selector = None
         self.streamer_selector = None
 
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(self.filter_delay)
+        self._filter_timer.timeout.connect(self._apply_filters)
+
         self._scroll_bar = self.verticalScrollBar()
         self.ctrl_ready_signal.connect(self._setup_controls)
         self.media_ready_signal.connect(self._media_ready)
@@ -353,15 +590,29 @@ class MediaBrowser(QScrollArea):
         """Whether if the media's intended for 18+ adult audiences."""
         return self.checkbox_adult.isChecked()
 
+    @property
+    def filters(self) -> dict:
+        """The `API.browse_anime` keyword arguments for the current controls."""
+        genres, tags = self.genre_tag_selector.genre_tags()
+        return {
+            'season': self.season,
+            'year_range': self.year_range,
+            'sort': self.sort,
+            'format_': self.format,
+            'status': self.status,
+            'licensed_by': self.streaming_on,
+            'included_genres': genres or None,
+            'included_tags': tags or None,
+            'on_list': self.on_list,
+            'is_adult': self.adult,
+        }
+
     def _setup_ui(self, button_sort_order):
-        self._layout = FlowLayout(None, 10, 10, 10)
-        self._layout.setSizeConstraint(QLayout.SetMinimumSize)
-        self.control_widget = QWidget()
-        self.control_widget.setLayout(self._layout)
+        self.grid = MediaGrid(self.app.thumbnails)
 
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        self.setWidget(self.control_widget)
+        self.setWidget(self.grid)
         self.setWidgetResizable(True)
         self.sort_toggle = ToggleToolButton(button_sort_order)
 
@@ -388,44 +639,47 @@ class MediaBrowser(QScrollArea):
             combobox_streaming
         )
 
-    @Slot(list)
-    def _media_ready(self, media_list):
+    @Slot(list, int)
+    def _media_ready(self, media_list, generation):
+        with self.reset_media_lock:
+            if generation != self.generation:
+                return
+            self.grid.append([anime for anime in media_list if anime])
+
+    def _submit(self, func, *args):
+        """
+        Submit work for the current generation to the thread pool
+
+        Args:
+            func: The function to run
+            *args: Arguments for the function
+        """
         with self.reset_media_lock:
-            for anime in media_list:
-                if not anime:
-                    continue
-                display = MediaDisplay(anime)
-                self._layout.addWidget(display)
-                self.app.pool.submit(display.set_image)
+            self._futures = [future for future in self._futures if not future.done()]
+            self._futures.append(self.app.pool.submit(func, *args))
 
     def get_media(self):
         """
         Get media from anilist and put them into the layout
         """
-        self.app.pool.submit(self._get_media)
+        self._submit(self._get_media, self.generation)
 
-    def _get_media(self):
-        self.current_page += 1
-        genres, tags = self.genre_tag_selector.genre_tags()
-        res = self.api.browse_anime(
-            self.current_page,
-            season=self.season,
-            year_range=self.year_range,
-            sort=self.sort,
-            format_=self.format,
-            status=self.status,
-            licensed_by=self.streaming_on,
-            included_genres=genres or None,
-            included_tags=tags or None,
-            on_list=self.on_list,
-            is_adult=self.adult
-        )
-        if res:
-            media_lst, has_next = res.unwrap()
-            self.has_next_page = has_next
-            self.media_ready_signal.emit(media_lst)
-        else:
-            self.has_next_page = False
+    def _get_media(self, generation):
+        with self.reset_media_lock:
+            if generation != self.generation:
+                return
+            if self.media_stream is None:
+                self.media_stream = self.api.iter_anime(
+                    fields=MediaDisplay.fields, **self.current_filters
+                )
+            stream = self.media_stream
+        media_lst = stream.next_page()
+        with self.reset_media_lock:
+            if generation != self.generation:
+                return
+            self.has_next_page = not stream.done
+        if media_lst:
+            self.media_ready_signal.emit(media_lst, generation)
 
     @Slot(list, list, QWidget, QWidget)
     def _setup_controls(self, genres, tags, combobox_genre_tag, combobox_streaming):
@@ -444,22 +698,47 @@ class MediaBrowser(QScrollArea):
                 self.checkbox_adult.clicked,
                 self.checkbox_on_list.clicked
         ):
-            signal.connect(self.reset_media)
+            signal.connect(self.schedule_filter_change)
+        self.current_filters = self.filters
         self.get_media()
 
     @Slot(int)
     def _on_scroll(self, value):
+        self.grid.set_visible_area(value, self.viewport().height())
         if value == self._scroll_bar.maximum() and self.has_next_page:
             self.get_media()
 
+    def resizeEvent(self, event):  # pylint: disable=all
+        super().resizeEvent(event)
+        self.grid.set_visible_area(self._scroll_bar.value(), self.viewport().height())
+
+    @Slot()
+    def schedule_filter_change(self):
+        """
+        Apply filter changes once the controls have been quiet for `filter_delay`
+
+        Changes made within the quiet period are coalesced into one query.
+        """
+        self._filter_timer.start()
+
+    @Slot()
+    def _apply_filters(self):
+        if self.filters != self.current_filters:
+            self.reset_media()
+
     @Slot()
     def reset_media(self):
         """Reset the media display."""
         with self.reset_media_lock:
-            self.current_page = 0
+            self.current_filters = self.filters
+            self.generation += 1
+            for future in self._futures:
+                future.cancel()
+            self._futures.clear()
+            if self.media_stream is not None:
+                self.media_stream.close()
+                self.media_stream = None
             self.has_next_page = False
-            for item in reversed(self._layout):
-                item.widget().setParent(None)
-            self._layout._items.clear()  # pylint: disable=W0212
+            self.grid.clear()
             self._scroll_bar.setValue(0)
             self.get_media()
@@ -1,10 +1,181 @@
-from PySide2.QtWidgets import QWidget, QLineEdit, QPushButton, QStackedWidget
-from PySide2.QtCore import Qt
+from bisect import bisect_left
 
+from PySide2.QtCore import QAbstractListModel, QModelIndex, QSize, QSortFilterProxyModel, Qt
+from PySide2.QtGui import QPalette
+from PySide2.QtWidgets import (
+    QAction, QApplication, QLineEdit, QListView, QPushButton, QStackedWidget, QStyle,
+    QStyleOptionButton, QStyledItemDelegate, QVBoxLayout, QWidget,
+)
+
+from ene.search import SearchIndex
 from ene.series_manager import SeriesManager
-from ene.ui.custom import FlowLayout, SeriesButton
 from ene.ui.widgets.episode_browser import EpisodeBrowser
 
+EPISODE_COUNT_ROLE = Qt.UserRole + 1
+
+
+class SeriesModel(QAbstractListModel):
+    """
+    A list model of the shows in a SeriesManager, sorted by title.
+
+    `refresh` only emits signals for the shows that were added, removed or
+    whose episode count changed.
+    """
+
+    def __init__(self, series: SeriesManager, parent=None):
+        super().__init__(parent)
+        self.series = series
+        self.search_index = SearchIndex()
+        self._titles = []
+        self._counts = {}
+
+    def rowCount(self, parent=QModelIndex()):  # pylint: disable=all
+        return 0 if parent.isValid() else len(self._titles)
+
+    def data(self, index, role=Qt.DisplayRole):  # pylint: disable=all
+        if not index.isValid() or not 0 <= index.row() < len(self._titles):
+            return None
+        title = self._titles[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return title
+        if role == EPISODE_COUNT_ROLE:
+            return self._counts[title]
+        return None
+
+    def title(self, index):
+        """
+        Gets the show title at a model index
+
+        Args:
+            index: The model index
+
+        Returns:
+            The show title
+        """
+        return self._titles[index.row()]
+
+    def row(self, title):
+        """
+        Gets the row of a show
+
+        Args:
+            title: The show title
+
+        Returns:
+            The row of the show, None if it is not in the model
+        """
+        row = bisect_left(self._titles, title)
+        if row < len(self._titles) and self._titles[row] == title:
+            return row
+        return None
+
+    def refresh(self):
+        """
+        Updates the model from the SeriesManager, adding new shows, removing
+        deleted ones and updating episode counts
+        """
+        overview = dict(self.series.get_shows_overview())
+        for title in [title for title in self._titles if title not in overview]:
+            self.remove(title)
+        new = sorted(title for title in overview if title not in self._counts)
+        if not self._titles and new:
+            self.beginResetModel()
+            self._titles = new
+            self._counts = overview
+            for title in new:
+                self.search_index.add(title, title)
+            self.endResetModel()
+            return
+        for title in new:
+            row = bisect_left(self._titles, title)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._titles.insert(row, title)
+            self._counts[title] = overview[title]
+            self.search_index.add(title, title)
+            self.endInsertRows()
+        for title, count in overview.items():
+            if self._counts[title] != count:
+                self._counts[title] = count
+                index = self.index(self.row(title))
+                self.dataChanged.emit(index, index, [EPISODE_COUNT_ROLE])
+
+    def remove(self, title):
+        """
+        Removes a show from the model
+
+        Args:
+            title: The show title
+        """
+        row = self.row(title)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._titles[row]
+        del self._counts[title]
+        self.search_index.remove(title)
+        self.endRemoveRows()
+
+
+class SeriesFilterModel(QSortFilterProxyModel):
+    """Filters a SeriesModel by a search query using its search index."""
+
+    def __init__(self, source: SeriesModel, parent=None):
+        super().__init__(parent)
+        self.setSourceModel(source)
+        self.query = ''
+        self._matches = None
+        source.rowsInserted.connect(self._refresh)
+        source.modelReset.connect(self._refresh)
+
+    def set_query(self, query):
+        """
+        Only shows the shows whose title contains the query
+
+        Args:
+            query: The search query, shows everything if empty
+        """
+        self.query = query
+        self._matches = self.sourceModel().search_index.search(query)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):  # pylint: disable=all
+        if self._matches is None:
+            return True
+        source = self.sourceModel()
+        return source.title(source.index(source_row)) in self._matches
+
+    def _refresh(self):
+        if self.query:
+            self.set_query(self.query)
+
+
+class SeriesDelegate(QStyledItemDelegate):
+    """Paints a show as a button with its title and episode count."""
+
+    size = QSize(200, 200)
+    padding = 10
+
+    def sizeHint(self, option, index):  # pylint: disable=all
+        return self.size
+
+    def paint(self, painter, option, index):  # pylint: disable=all
+        widget = option.widget
+        style = widget.style() if widget else QApplication.style()
+        button = QStyleOptionButton()
+        button.rect = option.rect
+        button.state = option.state
+        button.palette = option.palette
+        style.drawControl(QStyle.CE_PushButton, button, painter, widget)
+
+        rect = option.rect.adjusted(self.padding, self.padding, -self.padding, -self.padding)
+        count_text = f'Episodes: {index.data(EPISODE_COUNT_ROLE)}'
+        painter.save()
+        painter.setPen(option.palette.color(QPalette.ButtonText))
+        painter.drawText(rect, Qt.AlignBottom | Qt.AlignLeft, count_text)
+        rect.setBottom(rect.bottom() - option.fontMetrics.height())
+        painter.drawText(rect, Qt.AlignBottom | Qt.AlignLeft | Qt.TextWordWrap, index.data())
+        painter.restore()
+
 
 class SeriesBrowser(QWidget):
     def __init__(self, app, series: SeriesManager, stack_local_files: QStackedWidget):
@@ -15,12 +186,30 @@ class SeriesBrowser(QWidget):
         self.series = series
         self.stack_local_files = stack_local_files
         self.app = app
+        self.model = SeriesModel(series, self)
+        self.proxy = SeriesFilterModel(self.model, self)
+        self.view = None
 
     def init_layout(self):
-        series_layout = FlowLayout()
+        self.view = QListView()
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setMovement(QListView.Static)
+        self.view.setLayoutMode(QListView.Batched)
+        self.view.setUniformItemSizes(True)
+        self.view.setSpacing(3)
+        self.view.setModel(self.proxy)
+        self.view.setItemDelegate(SeriesDelegate(self.view))
+        self.view.clicked.connect(self.on_index_click)
+        self.view.setContextMenuPolicy(Qt.ActionsContextMenu)
+        for label, callback in (('Delete', self.delete_show_action), ('Organize', self.organize)):
+            action = QAction(label, self.view)
+            action.triggered.connect(callback)
+            self.view.addAction(action)
+
+        series_layout = QVBoxLayout()
         series_layout.setContentsMargins(11, 75, 11, 11)
-        series_layout.setAlignment(Qt.AlignTop)
-        series_layout.setSizeConstraint(FlowLayout.SetMaximumSize)
+        series_layout.addWidget(self.view)
         self.setLayout(series_layout)
 
     def setup_search(self, parent_page):
@@ -32,6 +221,7 @@ class SeriesBrowser(QWidget):
         search_bar.setParent(self.search)
         search_bar.setGeometry(11, 11, self.width(), 35)
         search_bar.setPlaceholderText("Search...")
+        search_bar.textChanged.connect(self.filter_shows)
         search_button = QPushButton()
         search_button.setParent(self.search)
         search_button.setGeometry(self.width() + 15, 11, 150, 35)
@@ -41,19 +231,32 @@ class SeriesBrowser(QWidget):
 
     def refresh_shows_view(self):
         """
-        Refreshes the local files UI, updating any existing series buttons and creating
-        any new ones
+        Refreshes the local files UI, updating the episode counts of existing
+        shows and adding any new ones
+        """
+        self.model.refresh()
+
+    def filter_shows(self, text):
+        """
+        Hides all shows whose title does not contain the given text
+
+        Args:
+            text: The text to search for
+        """
+        self.proxy.set_query(text)
+
+    def current_title(self):
         """
-        for show, num_episodes in sorted(self.series.get_shows_overview()):
-            existing = self.findChild(SeriesButton, show)
-            if not existing:
-                button = SeriesButton(show, num_episodes)
-                button.clicked.connect(self.on_series_click)
-                button.add_action('Delete', self.delete_show_action)
-                button.add_action('Organize', self.organize)
-                self.layout().addWidget(button)
-            else:
-                existing.update_episode_count(num_episodes)
+        Gets the title of the selected show
+
+        Returns:
+            The show title, None if no show is selected
+        """
+        index = self.view.currentIndex()
+        return self.model.title(self.proxy.mapToSource(index)) if index.isValid() else None
+
+    def on_index_click(self, index):
+        self.on_series_click(show=self.model.title(self.proxy.mapToSource(index)))
 
     def on_series_click(self, *, show=None):
         """
@@ -61,7 +264,7 @@ class SeriesBrowser(QWidget):
         clicked from the local files page
         """
         if show is None:
-            show = self.sender().title
+            show = self.current_title()
         current_show = self.series.get_show(show)
         self.episode_browser = EpisodeBrowser(self.app, current_show)
         self.episode_browser.width = self.width
@@ -80,11 +283,15 @@ class SeriesBrowser(QWidget):
         """
         Deletes a single show using right click > Delete on a show
         """
-        self.sender().parentWidget().deleteLater()
-        self.series.delete_show(self.sender().parentWidget().title)
+        title = self.current_title()
+        if title is not None:
+            self.series.delete_show(title)
+            self.model.remove(title)
 
     def organize(self):
         """
         Organizes a single show using right click > Organize on a show
         """
-        self.series.organize_show(self.sender().parentWidget().title)
+        title = self.current_title()
+        if title is not None:
+            self.series.organize_show(title)
@@ -21,7 +21,9 @@ from functools import lru_cache, singledispatch, update_wrapper
 from pathlib import Path
 from typing import Callable, Optional
 
-from requests import get
+from requests import Session, get
+
+from ene.cache import resource_cache
 
 
 @lru_cache(None)
@@ -43,22 +45,35 @@ def open_source_code():
     webbrowser.open('https://github.com/MaT1g3R/ene/')
 
 
-def get_resource(url: str, cache_home: Path) -> Path:
+def get_resource(url: str, cache_home: Path, session: Optional[Session] = None) -> Path:
     """
     Download and return a path for a resource from url.
 
+    Resources are kept in the shared resource cache, see `ene.cache.ResourceCache`.
+
     Args:
         url: The resource url
         cache_home: Cache directory path
+        session: The session to download with, a new connection is used if None
 
     Returns:
         Downloaded resource path
+
+    Raises:
+        HTTPError: If the download failed
+        IOError: If the download was incomplete
     """
-    path = Path(cache_home, url.partition('anilist.co/')[-1])
-    if not path.is_file():
-        path.parent.mkdir(parents=True, exist_ok=True)
-        res = get(url)
-        path.write_bytes(res.content)
+    cache = resource_cache(cache_home)
+    key = url.partition('anilist.co/')[-1]
+    path = cache.lookup(key)
+    if path is None:
+        res = session.get(url) if session else get(url)
+        res.raise_for_status()
+        length = res.headers.get('Content-Length')
+        if 'Content-Encoding' not in res.headers and length and int(length) != len(res.content):
+            raise IOError(f'Incomplete download of {url}')
+        cache.put(key, res.content)
+        path = cache.path(key)
     return path
 
 
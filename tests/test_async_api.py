@@ -0,0 +1,90 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+import json
+
+import pytest
+import responses
+
+from ene.api import API, AsyncAPI
+from ene.constants import GRAPHQL_URL
+from . import CACHE_HOME, DATA_HOME, rmdir
+
+QUERY = 'query ($page: Int, $perPage: Int) { Page { pageInfo { lastPage hasNextPage } } }'
+
+
+@pytest.fixture()
+def async_api():
+    rmdir(DATA_HOME, True)
+    DATA_HOME.mkdir(parents=True)
+    (DATA_HOME / 'token').write_text('foo')
+    try:
+        yield AsyncAPI(API(DATA_HOME, CACHE_HOME), concurrency=3)
+    finally:
+        rmdir(DATA_HOME, True)
+        rmdir(CACHE_HOME, True)
+
+
+def mock_pages(last_page, actual_last_page=None):
+    actual_last_page = actual_last_page or last_page
+
+    def _callback(request):
+        page = json.loads(request.body)['variables']['page']
+        body = {'data': {'Page': {
+            'pageInfo': {'lastPage': last_page, 'hasNextPage': page < actual_last_page},
+            'media': [page]
+        }}}
+        return 200, {}, json.dumps(body)
+
+    responses.add_callback(responses.POST, GRAPHQL_URL, callback=_callback)
+
+
+def collect_pages(async_api, per_page=10):
+    async def _collect():
+        return [
+            res.unwrap()['data']['Page']['media'][0]
+            async for res in async_api.query_pages(QUERY, per_page)
+        ]
+
+    return asyncio.get_event_loop().run_until_complete(_collect())
+
+
+@responses.activate
+def test_query(async_api):
+    responses.add(responses.POST, GRAPHQL_URL, json={'data': {'GenreCollection': ['foo']}})
+    res = asyncio.get_event_loop().run_until_complete(async_api.get_genres())
+    assert res.unwrap() == ['foo']
+
+
+@responses.activate
+def test_query_pages_in_order(async_api):
+    mock_pages(7)
+    assert collect_pages(async_api) == list(range(1, 8))
+    assert len(responses.calls) == 7
+
+
+@responses.activate
+def test_query_pages_single(async_api):
+    mock_pages(1)
+    assert collect_pages(async_api) == [1]
+
+
+@responses.activate
+def test_query_pages_past_last_page(async_api):
+    mock_pages(3, 5)
+    assert collect_pages(async_api) == [1, 2, 3, 4, 5]
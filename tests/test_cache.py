@@ -0,0 +1,188 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+import attr
+import pytest
+import responses
+
+from ene.api import API
+from ene.api.cache import ResponseCache, is_mutation
+from ene.cache import DiskCache
+from ene.constants import GRAPHQL_URL
+from . import CACHE_HOME, DATA_HOME, rmdir
+
+MOCK_RESPONSE = {'data': {'GenreCollection': ['Action', 'Comedy']}}
+
+
+@pytest.fixture()
+def cache_dir():
+    rmdir(CACHE_HOME, True)
+    try:
+        yield CACHE_HOME
+    finally:
+        rmdir(CACHE_HOME, True)
+
+
+@pytest.fixture()
+def api(cache_dir):
+    rmdir(DATA_HOME, True)
+    DATA_HOME.mkdir(parents=True)
+    (DATA_HOME / 'token').write_text('foo')
+    try:
+        yield API(DATA_HOME, cache_dir)
+    finally:
+        rmdir(DATA_HOME, True)
+
+
+def test_disk_cache_put_get(cache_dir):
+    cache = DiskCache(cache_dir, 100)
+    cache.put('foo/bar', b'baz')
+    assert cache.get('foo/bar') == b'baz'
+    assert cache.get('qux') is None
+    assert (cache_dir / 'foo' / 'bar').read_bytes() == b'baz'
+    assert cache.size == 3
+
+
+def test_disk_cache_lru_eviction(cache_dir):
+    cache = DiskCache(cache_dir, 10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'1234')
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert not (cache_dir / 'b').exists()
+    assert cache.size == 8
+
+
+def test_disk_cache_reload(cache_dir):
+    cache = DiskCache(cache_dir, 100)
+    cache.put('a', b'1234')
+    (cache_dir / 'b.123.part').write_bytes(b'12')
+    reloaded = DiskCache(cache_dir, 100)
+    assert list(reloaded) == ['a']
+    assert reloaded.size == 4
+    assert not (cache_dir / 'b.123.part').exists()
+
+
+def test_make_key_normalized(cache_dir):
+    cache = ResponseCache(DiskCache(cache_dir, 100))
+    key = cache.make_key('query { foo }', {'a': 1, 'b': 2})
+    assert key == cache.make_key('query {\n    foo\n}', {'b': 2, 'a': 1})
+    assert key != cache.make_key('query { foo }', {'a': 2, 'b': 2})
+
+
+def test_make_key_user(cache_dir):
+    cache = ResponseCache(DiskCache(cache_dir, 100), user='foo')
+    other = ResponseCache(DiskCache(cache_dir, 100), user='bar')
+    assert cache.make_key('{ foo }', kind='media').startswith('media/')
+    assert cache.make_key('{ foo }', kind='media') != other.make_key('{ foo }', kind='media')
+    assert cache.make_key('{ foo }', kind='genres') == other.make_key('{ foo }', kind='genres')
+
+
+def test_response_cache_invalidate(cache_dir):
+    cache = ResponseCache(DiskCache(cache_dir, 1000))
+    keys = {kind: cache.make_key('{ foo }', kind=kind) for kind in ('media', 'browse', 'genres')}
+    for kind, key in keys.items():
+        cache.put(key, kind, {})
+    cache.invalidate()
+    assert [kind for kind, key in keys.items() if cache.get(key)] == ['genres']
+
+
+def test_is_mutation():
+    assert is_mutation('mutation ($id: Int) { foo }')
+    assert is_mutation('\n  mutation { foo }')
+    assert not is_mutation('query { mutation }')
+
+
+def test_response_cache_ttl(cache_dir):
+    cache = ResponseCache(DiskCache(cache_dir, 100), {'browse': 0})
+    assert cache.ttl('genres') > 0
+    assert cache.ttl('browse') == 0
+    assert cache.ttl(None) == 0
+    cache.put('foo', 'browse', {})
+    assert cache.get('foo') is None
+
+
+@responses.activate
+def test_query_cache_hit(api):
+    responses.add(responses.POST, GRAPHQL_URL, json=MOCK_RESPONSE)
+    assert api.get_genres().unwrap() == ['Action', 'Comedy']
+    assert api.get_genres().unwrap() == ['Action', 'Comedy']
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_query_no_kind_not_cached(api):
+    responses.add(responses.POST, GRAPHQL_URL, json=MOCK_RESPONSE)
+    api.query('{GenreCollection}')
+    api.query('{GenreCollection}')
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_query_mutation_not_cached(api):
+    responses.add(responses.POST, GRAPHQL_URL, json=MOCK_RESPONSE)
+    api.query('mutation { GenreCollection }', kind='genres')
+    api.query('mutation { GenreCollection }', kind='genres')
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_query_error_not_cached(api):
+    responses.add(responses.POST, GRAPHQL_URL, json={'errors': ['foo']}, status=400)
+    assert not api.get_genres()
+    assert not api.get_genres()
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_query_revalidate(api):
+    responses.add(responses.POST, GRAPHQL_URL, json=MOCK_RESPONSE, headers={'ETag': 'foo'})
+    api.get_genres()
+    key = api.cache.make_key('{GenreCollection}', kind='genres')
+    entry = api.cache.get(key)
+    assert entry.etag == 'foo'
+
+    entry.expires = 0
+    api.cache.store.put(key, json.dumps(attr.asdict(entry)).encode())
+    responses.replace(responses.POST, GRAPHQL_URL, status=304)
+    assert api.get_genres().unwrap() == ['Action', 'Comedy']
+    assert len(responses.calls) == 2
+    assert responses.calls[-1].request.headers['If-None-Match'] == 'foo'
+    assert api.cache.get(key).fresh
+
+
+@responses.activate
+@pytest.mark.parametrize('status, invalidated', [(200, True), (400, False)])
+def test_mutation_invalidates_user_kinds(api, status, invalidated):
+    def _callback(request):
+        if 'mutation' in json.loads(request.body)['query']:
+            return status, {}, json.dumps({'data': {}})
+        return 200, {}, json.dumps(MOCK_RESPONSE)
+
+    responses.add_callback(responses.POST, GRAPHQL_URL, callback=_callback)
+    browse = 'query { Page { media(onList: true) { id } } }'
+    api.cache.ttls['browse'] = 60
+    api.query(browse, kind='browse')
+    api.get_genres()
+    api.query('mutation { SaveMediaListEntry(mediaId: 1) { id } }')
+    api.query(browse, kind='browse')
+    api.get_genres()
+    assert len(responses.calls) == (4 if invalidated else 3)
@@ -0,0 +1,103 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import time
+from threading import Event, Lock
+
+import pytest
+import responses
+from requests import HTTPError
+
+from ene.downloader import ImageDownloader
+from . import CACHE_HOME, rmdir
+
+IMAGE_URL = 'https://cdn.anilist.co/img/dir/anime/reg/{}.jpg'
+
+
+@pytest.fixture()
+def downloader():
+    rmdir(CACHE_HOME, True)
+    downloader = ImageDownloader(CACHE_HOME, max_workers=8, per_host=2)
+    try:
+        yield downloader
+    finally:
+        downloader.close()
+        rmdir(CACHE_HOME, True)
+
+
+@responses.activate
+def test_fetch(downloader):
+    url = IMAGE_URL.format(1)
+    responses.add(responses.GET, url, b'image')
+    path = downloader.fetch(url).result(5)
+    assert path == CACHE_HOME / 'img/dir/anime/reg/1.jpg'
+    assert path.read_bytes() == b'image'
+    cached = downloader.fetch(url)
+    assert cached.done()
+    assert cached.result() == path
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_fetch_deduplicates(downloader):
+    url = IMAGE_URL.format(1)
+    release = Event()
+
+    def callback(_):
+        release.wait(5)
+        return 200, {}, b'image'
+
+    responses.add_callback(responses.GET, url, callback)
+    first = downloader.fetch(url)
+    second = downloader.fetch(url)
+    assert first is second
+    release.set()
+    first.result(5)
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_fetch_per_host_limit(downloader):
+    lock = Lock()
+    running = [0]
+    peak = [0]
+
+    def callback(_):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return 200, {}, b'image'
+
+    for i in range(6):
+        responses.add_callback(responses.GET, IMAGE_URL.format(i), callback)
+    futures = [downloader.fetch(IMAGE_URL.format(i)) for i in range(6)]
+    for future in futures:
+        future.result(5)
+    assert peak[0] == 2
+
+
+@responses.activate
+def test_fetch_error(downloader):
+    url = IMAGE_URL.format(1)
+    responses.add(responses.GET, url, b'', status=404)
+    with pytest.raises(HTTPError):
+        downloader.fetch(url).result(5)
+    responses.replace(responses.GET, url, b'image')
+    assert downloader.fetch(url).result(5).read_bytes() == b'image'
@@ -0,0 +1,96 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+
+import pytest
+import responses
+
+from ene.api import API
+from ene.api.anilist import _browse_query
+from ene.api.fields import ALL_FIELDS, media_selection
+from ene.constants import GRAPHQL_URL
+from . import CACHE_HOME, DATA_HOME, rmdir
+
+
+@pytest.fixture()
+def api():
+    rmdir(DATA_HOME, True)
+    DATA_HOME.mkdir(parents=True)
+    (DATA_HOME / 'token').write_text('foo')
+    try:
+        yield API(DATA_HOME, CACHE_HOME)
+    finally:
+        rmdir(DATA_HOME, True)
+        rmdir(CACHE_HOME, True)
+
+
+def test_selection_compact():
+    assert media_selection(()) == 'id'
+    assert media_selection(['title']).split() == ['id', 'title', '{', 'userPreferred', '}']
+
+
+def test_selection_dependencies():
+    selection = media_selection(['next_airing_episode', 'type'])
+    assert selection.split().count('type') == 1
+    assert 'nextAiringEpisode' in selection
+
+
+def test_selection_order_independent():
+    assert media_selection(['genres', 'title']) == media_selection(('title', 'genres'))
+
+
+def test_selection_indent():
+    assert all(line.startswith('    ') for line in media_selection(ALL_FIELDS, 4).splitlines())
+
+
+def test_selection_unknown():
+    with pytest.raises(KeyError):
+        media_selection(['title', 'foo'])
+
+
+def test_browse_query_memoized():
+    assert _browse_query(frozenset(['title'])) is _browse_query(frozenset(['title']))
+    assert 'description' not in _browse_query(frozenset(['title']))
+    assert 'description' in _browse_query(ALL_FIELDS)
+
+
+@responses.activate
+def test_browse_anime_fields(api):
+    responses.add(responses.POST, GRAPHQL_URL, json={'data': {'Page': {
+        'pageInfo': {'hasNextPage': False},
+        'media': [{'id': 1, 'title': {'userPreferred': 'foo'}}]
+    }}})
+    media, has_next = api.browse_anime(fields=['title']).unwrap()
+    media = list(media)
+    query = json.loads(responses.calls[0].request.body)['query']
+    assert 'studios' not in query
+    assert not has_next
+    assert media[0].title.unwrap() == 'foo'
+    assert media[0].description.is_none
+    assert media[0].genres == []
+    assert media[0].studio.is_none
+
+
+@responses.activate
+def test_get_media(api):
+    responses.add(responses.POST, GRAPHQL_URL, json={'data': {'Media': {
+        'id': 1, 'description': 'bar'
+    }}})
+    media = api.get_media(1, fields=['description']).unwrap()
+    assert media.id == 1
+    assert media.description.unwrap() == 'bar'
@@ -1,7 +1,9 @@
 import ene.files
+from ene.entities import Episode
 from . import HERE
 
 import re
+from pathlib import Path
 import pytest
 
 TEST_PATH = HERE / 'ene'
@@ -76,3 +78,182 @@ def test_find(manager, mock_shows):
     for show in mock_shows:
         assert mock_shows[show] == [x.path for x in manager.find_episodes(show, mock_shows[show])]
 
+
+@pytest.fixture()
+def library(tmp_path):
+    for folder, files in {
+        'isekai foo': ['isekai foo e1.mkv', 'isekai foo e2.mkv', 'notes.txt'],
+        'Ongoing/bar quest': ['bar quest 01.avi', 'bar quest 02.avi', 'bar quest NCOP.avi'],
+        'Ongoing': ['adventures of baz ep1.mp4'],
+    }.items():
+        directory = tmp_path / folder
+        directory.mkdir(parents=True, exist_ok=True)
+        for file in files:
+            (directory / file).touch()
+    yield tmp_path
+
+
+@pytest.mark.parametrize('processes', [0, 2])
+def test_scanner(library, processes):
+    reports = []
+    scanner = ene.files.LibraryScanner(
+        [library], processes=processes, progress=lambda *args: reports.append(args)
+    )
+    series = scanner.scan()
+    found = {title: {episode.path for episode in show.episodes} for title, show in series.items()}
+    assert found == {
+        'isekai foo': {library / 'isekai foo' / f'isekai foo e{i}.mkv' for i in (1, 2)},
+        'bar quest': {library / 'Ongoing' / 'bar quest' / f'bar quest 0{i}.avi' for i in (1, 2)},
+        'adventures of baz': {library / 'Ongoing' / 'adventures of baz ep1.mp4'},
+    }
+    assert reports[-1] == (4, 5)
+
+
+def test_scanner_missing_root(tmp_path):
+    assert not ene.files.LibraryScanner([tmp_path / 'missing'], processes=0).scan()
+
+
+def test_traverse_directories(library):
+    manager = ene.files.FileManager({'Local Paths': [library], 'Scanner Processes': 0})
+    manager.traverse_directories()
+    assert sorted(manager.series) == ['adventures of baz', 'bar quest', 'isekai foo']
+    assert len(manager.series['isekai foo']) == 2
+
+
+def _changes(result):
+    return {(change.kind, change.path, change.old_path) for change in result.changes}
+
+
+def test_rescan_directories(library):
+    Kind = ene.files.FileChange.Kind
+    first = ene.files.rescan_directories([library], {})
+    assert len(first.changes) == 6
+    assert all(change.kind is Kind.ADDED for change in first.changes)
+    assert not first.removed
+
+    snapshot = dict(first.updated)
+    assert not ene.files.rescan_directories([library], snapshot).changes
+
+    foo = library / 'isekai foo'
+    bar = library / 'Ongoing' / 'bar quest'
+    (foo / 'isekai foo e3.mkv').touch()
+    (foo / 'isekai foo e1.mkv').unlink()
+    (bar / 'bar quest 02.avi').rename(foo / 'bar quest 02.avi')
+    result = ene.files.rescan_directories([library], snapshot)
+    assert _changes(result) == {
+        (Kind.ADDED, foo / 'isekai foo e3.mkv', None),
+        (Kind.REMOVED, foo / 'isekai foo e1.mkv', None),
+        (Kind.MOVED, foo / 'bar quest 02.avi', bar / 'bar quest 02.avi'),
+    }
+    assert set(result.updated) == {foo, bar}
+
+    snapshot.update(result.updated)
+    for file in bar.iterdir():
+        file.unlink()
+    bar.rmdir()
+    result = ene.files.rescan_directories([library], snapshot)
+    assert result.removed == [bar]
+    assert _changes(result) == {
+        (Kind.REMOVED, bar / name, None) for name in ('bar quest 01.avi', 'bar quest NCOP.avi')
+    }
+
+
+def test_rescan_skips_unchanged(library, monkeypatch):
+    snapshot = ene.files.rescan_directories([library], {}).updated
+    listed = []
+    snapshot_directory = ene.files._snapshot_directory
+    monkeypatch.setattr(
+        ene.files, '_snapshot_directory',
+        lambda path, mtime: listed.append(path) or snapshot_directory(path, mtime)
+    )
+    (library / 'isekai foo' / 'isekai foo e3.mkv').touch()
+    ene.files.rescan_directories([library], snapshot)
+    assert listed == [library / 'isekai foo']
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('isekai foo e1.mkv', ene.files.ParsedFilename('isekai foo', episode=1)),
+    ('[Group] Isekai Foo S2 - 03v2 [1080p].mkv', ene.files.ParsedFilename(
+        'Isekai Foo Season 2', season=2, episode=2, group='Group', resolution=1080, version=2
+    )),
+    ('Adventures_of_Baz_ep04_(1920x1080).mp4', ene.files.ParsedFilename(
+        'Adventures of Baz', episode=4, resolution=1080
+    )),
+    ('Bar Quest Season 3 - 05 [720p].mkv', ene.files.ParsedFilename(
+        'Bar Quest Season 3', season=3, episode=5, resolution=720
+    )),
+])
+def test_parse_filename(name, expected):
+    assert ene.files.parse_filename(name) == expected
+
+
+@pytest.mark.parametrize('name', MOCK_FILES + [
+    '[Group] Isekai Foo S2 - 03v2 [1080p].mkv', '01. foo.mkv', 'foo.mp4', 'foo_-_12_(x264).mkv',
+])
+def test_parse_filename_episode(name):
+    parsed = ene.files.parse_filename(name)
+    assert parsed.title == ene.files.clean_title(Path(name).stem)
+    episode = Episode(Path(name))
+    episode.parse_episode_number(parsed.title)
+    assert parsed.episode == episode.number
+
+
+@pytest.mark.parametrize('processes', [0, 2])
+def test_scanner_parse(tmp_path, processes):
+    paths = [tmp_path / 'foo' / f'isekai foo e{i}.mkv' for i in range(1, 301)]
+    paths.append(tmp_path / 'bar' / 'bar quest 01.avi')
+    paths.append(tmp_path / 'bar' / 'bar quest NCOP.avi')
+    episodes = ene.files.LibraryScanner([], processes=processes).parse(paths)
+    assert len(episodes) == 301
+    assert {title for title, _ in episodes} == {'isekai foo', 'bar quest'}
+    assert {episode.number for title, episode in episodes if title == 'isekai foo'} == set(
+        range(1, 301)
+    )
+
+
+def test_scanner_parse_few_files_inline(tmp_path, monkeypatch):
+    def no_pool(*args):
+        raise AssertionError('process pool started')
+
+    monkeypatch.setattr(ene.files, 'ProcessPoolExecutor', no_pool)
+    paths = [tmp_path / 'a' / 'isekai foo 01.mkv', tmp_path / 'b' / 'bar quest 01.avi']
+    episodes = ene.files.LibraryScanner([], processes=2).parse(paths)
+    assert sorted(title for title, _ in episodes) == ['bar quest', 'isekai foo']
+
+
+def test_scanner_parse_cached_in_parent(tmp_path, library, monkeypatch):
+    ene.files.clear_parse_cache()
+    paths = [tmp_path / 'foo' / f'isekai foo e{i}.mkv' for i in range(1, 301)]
+    scanner = ene.files.LibraryScanner([library], processes=2)
+    first = scanner.parse(paths)
+
+    def found():
+        return {
+            title: {episode.path for episode in show.episodes}
+            for title, show in scanner.scan().items()
+        }
+
+    series = found()
+
+    def no_pool(*args):
+        raise AssertionError('process pool started')
+
+    monkeypatch.setattr(ene.files, 'ProcessPoolExecutor', no_pool)
+    assert [(title, episode.path) for title, episode in scanner.parse(paths)] == [
+        (title, episode.path) for title, episode in first
+    ]
+    assert found() == series
+    assert scanner.episodes == 5
+
+
+def test_scanner_rescan_progress(library):
+    reports = []
+    scanner = ene.files.LibraryScanner(
+        [library], processes=0, progress=lambda *args: reports.append(args)
+    )
+    result = scanner.rescan({})
+    assert len(result.updated) == 4
+    assert reports[-1] == (4, 6)
+    reports.clear()
+    assert not scanner.rescan(result.updated).changes
+    assert reports[-1] == (4, 0)
@@ -0,0 +1,93 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from PySide2.QtCore import QPoint, QRect
+from PySide2.QtWidgets import QApplication, QPushButton, QWidget
+import pytest
+
+from ene.ui.custom import FlowLayout
+
+MARGIN = 7
+SPACING = 5
+
+
+def reference_layout(layout, rect):
+    """The original uncached layout algorithm."""
+    effective = rect.adjusted(MARGIN, MARGIN, -MARGIN, -MARGIN)
+    x, y = effective.x(), effective.y()
+    line_height = 0
+    geometries = []
+    for item in layout:
+        hint = item.sizeHint()
+        next_x = x + hint.width() + SPACING
+        if next_x - SPACING > effective.right() and line_height > 0:
+            x = effective.x()
+            y = y + line_height + SPACING
+            next_x = x + hint.width() + SPACING
+            line_height = 0
+        geometries.append(QRect(QPoint(x, y), hint))
+        x = next_x
+        line_height = max(line_height, hint.height())
+    return geometries, y + line_height - rect.y() + MARGIN
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    yield QApplication.instance() or QApplication([])
+
+
+@pytest.fixture()
+def layout(qapp):
+    widget = QWidget()
+    layout = FlowLayout(widget, MARGIN, SPACING, SPACING)
+    for i in range(40):
+        layout.addWidget(QPushButton('x' * (i % 13 + 1)))
+    yield layout
+    widget.deleteLater()
+
+
+def assert_layout(layout, rect):
+    geometries, height = reference_layout(layout, rect)
+    assert layout.do_layout(rect, False) == height
+    assert [item.geometry() for item in layout] == geometries
+    assert layout.heightForWidth(rect.width()) == height
+
+
+@pytest.mark.parametrize('width', [100, 300, 801])
+def test_layout_matches_reference(layout, width):
+    assert_layout(layout, QRect(3, 4, width, 0))
+
+
+def test_append_lays_out_tail(layout, qapp):
+    assert_layout(layout, QRect(0, 0, 400, 0))
+    first = layout[0].widget()
+    moved = []
+    first.moveEvent = lambda event: moved.append(event)
+    layout.addWidget(QPushButton('appended'))
+    qapp.processEvents()
+    assert_layout(layout, QRect(0, 0, 400, 0))
+    assert not moved
+
+
+def test_remove_and_resize(layout, qapp):
+    assert_layout(layout, QRect(0, 0, 400, 0))
+    layout.takeAt(5).widget().setParent(None)
+    layout[10].widget().setText('a much longer label than before')
+    qapp.processEvents()
+    assert_layout(layout, QRect(0, 0, 400, 0))
+    assert layout.heightForWidth(200) == reference_layout(layout, QRect(0, 0, 200, 0))[1]
+    assert_layout(layout, QRect(0, 0, 400, 0))
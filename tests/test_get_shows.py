@@ -0,0 +1,108 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+
+import pytest
+import responses
+
+from ene.api import API
+from ene.constants import GRAPHQL_URL
+from . import CACHE_HOME, DATA_HOME, rmdir
+
+TITLES = [f'show {i}' for i in range(10)]
+MISSING = 'show 7'
+
+
+@pytest.fixture()
+def api():
+    rmdir(DATA_HOME, True)
+    DATA_HOME.mkdir(parents=True)
+    (DATA_HOME / 'token').write_text('foo')
+    try:
+        yield API(DATA_HOME, CACHE_HOME, {'media': 0})
+    finally:
+        rmdir(DATA_HOME, True)
+        rmdir(CACHE_HOME, True)
+
+
+def mock_lookup(max_aliases=None):
+    def _callback(request):
+        variables = json.loads(request.body)['variables']
+        if max_aliases and len(variables) > max_aliases:
+            return 400, {}, json.dumps({'errors': [{'message': 'Max query complexity'}]})
+        data = {
+            key.replace('t', 'm'): None if title == MISSING else {'id': int(title.split()[-1])}
+            for key, title in variables.items()
+        }
+        status = 404 if None in data.values() else 200
+        return status, {}, json.dumps({'data': data})
+
+    responses.add_callback(responses.POST, GRAPHQL_URL, callback=_callback)
+
+
+def check_results(results):
+    assert list(results) == TITLES
+    for title, res in results.items():
+        if title == MISSING:
+            assert res.unwrap_err()[0] == 404
+        else:
+            assert res.unwrap().id == int(title.split()[-1])
+
+
+@responses.activate
+def test_get_shows_batched(api):
+    mock_lookup()
+    results = api.get_shows(TITLES[:7], batch_size=3)
+    assert list(results) == TITLES[:7]
+    assert [res.unwrap().id for res in results.values()] == list(range(7))
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_get_shows_not_found(api):
+    mock_lookup()
+    check_results(api.get_shows(TITLES, batch_size=10))
+
+
+@responses.activate
+def test_get_shows_complexity_fallback(api):
+    mock_lookup(max_aliases=3)
+    check_results(api.get_shows(TITLES + TITLES[:2], batch_size=10))
+
+
+@responses.activate
+def test_get_shows_server_error(api):
+    api.max_retries = 0
+    responses.add(responses.POST, GRAPHQL_URL, status=500)
+    results = api.get_shows(TITLES, batch_size=5)
+    assert all(res.unwrap_err()[0] == 500 for res in results.values())
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+@pytest.mark.parametrize('status', [400, 401, 403])
+def test_get_shows_client_error(api, status):
+    responses.add(
+        responses.POST,
+        GRAPHQL_URL,
+        json={'errors': [{'message': 'Invalid token'}]},
+        status=status
+    )
+    results = api.get_shows(TITLES, batch_size=10)
+    assert all(res.unwrap_err()[0] == status for res in results.values())
+    assert len(responses.calls) == 1
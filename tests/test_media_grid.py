@@ -0,0 +1,100 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from concurrent.futures import Future
+
+from PySide2.QtWidgets import QApplication
+import pytest
+
+from ene.api.media import Media
+from ene.ui.widgets.media_browser import MediaDisplay, MediaGrid
+
+
+class MockThumbnails:
+    def get(self, media_id, size):
+        return None
+
+    def load(self, media_id, url, size):
+        return Future()
+
+
+def _media(media_id):
+    return Media({
+        'id': media_id,
+        'type': 'ANIME',
+        'title': {'userPreferred': f'Title {media_id}'},
+        'genres': ['Action'],
+    }, '')
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    yield QApplication.instance() or QApplication([])
+
+
+@pytest.fixture()
+def grid(qapp):
+    grid = MediaGrid(MockThumbnails())
+    grid.resize(1000, 700)
+    grid.set_visible_area(0, 700)
+    yield grid
+    grid.deleteLater()
+
+
+def test_grid_recycles_displays(grid):
+    grid.append([_media(i) for i in range(500)])
+    assert grid.columns == 2
+    assert grid.minimumHeight() == grid.content_height()
+    for top in range(0, grid.content_height(), 300):
+        grid.set_visible_area(top, 700)
+    widgets = grid.widget_count
+    assert widgets <= 6 * grid.columns
+    for top in range(grid.content_height(), 0, -300):
+        grid.set_visible_area(top, 700)
+    assert grid.widget_count == widgets
+
+
+def test_grid_binds_visible_media(grid):
+    grid.append([_media(i) for i in range(100)])
+    row_h = MediaDisplay.image_h + grid.spacing
+    grid.set_visible_area(grid.margin + 20 * row_h, 700)
+    bound = sorted(grid._bound)  # pylint: disable=W0212
+    assert bound[0] == 19 * 2
+    display = grid._bound[40]  # pylint: disable=W0212
+    assert display.title_label.text() == 'Title 40'
+    assert display.y() == grid.margin + 20 * row_h
+
+
+def test_grid_clear(grid):
+    grid.append([_media(i) for i in range(10)])
+    grid.clear()
+    assert len(grid) == 0
+    assert grid.content_height() == 0
+    assert not any(child.isVisible() for child in grid.findChildren(MediaDisplay))
+
+
+def test_display_bind_hides_missing_fields(qapp):
+    display = MediaDisplay(_media(1))
+    assert not display.studio_label.isVisibleTo(display)
+    display.bind(Media({
+        'id': 2,
+        'type': 'ANIME',
+        'studios': {'edges': [{'isMain': True, 'node': {'id': 1, 'name': 'Studio'}}]},
+    }, ''))
+    assert display.studio_label.isVisibleTo(display)
+    assert display.studio_label.text() == 'Studio'
+    assert not display.title_label.isVisibleTo(display)
@@ -0,0 +1,389 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+from ene.entities import Episode, Show
+from ene.errors import DatabaseError
+from ene.files import FileChange, rescan_directories
+from ene.persistence.migrations import SCHEMA_VERSION, check_sqlite_version, schema_version
+from ene.persistence.models import EneDatabase, db
+from ene.persistence.write_behind import WriteBehindQueue
+from ene.series_manager import SeriesManager
+
+
+@pytest.fixture()
+def library(tmp_path):
+    root = tmp_path / 'library'
+    for folder, files in {
+        'isekai foo': ['isekai foo e1.mkv', 'isekai foo e2.mkv'],
+        'bar quest': ['bar quest 01.avi'],
+    }.items():
+        (root / folder).mkdir(parents=True)
+        for file in files:
+            (root / folder / file).touch()
+    yield root
+
+
+@pytest.fixture()
+def series(tmp_path, library):
+    manager = SeriesManager({'Local Paths': [library]})
+    manager.init_db(tmp_path)
+    yield manager
+    manager.close_db()
+
+
+def test_snapshot_round_trip(series, library):
+    access = series._db
+    result = rescan_directories([library], {})
+    access.save_snapshot(result.updated, [])
+    assert access.load_snapshot() == result.updated
+
+    access.save_snapshot({}, [library / 'bar quest'])
+    assert set(access.load_snapshot()) == {library, library / 'isekai foo'}
+
+
+def test_refresh_from_files(series, library):
+    changes = series.refresh_from_files()
+    assert {change.kind for change in changes} == {FileChange.Kind.ADDED}
+    assert dict(series.get_shows_overview()) == {'isekai foo': 2, 'bar quest': 1}
+    assert not series.refresh_from_files()
+
+    foo = library / 'isekai foo'
+    (foo / 'isekai foo e1.mkv').unlink()
+    (library / 'bar quest' / 'bar quest 01.avi').rename(foo / 'bar quest 01.avi')
+    (foo / 'isekai foo e3.mkv').touch()
+    series.refresh_from_files()
+    assert {episode.path for episode in series.get_show('bar quest').episodes} == {
+        foo / 'bar quest 01.avi'
+    }
+
+    reloaded = SeriesManager({'Local Paths': [library]})
+    reloaded._db, reloaded._writer = series._db, series._writer
+    reloaded.fetch_shows_from_db()
+    assert {
+        episode.path.name for episode in reloaded.get_show('isekai foo').episodes
+    } == {'isekai foo e2.mkv', 'isekai foo e3.mkv'}
+    assert not reloaded.refresh_from_files()
+
+
+def test_refresh_directories(series, library):
+    series.refresh_from_files()
+    (library / 'isekai foo' / 'isekai foo e3.mkv').touch()
+    (library / 'bar quest' / 'bar quest 01.avi').unlink()
+    changes = series.refresh_from_files(directories=[library / 'isekai foo'])
+    assert [(change.kind, change.path.name) for change in changes] == [
+        (FileChange.Kind.ADDED, 'isekai foo e3.mkv')
+    ]
+    assert dict(series.get_shows_overview()) == {'isekai foo': 3, 'bar quest': 1}
+    assert sorted(series.library_directories()) == [
+        library, library / 'bar quest', library / 'isekai foo'
+    ]
+    series.refresh_from_files(directories=[library])
+    assert dict(series.get_shows_overview()) == {'isekai foo': 3, 'bar quest': 0}
+
+
+def test_refresh_across_threads(series, library):
+    def in_thread(function, *args):
+        results = []
+
+        def run():
+            with series.db_connection():
+                results.append(function(*args))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        return results[0]
+
+    update = in_thread(series.scan_files)
+    assert len(update.result.changes) == 3
+    assert not dict(series.get_shows_overview())
+    removed = series.apply_files(update)
+    assert dict(series.get_shows_overview()) == {'isekai foo': 2, 'bar quest': 1}
+    in_thread(series.save_files, update, removed)
+    assert set(_saved_states(series._db)) == {
+        'isekai foo e1.mkv', 'isekai foo e2.mkv', 'bar quest 01.avi'
+    }
+    assert not series.refresh_from_files()
+
+
+@pytest.mark.parametrize('emptied', [False, True])
+def test_refresh_unavailable_root(series, library, emptied):
+    series.refresh_from_files()
+    show = series.get_show('isekai foo')
+    for episode in show.episodes:
+        episode.state = Episode.State.WATCHED
+        series.save_episode(episode, show)
+    moved = library.with_name('unmounted')
+    library.rename(moved)
+    if emptied:
+        library.mkdir()
+    assert not series.refresh_from_files()
+    assert not series.refresh_from_files(directories=[library / 'isekai foo'])
+    if emptied:
+        library.rmdir()
+    moved.rename(library)
+    assert not series.refresh_from_files()
+    states = {f'isekai foo e{i}.mkv': Episode.State.WATCHED for i in (1, 2)}
+    assert {
+        episode.path.name: episode.state for episode in series.get_show('isekai foo').episodes
+    } == states
+    series._writer.flush(5)
+    assert {
+        name: state for name, state in _saved_states(series._db).items() if name in states
+    } == states
+
+
+def test_get_all_shows(series):
+    access = series._db
+    foo = Show('foo', show_id=1, list_id=2)
+    for number in range(3):
+        foo.add_or_update_episode(Episode(Path(f'/foo/{number}.mkv'), number=number))
+    access.save_show_list([foo, Show('bar')])
+
+    shows = {show.title: show for show in access.get_all_shows()}
+    assert sorted(shows) == ['bar', 'foo']
+    assert not shows['bar'].episodes
+    assert (shows['foo'].show_id, shows['foo'].list_id) == (1, 2)
+    assert {
+        (episode.path, episode.number, episode.episode_id) for episode in shows['foo'].episodes
+    } == {(episode.path, episode.number, episode.episode_id) for episode in foo.episodes}
+
+
+def test_save_show_list_upsert(series):
+    access = series._db
+    foo = Show('foo')
+    foo.add_or_update_episode(Episode(Path('/foo/1.mkv'), number=1))
+    access.save_show_list([foo])
+    first = next(iter(foo.episodes))
+    episode_id = first.episode_id
+    assert episode_id is not None
+
+    foo.show_id = 10
+    first.state = Episode.State.WATCHED
+    foo.add_or_update_episode(Episode(Path('/foo/2.mkv'), number=2))
+    access.save_show_list([Show('foo', show_id=10, episodes=foo.episodes)])
+    assert first.episode_id == episode_id
+
+    shows = list(access.get_all_shows())
+    assert len(shows) == 1
+    assert shows[0].show_id == 10
+    saved = {episode.path.name: episode for episode in shows[0].episodes}
+    assert sorted(saved) == ['1.mkv', '2.mkv']
+    assert saved['1.mkv'].state is Episode.State.WATCHED
+    assert saved['1.mkv'].episode_id == episode_id
+
+
+LEGACY_SCHEMA = '''
+CREATE TABLE "Show" ("id" INTEGER NOT NULL PRIMARY KEY, "title" TEXT NOT NULL,
+    "anilist_show_id" INTEGER, "list_id" INTEGER);
+CREATE UNIQUE INDEX "showmodel_title" ON "Show" ("title");
+CREATE TABLE "Episode" ("id" INTEGER NOT NULL PRIMARY KEY, "path" TEXT NOT NULL,
+    "number" INTEGER, "show_id" INTEGER NOT NULL, "state" INTEGER NOT NULL,
+    FOREIGN KEY ("show_id") REFERENCES "Show" ("id"));
+CREATE INDEX "episodemodel_show_id" ON "Episode" ("show_id");
+INSERT INTO "Show" ("title") VALUES ('foo');
+INSERT INTO "Episode" ("path", "number", "show_id", "state") VALUES
+    ('/foo/1.mkv', 1, 1, 1), ('/foo/1.mkv', 1, 1, 3), ('/foo/1.mkv', 1, 1, 3),
+    ('/foo/2.mkv', 2, 1, 1);
+'''
+
+
+def _indexes(database):
+    return {
+        name for name, in
+        database.execute_sql("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+
+
+def test_new_database(tmp_path):
+    EneDatabase(str(tmp_path / 'ene.db'))
+    try:
+        assert schema_version(db) == SCHEMA_VERSION
+        assert {
+            'episodemodel_path', 'episodemodel_state', 'showmodel_anilist_show_id'
+        } <= _indexes(db)
+    finally:
+        db.close()
+
+
+def test_migrate_legacy_database(tmp_path):
+    path = tmp_path / 'ene.db'
+    connection = sqlite3.connect(str(path))
+    connection.executescript(LEGACY_SCHEMA)
+    connection.close()
+
+    EneDatabase(str(path))
+    try:
+        assert schema_version(db) == SCHEMA_VERSION
+        assert list(db.execute_sql('SELECT "id", "path", "state" FROM "Episode"')) == [
+            (2, '/foo/1.mkv', 3), (4, '/foo/2.mkv', 1)
+        ]
+        assert {
+            'episodemodel_path', 'episodemodel_state', 'showmodel_anilist_show_id'
+        } <= _indexes(db)
+        assert db.table_exists('Directory')
+    finally:
+        db.close()
+
+
+def test_check_sqlite_version():
+    check_sqlite_version((3, 24, 0))
+    check_sqlite_version((3, 40, 1))
+    with pytest.raises(DatabaseError, match='3.24.0 or newer is required, found 3.22.0'):
+        check_sqlite_version((3, 22, 0))
+
+
+def test_pragmas(tmp_path):
+    database = EneDatabase(str(tmp_path / 'ene.db'), {'cache_size': -1024})
+    try:
+        assert db.pragma('journal_mode') == 'wal'
+        assert db.pragma('synchronous') == 1
+        assert db.pragma('temp_store') == 2
+        assert db.pragma('cache_size') == -1024
+
+        pragmas = []
+
+        def worker():
+            with database.connection():
+                pragmas.append((db.pragma('synchronous'), db.pragma('cache_size')))
+            pragmas.append(db.is_closed())
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        assert pragmas == [(1, -1024), True]
+
+        with database.connection():
+            pass
+        assert not db.is_closed()
+    finally:
+        database.close()
+    assert db.is_closed()
+
+
+def _saved_states(access):
+    return {
+        episode.path.name: episode.state
+        for show in access.get_all_shows() for episode in show.episodes
+    }
+
+
+def test_write_behind_coalesces(series):
+    access = series._db
+    foo = Show('foo')
+    episode = Episode(Path('/foo/1.mkv'), number=1)
+    foo.add_or_update_episode(episode)
+    queue = WriteBehindQueue(access, interval=60)
+    try:
+        for state in Episode.State:
+            episode.state = state
+            queue.save_episode(episode, foo)
+        assert queue.pending == 1
+        assert not _saved_states(access)
+        assert queue.flush(timeout=5)
+        assert queue.pending == 0
+        assert episode.episode_id is not None
+        assert _saved_states(access) == {'1.mkv': Episode.State.WATCHED}
+    finally:
+        queue.close(timeout=5)
+
+
+def test_write_behind_batches(series):
+    access = series._db
+    foo = Show('foo')
+    queue = WriteBehindQueue(access, interval=60, max_pending=3)
+    try:
+        for number in range(3):
+            queue.save_episode(Episode(Path(f'/foo/{number}.mkv'), number=number), foo)
+        deadline = time.monotonic() + 5
+        while len(_saved_states(access)) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(_saved_states(access)) == 3
+    finally:
+        queue.close(timeout=5)
+
+
+def test_save_episode_on_close(series, library):
+    series.refresh_from_files()
+    show = series.get_show('bar quest')
+    episode = next(iter(show.episodes))
+    episode.state = Episode.State.WATCHED
+    series.save_episode(episode, show)
+    access = series._db
+    series.close_db()
+    access.database.database.connect()
+    assert _saved_states(access)['bar quest 01.avi'] is Episode.State.WATCHED
+
+
+class FailingAccess:
+    """Data access that fails to save the episodes of bad shows"""
+
+    def __init__(self, bad):
+        self.bad = bad
+        self.saved = []
+
+    @contextmanager
+    def connection(self):
+        yield
+
+    def save_changes(self, episodes, shows=()):
+        episodes = list(episodes)
+        if any(show.title in self.bad for _, show in episodes):
+            raise ValueError('cannot save')
+        self.saved.extend(episode.path.name for episode, _ in episodes)
+
+
+@pytest.mark.parametrize('bad, saved', [
+    ({'foo'}, ['2.mkv']),
+    ({'foo', 'bar'}, []),
+])
+def test_write_behind_drops_bad_rows(bad, saved):
+    access = FailingAccess(bad)
+    queue = WriteBehindQueue(access, interval=0.01)
+    try:
+        queue.save_episode(Episode(Path('/foo/1.mkv')), Show('foo'))
+        queue.save_episode(Episode(Path('/bar/2.mkv')), Show('bar'))
+        assert queue.flush(timeout=5)
+        assert access.saved == saved
+        assert queue.pending == 0
+
+        queue.save_episode(Episode(Path('/baz/3.mkv')), Show('baz'))
+        assert queue.flush(timeout=5)
+        assert access.saved == saved + ['3.mkv']
+    finally:
+        assert queue.close(timeout=5)
+
+
+def test_get_all_shows_skips_orphans(series):
+    access = series._db
+    foo = Show('foo')
+    foo.add_or_update_episode(Episode(Path('/foo/1.mkv'), number=1))
+    bar = Show('bar')
+    bar.add_or_update_episode(Episode(Path('/bar/1.mkv'), number=1))
+    access.save_show_list([foo, bar])
+    db.execute_sql('DELETE FROM "Show" WHERE "title" = ?', ('foo',))
+
+    shows = list(access.get_all_shows())
+    assert [show.title for show in shows] == ['bar']
+    assert [episode.path for episode in shows[0].episodes] == [Path('/bar/1.mkv')]
@@ -0,0 +1,167 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+from threading import Event, Thread, Timer
+from time import monotonic, sleep
+
+import pytest
+import responses
+
+import ene.api.anilist
+from ene.api import API, Priority
+from ene.api.anilist import CANCELLED
+from ene.api.ratelimit import RateLimiter, backoff
+from ene.constants import GRAPHQL_URL
+from . import CACHE_HOME, DATA_HOME, rmdir
+
+MOCK_RESPONSE = {'data': {'GenreCollection': ['Action']}}
+
+
+@pytest.fixture()
+def api():
+    rmdir(DATA_HOME, True)
+    DATA_HOME.mkdir(parents=True)
+    (DATA_HOME / 'token').write_text('foo')
+    try:
+        yield API(DATA_HOME, CACHE_HOME)
+    finally:
+        rmdir(DATA_HOME, True)
+        rmdir(CACHE_HOME, True)
+
+
+@pytest.fixture()
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(ene.api.anilist, 'sleep', delays.append)
+    yield delays
+
+
+def test_acquire_consumes_tokens():
+    limiter = RateLimiter(2, 60)
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter.tokens < 1
+
+
+def test_acquire_waits_for_refill():
+    limiter = RateLimiter(10, 0.5)
+    for _ in range(10):
+        limiter.acquire()
+    start = monotonic()
+    limiter.acquire()
+    assert monotonic() - start > 0.02
+
+
+def test_update_headers():
+    limiter = RateLimiter(90, 60)
+    limiter.update({'X-RateLimit-Limit': '60', 'X-RateLimit-Remaining': '5'})
+    assert limiter.limit == 60
+    assert 5 <= limiter.tokens < 6
+    limiter.update({'Retry-After': '30'})
+    assert limiter.tokens == 0
+    assert limiter.blocked_until > monotonic() + 29
+
+
+def test_priority_order():
+    limiter = RateLimiter(1, 0.2)
+    limiter.acquire()
+    order = []
+
+    def _acquire(priority):
+        limiter.acquire(priority)
+        order.append(priority)
+
+    background = Thread(target=_acquire, args=(Priority.BACKGROUND,))
+    background.start()
+    sleep(0.05)
+    interactive = Thread(target=_acquire, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    background.join()
+    interactive.join()
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+
+
+def test_backoff_bounds():
+    for attempt in range(10):
+        assert 0 <= backoff(attempt, 1, 8) <= min(8, 2 ** attempt)
+
+
+@responses.activate
+def test_query_retry_server_error(api, no_sleep):
+    responses.add(responses.POST, GRAPHQL_URL, status=500)
+    responses.add(responses.POST, GRAPHQL_URL, status=502)
+    responses.add(responses.POST, GRAPHQL_URL, json=MOCK_RESPONSE)
+    assert api.query('{GenreCollection}').unwrap() == MOCK_RESPONSE
+    assert len(responses.calls) == 3
+    assert len(no_sleep) == 2
+
+
+@responses.activate
+def test_query_retry_after(api, no_sleep):
+    responses.add(responses.POST, GRAPHQL_URL, status=429, headers={'Retry-After': '0'})
+    responses.add(responses.POST, GRAPHQL_URL, json=MOCK_RESPONSE)
+    assert api.query('{GenreCollection}').unwrap() == MOCK_RESPONSE
+    assert len(responses.calls) == 2
+    assert not no_sleep
+
+
+@responses.activate
+def test_query_retry_exhausted(api, no_sleep):
+    responses.add(responses.POST, GRAPHQL_URL, status=503)
+    api.max_retries = 2
+    assert api.query('{GenreCollection}').unwrap_err()[0] == 503
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_query_no_retry_client_error(api, no_sleep):
+    responses.add(responses.POST, GRAPHQL_URL, status=400)
+    assert api.query('{GenreCollection}').unwrap_err()[0] == 400
+    assert len(responses.calls) == 1
+
+
+def test_acquire_cancelled():
+    limiter = RateLimiter(1, 60)
+    limiter.acquire()
+    cancel = Event()
+    Timer(0.05, cancel.set).start()
+    start = monotonic()
+    assert not limiter.acquire(cancel=cancel)
+    assert monotonic() - start < 5
+    assert not limiter._waiting
+
+
+@responses.activate
+def test_query_cancelled(api):
+    responses.add(responses.POST, GRAPHQL_URL, json=MOCK_RESPONSE)
+    cancel = Event()
+    cancel.set()
+    assert api.query('{GenreCollection}', cancel=cancel).unwrap_err() == CANCELLED
+    assert not responses.calls
+
+
+@responses.activate
+def test_query_cancelled_in_flight(api):
+    cancel = Event()
+
+    def _callback(request):
+        cancel.set()
+        return 200, {}, json.dumps(MOCK_RESPONSE)
+
+    responses.add_callback(responses.POST, GRAPHQL_URL, callback=_callback)
+    assert api.browse_anime(cancel=cancel).unwrap_err() == CANCELLED
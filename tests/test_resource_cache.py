@@ -0,0 +1,202 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import time
+
+import pytest
+import responses
+from requests import HTTPError
+
+from ene.cache import (
+    MANIFEST, STALE_TMP_AGE, TMP_SUFFIX, VERIFY_INTERVAL, VERIFY_STAMP, ResourceCache,
+    resource_cache
+)
+from ene.util import get_resource
+from . import CACHE_HOME, rmdir
+
+IMAGE_URL = 'https://cdn.anilist.co/img/dir/anime/reg/1.jpg'
+IMAGE_KEY = 'img/dir/anime/reg/1.jpg'
+JPEG = b'\xff\xd8\xff\xe0foo\xff\xd9'
+
+
+@pytest.fixture()
+def cache_dir():
+    rmdir(CACHE_HOME, True)
+    try:
+        yield CACHE_HOME
+    finally:
+        rmdir(CACHE_HOME, True)
+
+
+def test_resource_cache_manifest(cache_dir):
+    cache = ResourceCache(cache_dir, 100)
+    cache.put('a/b.jpg', b'foo')
+    manifest = json.loads((cache_dir / MANIFEST).read_text())
+    assert manifest['a/b.jpg']['size'] == 3
+    assert manifest['a/b.jpg']['sha256']
+    reloaded = ResourceCache(cache_dir, 100)
+    assert 'a/b.jpg' in reloaded
+    assert reloaded.size == 3
+
+
+def test_resource_cache_ignores_foreign_files(cache_dir):
+    (cache_dir / 'api').mkdir(parents=True)
+    (cache_dir / 'api' / 'foo').write_bytes(b'x' * 50)
+    cache = ResourceCache(cache_dir, 10)
+    assert len(cache) == 0
+    cache.put('bar', b'baz')
+    assert (cache_dir / 'api' / 'foo').is_file()
+
+
+def test_resource_cache_lru_eviction(cache_dir):
+    cache = ResourceCache(cache_dir, 6)
+    cache.put('a', b'aaa')
+    cache.put('b', b'bbb')
+    assert cache.lookup('a') == cache_dir / 'a'
+    cache.put('c', b'ccc')
+    assert 'b' not in cache
+    assert not (cache_dir / 'b').exists()
+    assert list(cache) == ['a', 'c']
+
+
+def test_resource_cache_manifest_save_debounced(cache_dir):
+    cache = ResourceCache(cache_dir, 100)
+    cache.put('a', b'foo')
+    cache.put('b', b'bar')
+    assert list(json.loads((cache_dir / MANIFEST).read_text())) == ['a']
+    cache.save()
+    assert list(json.loads((cache_dir / MANIFEST).read_text())) == ['a', 'b']
+
+
+@pytest.mark.parametrize('manifest', ['[]', '{"a": {}}', '{"a": 1}'])
+def test_resource_cache_malformed_manifest(cache_dir, manifest):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / 'a').write_bytes(JPEG)
+    (cache_dir / MANIFEST).write_text(manifest)
+    cache = ResourceCache(cache_dir, 100)
+    assert len(cache) == 0
+    assert cache.lookup('a') == cache_dir / 'a'
+    cache.save()
+    assert json.loads((cache_dir / MANIFEST).read_text())['a']['sha256']
+
+
+def test_resource_cache_lookup_adopts_file(cache_dir):
+    cache = ResourceCache(cache_dir, 100)
+    (cache_dir / 'foo').write_bytes(JPEG)
+    assert cache.lookup('foo') == cache_dir / 'foo'
+    assert cache.size == len(JPEG)
+    (cache_dir / 'foo').write_bytes(JPEG[:-1])
+    assert cache.verify() == ['foo']
+    assert cache.lookup('foo') is None
+    assert cache.size == 0
+
+
+@pytest.mark.parametrize('data', [b'bar', JPEG[:-2], b'\x89PNG\r\n\x1a\nfoo'])
+def test_resource_cache_lookup_rejects_truncated(cache_dir, data):
+    cache = ResourceCache(cache_dir, 100)
+    (cache_dir / 'foo').write_bytes(data)
+    assert cache.lookup('foo') is None
+    assert 'foo' not in cache
+    assert not (cache_dir / 'foo').exists()
+
+
+def test_resource_cache_verify(cache_dir):
+    cache = ResourceCache(cache_dir, 100)
+    cache.put('good', b'foo')
+    cache.put('corrupt', b'bar')
+    cache.put('truncated', b'baz')
+    (cache_dir / 'corrupt').write_bytes(b'BAR')
+    (cache_dir / 'truncated').write_bytes(b'b')
+    assert sorted(cache.verify()) == ['corrupt', 'truncated']
+    assert list(cache) == ['good']
+    assert not (cache_dir / 'corrupt').exists()
+    assert list(json.loads((cache_dir / MANIFEST).read_text())) == ['good']
+
+
+def test_resource_cache_maintain_throttles_verify(cache_dir):
+    cache = ResourceCache(cache_dir, 100)
+    cache.put('a', b'foo')
+    (cache_dir / 'a').write_bytes(b'bar')
+    (cache_dir / VERIFY_STAMP).touch()
+    assert cache.maintain() == ([], 0)
+    assert 'a' in cache
+    old = time.time() - VERIFY_INTERVAL
+    os.utime(str(cache_dir / VERIFY_STAMP), (old, old))
+    assert cache.maintain() == (['a'], 0)
+    assert not cache.verify_due
+    cache.put('b', b'baz')
+    (cache_dir / 'b').write_bytes(b'BAZ')
+    assert cache.maintain(verify=True) == (['b'], 0)
+
+
+def test_resource_cache_prune(cache_dir):
+    cache = ResourceCache(cache_dir, 100)
+    cache.put('a', b'a' * 40)
+    cache.put('b', b'b' * 40)
+    stale = cache_dir / f'c.123{TMP_SUFFIX}'
+    fresh = cache_dir / f'd.456{TMP_SUFFIX}'
+    stale.write_bytes(b'x' * 5)
+    fresh.write_bytes(b'x' * 5)
+    old = time.time() - STALE_TMP_AGE - 1
+    os.utime(str(stale), (old, old))
+    cache.max_bytes = 50
+    assert cache.prune() == 45
+    assert list(cache) == ['b']
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_resource_cache_registry(cache_dir):
+    cache = resource_cache(cache_dir)
+    assert resource_cache(cache_dir) is cache
+    resource_cache(cache_dir, 1234)
+    assert cache.max_bytes == 1234
+
+
+@responses.activate
+def test_get_resource_downloads_once(cache_dir):
+    responses.add(responses.GET, IMAGE_URL, b'image')
+    path = get_resource(IMAGE_URL, cache_dir)
+    assert path == cache_dir / IMAGE_KEY
+    assert path.read_bytes() == b'image'
+    assert get_resource(IMAGE_URL, cache_dir) == path
+    assert len(responses.calls) == 1
+    assert IMAGE_KEY in resource_cache(cache_dir)
+
+
+@responses.activate
+def test_get_resource_error(cache_dir):
+    responses.add(responses.GET, IMAGE_URL, b'', status=404)
+    with pytest.raises(HTTPError):
+        get_resource(IMAGE_URL, cache_dir)
+    assert not (cache_dir / IMAGE_KEY).exists()
+
+
+@responses.activate
+def test_get_resource_incomplete(cache_dir):
+    responses.add(
+        responses.GET,
+        IMAGE_URL,
+        b'imag',
+        headers={'Content-Length': '5'},
+        auto_calculate_content_length=False
+    )
+    with pytest.raises(IOError):
+        get_resource(IMAGE_URL, cache_dir)
+    assert not (cache_dir / IMAGE_KEY).exists()
@@ -0,0 +1,75 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import pytest
+
+from ene.search import SearchIndex, normalize
+
+TITLES = [
+    'One Piece',
+    'One-Punch Man',
+    'Sword Art Online',
+    'Re:Zero kara Hajimeru Isekai Seikatsu',
+    'K-On!',
+    'Kimi no Na wa.',
+]
+
+
+@pytest.fixture()
+def index():
+    index = SearchIndex()
+    for i, title in enumerate(TITLES):
+        index.add(i, title)
+    return index
+
+
+def brute_force(query):
+    query = normalize(query)
+    return {i for i, title in enumerate(TITLES) if query in normalize(title)}
+
+
+def test_normalize():
+    assert normalize('  Re:Zero  kara_Hajimeru ') == 're zero kara hajimeru'
+
+
+@pytest.mark.parametrize('query', [
+    'o', 'on', 'one', 'One P', 'one-punch', 'ONLINE', 're zero', 'k on', 'na wa', 'xyz', 'e'
+])
+def test_search_matches_brute_force(index, query):
+    assert index.search(query) == brute_force(query)
+
+
+def test_search_empty(index):
+    assert index.search('') is None
+    assert index.search(' !') is None
+
+
+def test_search_refines_as_you_type(index):
+    for query in ('o', 'on', 'one', 'one ', 'one p', 'one pu', 'one p', 'on'):
+        assert index.search(query) == brute_force(query)
+
+
+def test_add_and_remove(index):
+    assert index.search('one') == {0, 1}
+    index.add(6, 'One Outs')
+    assert index.search('one') == {0, 1, 6}
+    index.remove(0)
+    assert index.search('one') == {1, 6}
+    index.add(1, 'Mob Psycho 100')
+    assert index.search('one') == {6}
+    assert len(index) == 6
+    assert 0 not in index
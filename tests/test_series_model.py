@@ -0,0 +1,93 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from PySide2.QtCore import QModelIndex, Qt
+
+from ene.ui.widgets.series_browser import EPISODE_COUNT_ROLE, SeriesFilterModel, SeriesModel
+
+
+class MockSeries:
+    def __init__(self, shows):
+        self.shows = shows
+
+    def get_shows_overview(self):
+        yield from self.shows.items()
+
+
+def _titles(model):
+    return [model.index(row, 0).data() for row in range(model.rowCount())]
+
+
+def _record(signal):
+    calls = []
+    signal.connect(lambda *args: calls.append(args))
+    return calls
+
+
+def test_refresh_sorts_shows():
+    model = SeriesModel(MockSeries({'b': 2, 'a': 1, 'c': 3}))
+    model.refresh()
+    assert _titles(model) == ['a', 'b', 'c']
+    assert model.index(1).data(EPISODE_COUNT_ROLE) == 2
+    assert model.index(1).data(Qt.ToolTipRole) == 'b'
+    assert model.rowCount(model.index(0)) == 0
+
+
+def test_refresh_is_incremental():
+    series = MockSeries({'b': 2, 'd': 4})
+    model = SeriesModel(series)
+    model.refresh()
+    inserted = _record(model.rowsInserted)
+    removed = _record(model.rowsRemoved)
+    changed = _record(model.dataChanged)
+    reset = _record(model.modelReset)
+    series.shows = {'a': 1, 'b': 5, 'c': 3}
+    model.refresh()
+    assert _titles(model) == ['a', 'b', 'c']
+    assert [(first, last) for _, first, last in inserted] == [(0, 0), (2, 2)]
+    assert [(first, last) for _, first, last in removed] == [(1, 1)]
+    assert len(changed) == 1
+    assert changed[0][0].row() == 1
+    assert model.index(1).data(EPISODE_COUNT_ROLE) == 5
+    assert not reset
+
+
+def test_remove():
+    model = SeriesModel(MockSeries({'a': 1, 'b': 2}))
+    model.refresh()
+    model.remove('a')
+    model.remove('missing')
+    assert _titles(model) == ['b']
+    assert model.row('b') == 0
+    assert model.row('a') is None
+    assert model.data(QModelIndex()) is None
+
+
+def test_filter_model():
+    series = MockSeries({'One Piece': 1, 'One-Punch Man': 2, 'Bleach': 3})
+    model = SeriesModel(series)
+    model.refresh()
+    proxy = SeriesFilterModel(model)
+    assert proxy.rowCount() == 3
+    proxy.set_query('one p')
+    assert _titles(proxy) == ['One Piece', 'One-Punch Man']
+    series.shows['One Outs'] = 4
+    series.shows['Opening One Piece'] = 5
+    model.refresh()
+    assert _titles(proxy) == ['One Piece', 'One-Punch Man', 'Opening One Piece']
+    proxy.set_query('')
+    assert proxy.rowCount() == 5
@@ -0,0 +1,110 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+from threading import Event
+
+import pytest
+import responses
+
+from ene.api import API
+from ene.constants import GRAPHQL_URL
+from . import CACHE_HOME, DATA_HOME, rmdir
+
+PAGES = 3
+PER_PAGE = 4
+
+
+@pytest.fixture()
+def api():
+    rmdir(DATA_HOME, True)
+    DATA_HOME.mkdir(parents=True)
+    (DATA_HOME / 'token').write_text('foo')
+    try:
+        yield API(DATA_HOME, CACHE_HOME, {'browse': 0})
+    finally:
+        rmdir(DATA_HOME, True)
+        rmdir(CACHE_HOME, True)
+
+
+def mock_browse(fail_page=None, gate=None):
+    def _callback(request):
+        page = json.loads(request.body)['variables']['page']
+        if gate and page > 1:
+            gate.wait(5)
+        if page == fail_page:
+            return 400, {}, json.dumps({'errors': ['foo']})
+        body = {'data': {'Page': {
+            'pageInfo': {'hasNextPage': page < PAGES},
+            'media': [{'id': (page - 1) * PER_PAGE + i} for i in range(PER_PAGE)]
+        }}}
+        return 200, {}, json.dumps(body)
+
+    responses.add_callback(responses.POST, GRAPHQL_URL, callback=_callback)
+
+
+@responses.activate
+def test_stream_all(api):
+    mock_browse()
+    stream = api.iter_anime()
+    assert [media.id for media in stream] == list(range(PAGES * PER_PAGE))
+    assert stream.done
+    assert stream.error is None
+    assert len(responses.calls) == PAGES
+
+
+@responses.activate
+def test_stream_pages(api):
+    mock_browse()
+    stream = api.iter_anime()
+    assert [media.id for media in stream.next_page()] == list(range(PER_PAGE))
+    assert not stream.done
+    stream.next_page()
+    stream.next_page()
+    assert stream.done
+    assert stream.next_page() == []
+
+
+@responses.activate
+def test_stream_prefetch(api):
+    mock_browse()
+    stream = api.iter_anime()
+    stream.next_page()
+    stream._next.result(5)
+    assert len(responses.calls) == 2
+    stream.close()
+
+
+@responses.activate
+def test_stream_error(api):
+    mock_browse(fail_page=2)
+    stream = api.iter_anime()
+    assert len(list(stream)) == PER_PAGE
+    assert stream.error[0] == 400
+
+
+@responses.activate
+def test_stream_close(api):
+    gate = Event()
+    mock_browse(gate=gate)
+    stream = api.iter_anime()
+    stream.next_page()
+    stream.close()
+    gate.set()
+    assert stream.done
+    assert stream.next_page() == []
+    assert list(stream) == []
@@ -0,0 +1,189 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import re
+from datetime import date
+from pathlib import Path
+
+import pytest
+import responses
+
+from ene.api import API, MediaListStatus
+from ene.api.types_ import FuzzyDate
+from ene.api.sync import MediaListUpdateQueue
+from ene.constants import GRAPHQL_URL
+from . import CACHE_HOME, DATA_HOME, rmdir
+
+SCHEMA = Path(__file__).parents[1] / 'tools' / 'schema.graphqls'
+
+
+@pytest.fixture()
+def api():
+    rmdir(DATA_HOME, True)
+    DATA_HOME.mkdir(parents=True)
+    (DATA_HOME / 'token').write_text('foo')
+    try:
+        yield API(DATA_HOME, CACHE_HOME)
+    finally:
+        rmdir(DATA_HOME, True)
+        rmdir(CACHE_HOME, True)
+
+
+def mock_mutation(fail=()):
+    def _callback(request):
+        variables = json.loads(request.body)['variables']
+        data = {}
+        i = 0
+        while f'mediaId{i}' in variables:
+            media_id = variables[f'mediaId{i}']
+            data[f'e{i}'] = None if media_id in fail else {
+                'mediaId': media_id,
+                'progress': variables.get(f'progress{i}'),
+                'status': variables.get(f'status{i}'),
+            }
+            i += 1
+        return 200, {}, json.dumps({'data': data})
+
+    responses.add_callback(responses.POST, GRAPHQL_URL, callback=_callback)
+
+
+@responses.activate
+def test_update_media_list_entries(api):
+    mock_mutation(fail=(3,))
+    results = api.update_media_list_entries({
+        1: {'progress': 2},
+        2: {'status': MediaListStatus.COMPLETED},
+        3: {'progress': 1},
+    })
+    assert len(responses.calls) == 1
+    assert 'mutation' in json.loads(responses.calls[0].request.body)['query']
+    assert results[1].unwrap()['progress'] == 2
+    assert results[2].unwrap()['status'] == 'COMPLETED'
+    assert results[3].unwrap_err()[0] == 404
+
+
+def save_media_list_entry_types():
+    schema = SCHEMA.read_text()
+    start = schema.index('SaveMediaListEntry(')
+    arguments = schema[start:schema.index('): MediaList', start)]
+    return dict(re.findall(r'^\s*(\w+): ([\w\[\]!]+)$', arguments, re.MULTILINE))
+
+
+@responses.activate
+@pytest.mark.parametrize('batch', [False, True])
+def test_mutation_variable_types(api, batch):
+    responses.add(responses.POST, GRAPHQL_URL, json={'data': {}})
+    entry = {
+        'status': MediaListStatus.CURRENT,
+        'score': 8.5,
+        'progress': 3,
+        'repeat': 1,
+        'private': True,
+        'notes': 'foo',
+        'custom_lists': {'bar': True, 'baz': False},
+        'started_at': FuzzyDate.from_date(date(2020, 1, 2)),
+        'completed_at': FuzzyDate.from_date(date(2020, 3, 4)),
+    }
+    if batch:
+        api.update_media_list_entries({1: entry})
+    else:
+        api.update_media_list_entry(1, **entry)
+    body = json.loads(responses.calls[0].request.body)
+    declared = dict(re.findall(r'\$([a-zA-Z]+)\d*: ([\w\[\]!]+)', body['query']))
+    schema = save_media_list_entry_types()
+    assert len(declared) == 10
+    assert declared == {name: schema[name] for name in declared}
+    assert body['variables'][f'customLists{0 if batch else ""}'] == ['bar']
+
+
+@responses.activate
+def test_queue_coalesce(api):
+    mock_mutation()
+    queue = MediaListUpdateQueue(api, flush_interval=60)
+    futures = [queue.update(1, progress=i) for i in range(1, 13)]
+    queue.update(1, status=MediaListStatus.CURRENT)
+    other = queue.update(2, progress=1)
+    assert len(queue) == 2
+    results = queue.flush()
+    queue.close()
+    assert len(responses.calls) == 1
+    assert results[1].unwrap()['progress'] == 12
+    assert results[1].unwrap()['status'] == 'CURRENT'
+    assert all(future.result(0).unwrap()['progress'] == 12 for future in futures)
+    assert other.result(0).unwrap()['progress'] == 1
+
+
+@responses.activate
+def test_queue_flush_on_interval(api):
+    mock_mutation()
+    queue = MediaListUpdateQueue(api, flush_interval=0.05)
+    future = queue.update(1, progress=3)
+    assert future.result(5).unwrap()['progress'] == 3
+    queue.close()
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_queue_flush_on_size(api):
+    mock_mutation()
+    queue = MediaListUpdateQueue(api, flush_interval=60, max_pending=3)
+    futures = [queue.update(i, progress=i) for i in range(3)]
+    assert [future.result(5).unwrap()['progress'] for future in futures] == [0, 1, 2]
+    queue.close()
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_queue_close_flushes(api):
+    mock_mutation()
+    queue = MediaListUpdateQueue(api, flush_interval=60)
+    future = queue.update(1, progress=3)
+    queue.close()
+    assert future.result(0).unwrap()['progress'] == 3
+    with pytest.raises(RuntimeError):
+        queue.update(1, progress=4)
+
+
+def test_queue_unknown_field(api):
+    queue = MediaListUpdateQueue(api, flush_interval=60)
+    with pytest.raises(TypeError):
+        queue.update(1, progres=3)
+    assert not len(queue)
+    queue.close()
+
+
+@responses.activate
+def test_queue_survives_errors(api, monkeypatch):
+    mock_mutation()
+    queue = MediaListUpdateQueue(api, flush_interval=0.05)
+    update = API.update_media_list_entries
+    calls = []
+
+    def broken_once(self, entries, *args, **kwargs):
+        calls.append(entries)
+        if len(calls) == 1:
+            raise ValueError('broken')
+        return update(self, entries, *args, **kwargs)
+
+    monkeypatch.setattr(API, 'update_media_list_entries', broken_once)
+    failed = queue.update(1, progress=3)
+    with pytest.raises(ValueError):
+        failed.result(5)
+    future = queue.update(1, progress=4)
+    assert future.result(5).unwrap()['progress'] == 4
+    queue.close()
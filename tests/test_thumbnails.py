@@ -0,0 +1,90 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from PySide2.QtCore import QBuffer, QByteArray, QIODevice
+from PySide2.QtGui import QImage, QPixmap
+from PySide2.QtWidgets import QApplication
+import pytest
+import responses
+
+from ene.downloader import ImageDownloader
+from ene.ui.thumbnails import ThumbnailCache
+from . import CACHE_HOME, rmdir
+
+IMAGE_URL = 'https://s4.anilist.co/file/anilistcdn/media/anime/cover/large/1.png'
+SIZE = (23, 31)
+
+
+def _png(width, height):
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(0)
+    array = QByteArray()
+    buffer = QBuffer(array)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return bytes(array.data())
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    yield QApplication.instance() or QApplication([])
+
+
+@pytest.fixture()
+def thumbnails(qapp):
+    rmdir(CACHE_HOME, True)
+    downloader = ImageDownloader(CACHE_HOME)
+    try:
+        yield ThumbnailCache(downloader, CACHE_HOME)
+    finally:
+        downloader.close()
+        rmdir(CACHE_HOME, True)
+
+
+@responses.activate
+def test_load_scales_and_stores(thumbnails):
+    responses.add(responses.GET, IMAGE_URL, _png(100, 200))
+    image = thumbnails.load(1, IMAGE_URL, SIZE).result(5)
+    assert (image.width(), image.height()) == SIZE
+    assert thumbnails.key(1, SIZE) in thumbnails.disk
+    fresh = ThumbnailCache(thumbnails.downloader, CACHE_HOME)
+    cached = fresh.load(1, IMAGE_URL, SIZE).result(5)
+    assert (cached.width(), cached.height()) == SIZE
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_load_corrupt_thumbnail(thumbnails):
+    responses.add(responses.GET, IMAGE_URL, _png(100, 200))
+    thumbnails.disk.put(thumbnails.key(1, SIZE), b'garbage')
+    image = thumbnails.load(1, IMAGE_URL, SIZE).result(5)
+    assert (image.width(), image.height()) == SIZE
+
+
+def test_memory_lru(thumbnails):
+    image = QImage(10, 10, QImage.Format_RGB32)
+    assert thumbnails.get(1, SIZE) is None
+    pixmap = thumbnails.insert(1, SIZE, image)
+    assert isinstance(pixmap, QPixmap)
+    per_pixmap = thumbnails.size
+    thumbnails.max_bytes = per_pixmap * 2
+    thumbnails.insert(2, SIZE, image)
+    assert thumbnails.get(1, SIZE) is not None
+    thumbnails.insert(3, SIZE, image)
+    assert thumbnails.get(2, SIZE) is None
+    assert thumbnails.get(1, SIZE) is not None
+    assert thumbnails.size == per_pixmap * 2
@@ -0,0 +1,81 @@
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+import pytest
+from PySide2.QtWidgets import QApplication
+
+from ene.ui.watcher import LibraryWatcher
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    yield QApplication.instance() or QApplication([])
+
+
+def wait_for(qapp, predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture()
+def watcher(qapp, tmp_path):
+    (tmp_path / 'foo' / 'season 1').mkdir(parents=True)
+    (tmp_path / 'bar').mkdir()
+    watcher = LibraryWatcher([tmp_path], debounce=50, poll_interval=0)
+    watcher.set_directories(
+        [tmp_path / 'foo', tmp_path / 'foo' / 'season 1', tmp_path / 'bar']
+    )
+    yield watcher
+    watcher.stop()
+
+
+def test_set_directories(watcher, tmp_path):
+    assert sorted(watcher.directories) == [
+        tmp_path, tmp_path / 'bar', tmp_path / 'foo', tmp_path / 'foo' / 'season 1'
+    ]
+    watcher.set_directories([tmp_path / 'bar'])
+    assert sorted(watcher.directories) == [tmp_path, tmp_path / 'bar']
+    assert not watcher.polling
+
+
+def test_changes_debounced(qapp, watcher, tmp_path):
+    reports = []
+    watcher.changed.connect(reports.append)
+    for i in range(3):
+        (tmp_path / 'foo' / 'season 1' / f'foo {i}.mkv').touch()
+    (tmp_path / 'foo' / 'foo 1.mkv').touch()
+    (tmp_path / 'bar' / 'bar 1.mkv').touch()
+    assert wait_for(qapp, lambda: reports)
+    qapp.processEvents()
+    assert reports == [[tmp_path / 'bar', tmp_path / 'foo']]
+
+
+def test_poll_missing_root(qapp, tmp_path):
+    watcher = LibraryWatcher([tmp_path / 'missing'], debounce=0, poll_interval=300)
+    watcher.set_directories([])
+    assert watcher.polling
+    reports = []
+    watcher.changed.connect(reports.append)
+    watcher.poll()
+    assert wait_for(qapp, lambda: reports)
+    assert reports == [[tmp_path / 'missing']]
+    watcher.stop()
+    assert not watcher.polling
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#  ENE, Automatically track and sync anime watching progress
+#  Copyright (C) 2018-2020 Peijun Ma, Justin Sedge
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark file name parsing against the previous re.sub chain"""
+
+import random
+import re
+import sys
+from pathlib import Path
+from timeit import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ene.entities import Episode  # noqa: E402
+from ene.files import clear_parse_cache, parse_filename  # noqa: E402
+
+
+def legacy_clean_title(title):
+    title = re.sub(r'[_,]', ' ', title)
+    title = re.sub(r'\[[^]]*\]', '', title)
+    title = re.sub(r'\([^O)]*\)', '', title)
+    title = re.sub(r'[sS]0?1', '', title)
+    title = re.sub(r'^[0-9]+\.', '', title)
+    title = re.sub(r'[eE][pP]?[0-9]+.*', '', title)
+    title = re.sub(r'-?\s+[0-9v]*\s*$', '', title)
+    title = re.sub(r'-\s(Episode)?\s?([0-9v])+.*', '', title)
+    title = re.sub(r'[sS]0?([2-9])', r'Season \1', title)
+    return title.strip()
+
+
+def legacy_parse(name):
+    title = legacy_clean_title(Path(name).stem)
+    episode = Episode(Path(name))
+    episode.parse_episode_number(title)
+    return title, episode.number
+
+
+def corpus(shows=200, episodes=24, seed=0):
+    rand = random.Random(seed)
+    words = ['isekai', 'foo', 'bar', 'quest', 'adventures', 'of', 'baz', 'no', 'kimi', 'sora']
+    formats = [
+        '[{group}] {title} - {ep:02}{version} [{res}p].mkv',
+        '[{group}] {title} S{season:02}E{ep:02} ({res}p).mkv',
+        '{title} ep{ep}.mp4',
+        '{title_} - {ep:02} - Episode Name.avi',
+        '{ep:02}. {title}.m4v',
+        '{title} Season {season} - {ep:02} [{group}][{res}p].mkv',
+    ]
+    names = []
+    for _ in range(shows):
+        title = ' '.join(rand.sample(words, rand.randint(1, 4))).title()
+        pattern = rand.choice(formats)
+        group = rand.choice(['HorribleSubs', 'Erai-raws', 'SubsPlease'])
+        season = rand.randint(1, 4)
+        res = rand.choice([480, 720, 1080])
+        for ep in range(1, episodes + 1):
+            names.append(pattern.format(
+                group=group, title=title, title_=title.replace(' ', '_'), season=season,
+                ep=ep, version=rand.choice(['', '', 'v2']), res=res,
+            ))
+    return names
+
+
+def main():
+    names = corpus()
+    mismatched = [
+        name for name in names
+        if legacy_parse(name) != (parse_filename(name).title, parse_filename(name).episode)
+    ]
+    print(f'{len(names)} file names, {len(mismatched)} parsed differently')
+    for name in mismatched[:10]:
+        print(f'  {name!r}: {legacy_parse(name)} != {parse_filename(name)}')
+
+    def cold():
+        clear_parse_cache()
+        for name in names:
+            parse_filename(name)
+
+    def warm():
+        for name in names:
+            parse_filename(name)
+
+    runs = 5
+    legacy = timeit(lambda: [legacy_parse(name) for name in names], number=runs) / runs
+    first = timeit(cold, number=runs) / runs
+    cached = timeit(warm, number=runs) / runs
+    print(f'legacy re.sub chain: {legacy * 1000:8.2f} ms')
+    print(f'parse_filename:      {first * 1000:8.2f} ms ({legacy / first:.1f}x)')
+    print(f'parse_filename rescan (memoized): {cached * 1000:8.2f} ms ({legacy / cached:.1f}x)')
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())